@@ -0,0 +1,179 @@
+"""
+Pluggable execution backend for Gemini image-analysis prompts.
+
+The analysis calls (age detection in build_catalogue, garment inventory in
+extract_all_garments, model description in extract_model_poses) are
+independent, text-only and not urgent. Each is described as an
+AnalysisRequest - cache key, model, image, prompt, config and a parser for
+the response text - and then:
+
+- interactive (default): every analysis runs as its own request when the
+  pipeline reaches it, through the analysis cache;
+- batch: before the pipeline starts, all uncached analyses of a stage are
+  sent as one Gemini Batch API job and the parsed results are written into
+  the analysis cache. The pipeline then runs unchanged and finds them there
+  (anything the job couldn't answer falls back to an interactive call).
+
+Select with GEMINI_ANALYSIS_BACKEND=batch (or interactive).
+
+Usage:
+    from analysis_backend import AnalysisRequest, analyze, get_analysis_backend
+
+    # no-op for the interactive backend (the generator isn't consumed)
+    get_analysis_backend().prefetch((build_request(p) for p in images), label="garments")
+    for path in images:
+        result = analyze(build_request(path))
+"""
+
+import os
+import json
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from google.genai import types
+
+import batch_jobs
+from batch_jobs import BATCH_MIN_TTL
+from config import get_cache_dir
+from gemini_client import get_pool
+from analysis_cache import get_analysis_cache
+from file_registry import get_file_registry, INLINE_MAX_BYTES
+from image_source import ImageSource
+
+
+@dataclass
+class AnalysisRequest:
+    """One cacheable image-analysis prompt."""
+    key: str                      # analysis-cache key
+    model: str
+    source: ImageSource
+    prompt: str
+    config: Optional[types.GenerateContentConfig]
+    parse: Callable[[str], Any]   # response text -> value to cache
+    name: str = ""                # source file name, for logs and cache meta
+
+    def contents(self, image_part: types.Part) -> List[types.Content]:
+        return [types.Content(role="user", parts=[image_part, types.Part.from_text(text=self.prompt)])]
+
+
+def run_interactive(request: AnalysisRequest):
+    """Send *request* as a single generate_content call and parse the reply."""
+    response = get_file_registry().call(request.source, lambda image_part: get_pool().generate_content(
+        model=request.model,
+        contents=request.contents(image_part),
+        config=request.config,
+    ))
+    return request.parse(response.text)
+
+
+def analyze(request: AnalysisRequest):
+    """Cached result of *request*, computing it interactively on a miss."""
+    return get_analysis_cache().get_or_compute(
+        request.key, lambda: run_interactive(request), meta={"source": request.name}
+    )
+
+
+class InteractiveBackend:
+    """Analyses run one by one as the pipeline reaches them."""
+
+    name = "interactive"
+
+    def prefetch(self, requests: Iterable[AnalysisRequest], label: str = "analysis") -> int:
+        return 0
+
+
+class BatchBackend:
+    """Uncached analyses of a stage run as one Batch API job per model."""
+
+    name = "batch"
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = state_dir
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    def prefetch(self, requests: Iterable[AnalysisRequest], label: str = "analysis") -> int:
+        """Fill the analysis cache for *requests*; returns how many were cached."""
+        cache = get_analysis_cache()
+        if cache.offline:
+            return 0
+        pending = {}
+        for request in requests:
+            if request.key not in pending and cache.get(request.key) is None:
+                pending[request.key] = request
+        if not pending:
+            return 0
+
+        by_model: Dict[str, List[AnalysisRequest]] = {}
+        for request in pending.values():
+            by_model.setdefault(request.model, []).append(request)
+        return sum(self._run_job(model, reqs, label) for model, reqs in by_model.items())
+
+    def _image_part(self, source: ImageSource) -> types.Part:
+        if source.size < INLINE_MAX_BYTES:
+            return source.part()
+        return get_file_registry().upload(source, min_ttl=BATCH_MIN_TTL).part()
+
+    def _run_job(self, model: str, requests: List[AnalysisRequest], label: str) -> int:
+        # The job is identified by its request set, so a rerun after a crash
+        # picks up the job it already submitted
+        job_id = hashlib.sha256("\n".join(sorted(r.key for r in requests)).encode()).hexdigest()[:16]
+        state_path = self.state_dir / f"{label}-{job_id}.json"
+        jsonl_path = self.state_dir / f"{label}-{job_id}.requests.jsonl"
+        results_path = self.state_dir / f"{label}-{job_id}.results.jsonl"
+        state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+        pool = get_pool()
+
+        print(f"\n[batch] {label}: {len(requests)} analyses with {model}")
+        if state.get("job_name"):
+            print(f"  Resuming job: {state['job_name']}")
+        else:
+            parts = pool.map(self._image_part, [r.source for r in requests])
+            with open(jsonl_path, "w", encoding="utf-8") as f:
+                for request, part in zip(requests, parts):
+                    f.write(json.dumps(batch_jobs.request_line(request.key, request.contents(part), request.config)) + "\n")
+            state["job_name"] = batch_jobs.submit_jsonl(pool.client, model, jsonl_path, f"{label}_analysis")
+            state_path.write_text(json.dumps(state), encoding="utf-8")
+
+        job = batch_jobs.wait_for_job(pool.client, state["job_name"])
+        if job is None:
+            state_path.unlink(missing_ok=True)  # resubmit next time
+            print("  Falling back to interactive analysis")
+            return 0
+        batch_jobs.download_results(pool.client, job, results_path)
+
+        by_key = {r.key: r for r in requests}
+        cache = get_analysis_cache()
+        cached = 0
+        failed = 0
+        for key, response, error in batch_jobs.iter_results(results_path):
+            request = by_key.get(key)
+            if request is None:
+                continue
+            try:
+                if error:
+                    raise RuntimeError(error)
+                value = request.parse(response.text)
+            except Exception as e:
+                failed += 1
+                print(f"  ⚠ {request.name}: {e}")
+                continue
+            if value:
+                cache.put(key, value, meta={"source": request.name, "batch": state["job_name"]})
+                cached += 1
+
+        for path in (state_path, jsonl_path, results_path):
+            path.unlink(missing_ok=True)
+        print(f"  ✓ {cached} cached, {failed} failed (retried interactively)")
+        return cached
+
+
+def get_analysis_backend(name: str = None):
+    """Backend named by *name* or GEMINI_ANALYSIS_BACKEND (default interactive)."""
+    name = (name or os.getenv("GEMINI_ANALYSIS_BACKEND") or "interactive").lower()
+    if name == "batch":
+        return BatchBackend(get_cache_dir() / "analysis-batches")
+    if name != "interactive":
+        print(f"⚠️ Unknown analysis backend '{name}', using interactive")
+    return InteractiveBackend()
@@ -0,0 +1,229 @@
+"""
+Content-addressed on-disk cache for Gemini image-analysis responses.
+
+Entries are keyed by sha256(image bytes) + model + sha256(prompt) + the
+generation config, so an unchanged image analysed with the same prompt is
+never sent to Gemini twice - renaming or moving the file doesn't matter.
+
+- Size/age eviction: least recently used entries go first once the cache
+  passes ANALYSIS_CACHE_MAX_MB (lookups refresh a file's mtime); entries
+  created more than ANALYSIS_CACHE_MAX_AGE_DAYS ago are dropped regardless.
+- Single-flight: concurrent requests for the same key share one API call.
+- Offline mode (GEMINI_CACHE_OFFLINE=1): serve from cache only and raise
+  OfflineCacheMiss instead of calling the API.
+
+Usage:
+    from analysis_cache import get_analysis_cache
+
+    cache = get_analysis_cache()
+    key = cache.key(image_bytes, MODEL, prompt, config)
+    result = cache.get_or_compute(key, lambda: call_gemini_and_parse())
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Callable, Optional
+
+from config import get_cache_dir
+
+MAX_CACHE_MB = int(os.getenv("ANALYSIS_CACHE_MAX_MB", "512"))
+MAX_AGE_DAYS = int(os.getenv("ANALYSIS_CACHE_MAX_AGE_DAYS", "180"))
+EVICT_EVERY = 200  # puts between eviction sweeps
+
+# Bump when the cached value format changes to invalidate old entries
+CACHE_VERSION = 1
+
+
+class OfflineCacheMiss(LookupError):
+    """Raised in offline mode when an analysis is not in the cache."""
+
+
+def sha256_hex(data) -> str:
+    """Hex sha256 of bytes, str or a buffer."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_fingerprint(config) -> str:
+    """Stable JSON for a GenerateContentConfig (or dict / None)."""
+    if config is None:
+        return "{}"
+    if hasattr(config, "model_dump"):
+        config = config.model_dump(mode="json", exclude_none=True)
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class AnalysisCache:
+    """JSON entries stored under <root>/<key[:2]>/<key>.json."""
+
+    def __init__(self, root, max_bytes: int = MAX_CACHE_MB * 1024 * 1024,
+                 max_age_days: int = MAX_AGE_DAYS, offline: bool = False):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._puts = 0
+
+    # -----------------------------------------------------------------------
+    # Keys
+    # -----------------------------------------------------------------------
+
+    def key(self, image, model: str, prompt: str, config=None) -> str:
+        """Build a cache key. *image* is raw bytes or an existing sha256 hex digest."""
+        image_hash = image if isinstance(image, str) else sha256_hex(image)
+        parts = [str(CACHE_VERSION), image_hash, model, sha256_hex(prompt), config_fingerprint(config)]
+        return sha256_hex("\n".join(parts))
+
+    def _path(self, key: str):
+        return self.root / key[:2] / f"{key}.json"
+
+    # -----------------------------------------------------------------------
+    # Get / put
+    # -----------------------------------------------------------------------
+
+    def get(self, key: str):
+        """Return the cached value for *key*, or None."""
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry.get("created", 0)):
+            return None
+        try:
+            os.utime(path)  # mark as recently used for LRU eviction (not for expiry)
+        except OSError:
+            pass
+        return entry.get("value")
+
+    def put(self, key: str, value, meta: Optional[dict] = None):
+        """Store *value* (JSON-serialisable) under *key*."""
+        if self.offline:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"created": time.time(), "value": value}
+        if meta:
+            entry["meta"] = meta
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(entry), encoding="utf-8")
+        os.replace(tmp, path)
+        with self._lock:
+            self._puts += 1
+            sweep = self._puts % EVICT_EVERY == 0
+        if sweep:
+            self.evict()
+
+    def get_or_compute(self, key: str, compute: Callable, meta: Optional[dict] = None):
+        """Return the cached value or run *compute* once for all concurrent callers.
+
+        Falsy results (failed analyses) are returned but not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        if self.offline:
+            raise OfflineCacheMiss(key)
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"event": threading.Event(), "value": None, "error": None}
+                self._in_flight[key] = flight
+                self.misses += 1
+        if not leader:
+            flight["event"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["value"]
+
+        try:
+            value = compute()
+            if value:
+                self.put(key, value, meta)
+            flight["value"] = value
+            return value
+        except BaseException as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight["event"].set()
+
+    # -----------------------------------------------------------------------
+    # Eviction
+    # -----------------------------------------------------------------------
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.max_age) and time.time() - created > self.max_age
+
+    @staticmethod
+    def _created(path) -> float:
+        """An entry's "created" time (0 if it can't be read)."""
+        try:
+            return json.loads(path.read_text(encoding="utf-8")).get("created", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes.
+
+        Expiry goes by each entry's "created" time, like get(); the mtime
+        (refreshed on every hit) only orders entries for the size cap.
+        """
+        entries = []
+        total = 0
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            # mtime is never older than "created", so a stale mtime means expired
+            # without reading the entry
+            if self.max_age and (self._expired(stat.st_mtime) or self._expired(self._created(path))):
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> str:
+        return f"analysis cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+
+# ---------------------------------------------------------------------------
+# Process-wide cache
+# ---------------------------------------------------------------------------
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Return the shared AnalysisCache under the scripts cache dir."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            offline = os.getenv("GEMINI_CACHE_OFFLINE", "").lower() in ("1", "true", "yes")
+            _cache = AnalysisCache(get_cache_dir() / "analysis", offline=offline)
+            _cache.evict()
+        return _cache
@@ -7,16 +7,15 @@ import os
 import ssl
 import certifi
 from pathlib import Path
-from google import genai
 from google.genai import types
-from config import get_google_api_key
+from gemini_client import get_pool
+from image_source import open_image
 
 # Workaround for SSL certificate issues
 os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 
-API_KEY = get_google_api_key()
-client = genai.Client(api_key=API_KEY)
+pool = get_pool()
 MODEL_NAME = "gemini-1.5-flash"
 
 PROJECT_ROOT = Path(__file__).parents[1]
@@ -37,12 +36,9 @@ def analyze_image(rel_path):
 
     print(f"\nAnalyzing {rel_path}...")
     try:
-        image_part = types.Part.from_bytes(
-            data=path.read_bytes(),
-            mime_type="image/jpeg" if path.suffix in ['.jpg', '.jpeg'] else "image/png"
-        )
+        image_part = open_image(path).part()
         
-        response = client.models.generate_content(
+        response = pool.generate_content(
             model=MODEL_NAME,
             contents=[
                 types.Content(
@@ -0,0 +1,306 @@
+"""
+Content-addressed store for generated garment and pose images.
+
+Every image-generation call is identified by an artifact key:
+    sha256(source image hash, garment/pose descriptor, prompt hash, model, temperature)
+Generation paths check the store before calling the image model, so a
+rerun never regenerates an image it already has.
+
+Blobs live once under <cache>/artifacts/objects/<aa>/<sha256>.<ext>; the
+files in extracted-products/ and model-poses/ are views (hard links, or
+copies where links aren't possible) recorded in a small SQLite index.
+Garbage collection drops artifacts that no surviving view - or, with
+--catalogue, no catalogue product - references.
+
+Usage:
+    python artifact_store.py stats
+    python artifact_store.py gc [--catalogue product_catalogue.json] [--dry-run]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, Optional
+
+from config import get_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    model TEXT,
+    created REAL NOT NULL,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS views (
+    path TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS views_key ON views(key);
+"""
+
+
+def _sha256(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sniff_ext(data: bytes) -> str:
+    """File extension for generated image bytes."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".bin"
+
+
+class ArtifactStore:
+    """Generated-image blobs plus a key -> blob / view -> key index."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects = root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(root / "index.sqlite3"), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self.hits = 0
+        self.generated = 0
+
+    # -----------------------------------------------------------------------
+    # Keys and blobs
+    # -----------------------------------------------------------------------
+
+    @staticmethod
+    def key(source, descriptor, prompt: str, model: str, temperature=None) -> str:
+        """Artifact key. *source* is the source image bytes or its sha256 hex."""
+        source_hash = source if isinstance(source, str) else _sha256(source)
+        parts = [
+            source_hash,
+            json.dumps(descriptor, sort_keys=True, default=str),
+            _sha256(prompt),
+            model,
+            repr(temperature),
+        ]
+        return _sha256("\n".join(parts))
+
+    def _blob_path(self, digest: str, ext: str) -> Path:
+        return self.objects / digest[:2] / f"{digest}{ext}"
+
+    def _lookup(self, key: str):
+        with self._lock:
+            return self._db.execute("SELECT digest, ext FROM artifacts WHERE key = ?", (key,)).fetchone()
+
+    def path(self, key: str) -> Optional[Path]:
+        """Blob path for *key*, or None if it isn't stored."""
+        row = self._lookup(key)
+        if not row:
+            return None
+        blob = self._blob_path(*row)
+        return blob if blob.exists() else None
+
+    def has(self, key: str) -> bool:
+        return self.path(key) is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        blob = self.path(key)
+        return blob.read_bytes() if blob else None
+
+    def put(self, key: str, data: bytes, model: Optional[str] = None, meta: Optional[dict] = None) -> Path:
+        """Store *data* under *key* (deduplicated by content) and return the blob path."""
+        digest = _sha256(data)
+        ext = _sniff_ext(data)
+        blob = self._blob_path(digest, ext)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, blob)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO artifacts (key, digest, ext, model, created, meta) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, digest, ext, model, time.time(), json.dumps(meta or {}, default=str)),
+            )
+            self._db.commit()
+        return blob
+
+    def get_or_generate(self, key: str, generate: Callable[[], Optional[bytes]],
+                        model: Optional[str] = None, meta: Optional[dict] = None) -> Optional[str]:
+        """Return *key* if stored, otherwise run *generate* and store its bytes.
+
+        Returns None when generation produced nothing.
+        """
+        if self.has(key):
+            with self._lock:
+                self.hits += 1
+            return key
+        data = generate()
+        if not data:
+            return None
+        self.put(key, data, model=model, meta=meta)
+        with self._lock:
+            self.generated += 1
+        return key
+
+    async def aget_or_generate(self, key: str, generate: Callable[[], Awaitable[Optional[bytes]]],
+                               model: Optional[str] = None, meta: Optional[dict] = None) -> Optional[str]:
+        """get_or_generate for a coroutine *generate* (asyncio pipelines)."""
+        if self.has(key):
+            with self._lock:
+                self.hits += 1
+            return key
+        data = await generate()
+        if not data:
+            return None
+        self.put(key, data, model=model, meta=meta)
+        with self._lock:
+            self.generated += 1
+        return key
+
+    # -----------------------------------------------------------------------
+    # Views
+    # -----------------------------------------------------------------------
+
+    def materialize(self, key: str, dest: Path) -> Path:
+        """Expose artifact *key* at *dest* (hard link, falling back to a copy)."""
+        blob = self.path(key)
+        if blob is None:
+            raise KeyError(f"artifact not in store: {key}")
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists() or dest.is_symlink():
+            dest.unlink()
+        try:
+            os.link(blob, dest)
+        except OSError:
+            shutil.copyfile(blob, dest)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO views (path, key) VALUES (?, ?)",
+                (str(dest.resolve()), key),
+            )
+            self._db.commit()
+        return dest
+
+    # -----------------------------------------------------------------------
+    # Garbage collection
+    # -----------------------------------------------------------------------
+
+    def gc(self, referenced_names: Optional[Iterable[str]] = None, dry_run: bool = False) -> dict:
+        """Delete artifacts with no live view.
+
+        A view is live if its file still exists and, when *referenced_names*
+        is given (e.g. image filenames from the catalogue), its basename is
+        one of them. Blobs no remaining artifact points at are removed too.
+        """
+        names = set(referenced_names) if referenced_names is not None else None
+        with self._lock:
+            views = self._db.execute("SELECT path, key FROM views").fetchall()
+            artifacts = self._db.execute("SELECT key, digest, ext FROM artifacts").fetchall()
+
+        live_keys = set()
+        dead_views = []
+        for path, key in views:
+            p = Path(path)
+            if p.exists() and (names is None or p.name in names):
+                live_keys.add(key)
+            elif not p.exists():
+                dead_views.append(path)
+
+        dead_keys = [key for key, _, _ in artifacts if key not in live_keys]
+        live_blobs = {(digest, ext) for key, digest, ext in artifacts if key in live_keys}
+        dead_blobs = {(digest, ext) for key, digest, ext in artifacts if key not in live_keys} - live_blobs
+
+        freed = 0
+        for digest, ext in dead_blobs:
+            blob = self._blob_path(digest, ext)
+            if blob.exists():
+                freed += blob.stat().st_size
+                if not dry_run:
+                    blob.unlink()
+        if not dry_run:
+            with self._lock:
+                self._db.executemany("DELETE FROM artifacts WHERE key = ?", [(k,) for k in dead_keys])
+                self._db.executemany("DELETE FROM views WHERE path = ?", [(p,) for p in dead_views])
+                self._db.executemany("DELETE FROM views WHERE key = ?", [(k,) for k in dead_keys])
+                self._db.commit()
+        return {"artifacts": len(dead_keys), "blobs": len(dead_blobs), "bytes": freed, "views": len(dead_views)}
+
+    def stats(self) -> str:
+        return f"artifact store: {self.hits} reused, {self.generated} generated"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide store
+# ---------------------------------------------------------------------------
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Return the shared ArtifactStore under the scripts cache dir."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore(get_cache_dir() / "artifacts")
+        return _store
+
+
+def _catalogue_image_names(catalogue_path: Path) -> set:
+    """Basenames of every image referenced by a product_catalogue.json."""
+    names = set()
+    for product in json.loads(catalogue_path.read_text(encoding="utf-8")):
+        for value in (product.get("images") or {}).values():
+            if isinstance(value, str) and value:
+                names.add(Path(value).name)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generated-image artifact store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show store size")
+    gc_parser = sub.add_parser("gc", help="Delete artifacts no product or view references")
+    gc_parser.add_argument("--catalogue", type=Path, help="product_catalogue.json whose images count as references")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted")
+    args = parser.parse_args()
+
+    store = get_artifact_store()
+    if args.command == "stats":
+        with store._lock:
+            count = store._db.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+            views = store._db.execute("SELECT COUNT(*) FROM views").fetchone()[0]
+        size = sum(p.stat().st_size for p in store.objects.glob("*/*") if p.is_file())
+        print(f"Artifacts: {count}  Views: {views}  Size: {size / 1024 / 1024:.1f} MB")
+        return
+
+    names = None
+    if args.catalogue:
+        if not args.catalogue.exists():
+            print(f"❌ Catalogue not found: {args.catalogue}")
+            sys.exit(1)
+        names = _catalogue_image_names(args.catalogue)
+    result = store.gc(names, dry_run=args.dry_run)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{verb} {result['artifacts']} artifact(s), {result['blobs']} blob(s), "
+          f"{result['bytes'] / 1024 / 1024:.1f} MB; pruned {result['views']} stale view(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Shared Gemini Batch API plumbing.
+
+Submitting a JSONL request file, waiting for the job and reading its results
+back is the same for every batch pipeline (outfit extraction, analysis
+pre-warming); this module holds that part so the pipelines only build
+requests and decode responses.
+
+Request lines use the Gemini Batch API format:
+    {"key": "<custom id>", "request": {"contents": [...], "generationConfig": {...}}}
+A GenerateContentConfig is split the way the REST request expects:
+sampling/output fields go into generationConfig, systemInstruction,
+safetySettings, tools, toolConfig and cachedContent sit on the request
+itself, and anything else (client-side options) is rejected.
+Results come back as one JSON object per line with the same "key" and
+either a "response" or an "error".
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from google.genai import types
+
+# Batch jobs can take up to a day, so file inputs must outlive them
+BATCH_MIN_TTL = 26 * 3600
+POLL_INTERVAL = 30  # seconds between job status checks
+
+SUCCEEDED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+# GenerateContentConfig fields that belong in the request's generationConfig
+GENERATION_CONFIG_FIELDS = {
+    "temperature", "top_p", "top_k", "candidate_count", "max_output_tokens", "stop_sequences",
+    "response_logprobs", "logprobs", "presence_penalty", "frequency_penalty", "seed",
+    "response_mime_type", "response_schema", "response_json_schema", "response_modalities",
+    "media_resolution", "speech_config", "thinking_config", "image_config",
+}
+# ...and those that are top-level fields of the request
+REQUEST_FIELDS = {"system_instruction", "safety_settings", "tools", "tool_config", "cached_content"}
+
+
+def job_state(job) -> str:
+    return getattr(job.state, "value", str(job.state))
+
+
+def request_line(key: str, contents, config: Optional[types.GenerateContentConfig] = None) -> dict:
+    """One JSONL request from SDK Content objects and a generation config.
+
+    Raises ValueError for config fields a batch request can't carry.
+    """
+    request = {"contents": [c.model_dump(mode="json", exclude_none=True, by_alias=True) for c in contents]}
+    if config is None:
+        return {"key": key, "request": request}
+
+    used = {name for name in type(config).model_fields if getattr(config, name) is not None}
+    unsupported = used - GENERATION_CONFIG_FIELDS - REQUEST_FIELDS
+    if unsupported:
+        raise ValueError(f"config fields not supported in batch requests: {', '.join(sorted(unsupported))}")
+
+    def dump(names):
+        return config.model_dump(mode="json", exclude_none=True, by_alias=True, include=names)
+
+    generation_config = dump(used & GENERATION_CONFIG_FIELDS)
+    if generation_config:
+        request["generationConfig"] = generation_config
+    request.update(dump(used & REQUEST_FIELDS))
+    if isinstance(request.get("systemInstruction"), str):
+        # The REST request takes a Content, not a bare string
+        request["systemInstruction"] = {"parts": [{"text": request["systemInstruction"]}]}
+    return {"key": key, "request": request}
+
+
+def submit_jsonl(client, model: str, jsonl_path: Path, display_name: str) -> str:
+    """Upload *jsonl_path* and create a batch job on it; returns the job name."""
+    print("\nSubmitting batch job...")
+    batch_input_file = client.files.upload(
+        file=str(jsonl_path),
+        config=types.UploadFileConfig(display_name=display_name, mime_type='jsonl'),
+    )
+    print(f"  Uploaded batch input file: {batch_input_file.name}")
+    job = client.batches.create(
+        model=model,
+        src=batch_input_file.name,
+        config={'display_name': display_name},
+    )
+    print(f"✓ Job created: {job.name}")
+    return job.name
+
+
+def wait_for_job(client, job_name: str, poll_interval: float = POLL_INTERVAL):
+    """Poll until the job finishes; returns the job, or None if it failed."""
+    print(f"\nWaiting for job {job_name}...")
+    last = None
+    while True:
+        job = client.batches.get(name=job_name)
+        state = job_state(job)
+        if state != last:
+            print(f"  Status: {state}")
+            last = state
+        if state in SUCCEEDED_STATES:
+            return job
+        if state in FAILED_STATES:
+            print(f"✗ Job failed: {job.error}")
+            return None
+        time.sleep(poll_interval)
+
+
+def download_results(client, job, results_path: Path) -> Path:
+    """Download the job's JSONL results file to *results_path*."""
+    print(f"\nDownloading results: {job.dest.file_name}")
+    data = client.files.download(file=job.dest.file_name)
+    results_path.write_bytes(data)
+    return results_path
+
+
+def iter_results(results_path: Path) -> Iterator[Tuple[str, Optional[types.GenerateContentResponse], Optional[str]]]:
+    """Yield (key, response, error message) for each line of a results file."""
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            key = record.get("key") or record.get("custom_id")
+            if record.get("error"):
+                error = record["error"]
+                yield key, None, error.get("message", str(error)) if isinstance(error, dict) else str(error)
+                continue
+            try:
+                response = types.GenerateContentResponse.model_validate_json(json.dumps(record.get("response") or {}))
+            except ValueError as e:
+                yield key, None, f"unreadable response: {e}"
+                continue
+            yield key, response, None
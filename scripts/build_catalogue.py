@@ -2,42 +2,79 @@
 Build Product Catalogue from Existing Images
 Uses already extracted garments and model poses to create a product catalogue CSV
 Detects kids vs adults and uses appropriate gender labels (boy/girl vs male/female)
+
+Writes product_catalogue.csv / .json / .jsonl / .parquet (see catalogue_sinks.py).
+If derivatives/manifest.json exists (derivatives.py), each JSON record also
+lists the responsive-image variants and srcset strings of its images.
+
+Near-duplicate garments (same shoot exported twice, re-extractions) are
+collapsed into one product by perceptual hash (see perceptual_hash.py), and
+pose references point at one canonical file per set of identical poses.
+
+Usage:
+    python build_catalogue.py [--full] [--formats csv,json] [--age-pack-size 12]
+                              [--duplicate-radius 6 | --keep-duplicates]
 """
 
 import os
-import csv
 import json
 import re
-import base64
+import argparse
 from pathlib import Path
 from datetime import datetime
-from google import genai
-from google.genai import types
 import certifi
-from config import get_google_api_key
 
 # Configure SSL
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
-# API Configuration - from environment
-API_KEY = get_google_api_key()
+from google.genai import types
+
+from gemini_client import get_pool
+from image_source import open_image
+from file_registry import get_file_registry
+from image_pyramid import pyramid_source
+from analysis_cache import get_analysis_cache
+from analysis_backend import AnalysisRequest, analyze, get_analysis_backend
+from pose_index import PoseIndex, source_key, parse_pose_filename
+from perceptual_hash import HashIndex, find_duplicates, canonical_map, DUPLICATE_RADIUS
+from catalogue_sinks import checkpoint_path, open_sinks, read_checkpoint, DEFAULT_FORMATS
+from derivatives import load_manifest, catalogue_entry
+
+# API Configuration
 ANALYSIS_MODEL = "gemini-2.5-flash"
 
-# Create client
-client = genai.Client(api_key=API_KEY)
+# Age/gender only needs a small image (see image_pyramid.py)
+ANALYSIS_LEVEL = "thumbnail"
+
+# Garment images per age-classification request (1 = one request per image)
+AGE_PACK_SIZE = int(os.getenv("CATALOGUE_AGE_PACK_SIZE", "12"))
+
+# Shared client pool (API key comes from .env.local via config)
+pool = get_pool()
+analysis_cache = get_analysis_cache()
+analysis_backend = get_analysis_backend()
+file_registry = get_file_registry()
 
 # Folders
 GARMENTS_FOLDER = Path("extracted-products")
 POSES_FOLDER = Path("model-poses")
 OUTPUT_FOLDER = Path(".")
 
-def analyze_image_for_age(image_path):
-    """Analyze an image to determine if the model is a kid or adult."""
-    try:
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-        
-        prompt = """Look at this fashion product image. Is the person wearing this a child/kid (under 12 years old) or an adult/teenager?
+POSE_GENDER = {'boy': 'male', 'girl': 'female'}
+
+# Highest SKU number ever issued, so SKUs of removed products are never reused
+SKU_STATE_FILE = OUTPUT_FOLDER / "product_catalogue.skus.json"
+
+_pose_index = None
+
+def get_pose_index():
+    """Index of POSES_FOLDER by (source, gender, model, pose), loaded once."""
+    global _pose_index
+    if _pose_index is None:
+        _pose_index = PoseIndex.load(POSES_FOLDER)
+    return _pose_index
+
+AGE_PROMPT = """Look at this fashion product image. Is the person wearing this a child/kid (under 12 years old) or an adult/teenager?
 
 Return ONLY a JSON object:
 {
@@ -46,18 +83,115 @@ Return ONLY a JSON object:
     "gender": "male" or "female"
 }"""
 
-        response = client.models.generate_content(
+def parse_age_response(text):
+    """Pull the JSON object out of an age-detection reply (None if absent)."""
+    json_match = re.search(r'\{[\s\S]*?\}', text or "")
+    if json_match:
+        return json.loads(json_match.group())
+    return None
+
+AGE_PACK_PROMPT = """These are {count} fashion product images, numbered 0 to {last}. For each one: is the person wearing it a child/kid (under 12 years old) or an adult/teenager?
+
+Return ONLY a JSON array with one object per image:
+[
+    {{"index": 0, "is_kid": true or false, "estimated_age_range": "child (2-12)" or "teen/adult (13+)", "gender": "male" or "female"}},
+    ...
+]"""
+
+def parse_age_pack_response(text, count):
+    """{index: result} from a packed reply; missing or malformed items are left out."""
+    json_match = re.search(r'\[[\s\S]*\]', text or "")
+    if not json_match:
+        return {}
+    try:
+        items = json.loads(json_match.group())
+    except json.JSONDecodeError:
+        return {}
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or 'is_kid' not in item:
+            continue
+        index = item.get('index')
+        if isinstance(index, int) and 0 <= index < count:
+            results[index] = {k: v for k, v in item.items() if k != 'index'}
+    return results
+
+def age_analysis_request(image_path):
+    """The age/gender prompt for *image_path* as an AnalysisRequest."""
+    source = pyramid_source(image_path, ANALYSIS_LEVEL)
+    return AnalysisRequest(
+        # Unchanged garment images are served from the on-disk cache
+        key=analysis_cache.key(source.sha256, ANALYSIS_MODEL, AGE_PROMPT),
+        model=ANALYSIS_MODEL,
+        source=source,
+        prompt=AGE_PROMPT,
+        config=None,
+        parse=parse_age_response,
+        name=Path(image_path).name,
+    )
+
+def classify_age_pack(requests):
+    """Classify several garment images in one call; {request key: result} for those answered."""
+    def send(image_parts):
+        parts = []
+        for i, image_part in enumerate(image_parts):
+            parts.append(types.Part.from_text(text=f"Image {i}:"))
+            parts.append(image_part)
+        parts.append(types.Part.from_text(text=AGE_PACK_PROMPT.format(count=len(requests), last=len(requests) - 1)))
+        return pool.generate_content(
             model=ANALYSIS_MODEL,
-            contents=[
-                types.Part.from_bytes(data=image_data, mime_type="image/png"),
-                prompt
-            ]
+            contents=[types.Content(role="user", parts=parts)],
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
         )
-        
-        text = response.text
-        json_match = re.search(r'\{[\s\S]*?\}', text)
-        if json_match:
-            data = json.loads(json_match.group())
+    
+    response = file_registry.call_many([request.source for request in requests], send)
+    answered = parse_age_pack_response(response.text, len(requests))
+    return {requests[i].key: result for i, result in answered.items()}
+
+def classify_ages_packed(requests, pack_size=AGE_PACK_SIZE):
+    """Fill the analysis cache for *requests* with multi-image calls.
+    
+    Results are cached under each image's own age-analysis key, so
+    analyze_image_for_age finds them. Items a pack's reply leaves out are
+    split into two smaller packs and retried; single leftovers go through
+    the one-image path. Returns the number of images classified.
+    """
+    if pack_size < 2 or analysis_cache.offline:
+        return 0
+    pending = {}
+    for request in requests:
+        if request.key not in pending and analysis_cache.get(request.key) is None:
+            pending[request.key] = request
+    pending = list(pending.values())
+    if len(pending) < 2:
+        return 0
+    
+    def run(pack):
+        try:
+            answered = classify_age_pack(pack)
+        except Exception as e:
+            print(f"  ⚠ Age pack of {len(pack)} failed: {e}")
+            answered = {}
+        for request in pack:
+            if request.key in answered:
+                analysis_cache.put(request.key, answered[request.key], meta={"source": request.name, "pack": len(pack)})
+        missing = [r for r in pack if r.key not in answered]
+        if len(missing) < 2:
+            return len(answered)
+        half = len(missing) // 2
+        return len(answered) + run(missing[:half]) + run(missing[half:])
+    
+    packs = [pending[i:i + pack_size] for i in range(0, len(pending), pack_size)]
+    print(f"Classifying {len(pending)} images in {len(packs)} request(s) of up to {pack_size}")
+    classified = sum(pool.map(run, packs))
+    print(f"  ✓ {classified} classified, {len(pending) - classified} left for single-image requests")
+    return classified
+
+def analyze_image_for_age(image_path):
+    """Analyze an image to determine if the model is a kid or adult."""
+    try:
+        data = analyze(age_analysis_request(image_path))
+        if data:
             return data
     except Exception as e:
         print(f"Error: {e}")
@@ -141,38 +275,75 @@ def parse_garment_filename(filename):
         'age_category': 'adult'
     }
 
-def find_model_poses(source_ref, gender):
-    """Find model pose images that match the source image."""
+def find_model_poses(source_ref, gender, model_num=1, index=None):
+    """Find model pose images that match the source image and model."""
     poses = {
         'front_standing': '',
         'three_quarter': '',
         'casual_lifestyle': ''
     }
     
-    dsc_match = re.search(r'DSC(\d+)', source_ref)
-    if not dsc_match:
+    if not source_ref:
         return poses
     
-    dsc_num = dsc_match.group(1)
-    
-    pose_files = list(POSES_FOLDER.glob('*.png'))
-    
-    for pose_file in pose_files:
-        name = pose_file.stem
-        if 'ORIGINAL' in name:
-            continue
-        
-        if f'DSC{dsc_num}' in name or f'_DSC{dsc_num}' in name:
-            if gender.lower() in name.lower():
-                if 'front_standing' in name:
-                    poses['front_standing'] = pose_file.name
-                elif 'three_quarter' in name:
-                    poses['three_quarter'] = pose_file.name
-                elif 'casual_lifestyle' in name or 'lifestyle' in name:
-                    poses['casual_lifestyle'] = pose_file.name
+    # Pose files carry the adult gender labels even for kids' outfits
+    pose_gender = POSE_GENDER.get(gender.lower(), gender.lower())
+    found = (index or get_pose_index()).find(source_key(source_ref), pose_gender, model_num)
+    for pose, filename in found.items():
+        if pose in poses:
+            poses[pose] = filename
     
     return poses
 
+def collapse_duplicates(parsed, radius):
+    """Drop near-duplicate garments, keeping the largest image of each cluster.
+    
+    Only garments parsed as the same gender, type and colour are compared.
+    The kept product lists the others under info['duplicates'].
+    """
+    infos = {f.name: info for f, info in parsed}
+    hashes = HashIndex.load(GARMENTS_FOLDER)
+    clusters = find_duplicates(
+        hashes.entries(infos), radius,
+        group=lambda name: (infos[name]['gender'], infos[name]['garment_type'], infos[name]['color'])
+    )
+    for cluster in clusters:
+        infos[cluster[0]]['duplicates'] = cluster[1:]
+    dropped = canonical_map(clusters)
+    return [(f, info) for f, info in parsed if f.name not in dropped], dropped
+
+def pose_duplicates(radius):
+    """{duplicate pose file: canonical pose file} for POSES_FOLDER."""
+    def pose_type(name):
+        entry = parse_pose_filename(name)
+        return entry['pose'] if entry else None
+    hashes = HashIndex.load(POSES_FOLDER)
+    return canonical_map(find_duplicates(hashes.entries(), radius, group=pose_type))
+
+def sku_prefix(product):
+    """SKU prefix: ZC-KB / ZC-KG for kids, ZC-<gender initial> for adults."""
+    if product.get('is_kid', False):
+        return f"ZC-K{'B' if product['gender'] == 'boy' else 'G'}"
+    return f"ZC-{product['gender'][0].upper() if product['gender'] else 'U'}"
+
+def load_previous_catalogue(json_file):
+    """Previous catalogue records keyed by product image path."""
+    if not json_file.exists():
+        return {}
+    with open(json_file, encoding='utf-8') as f:
+        return {record['images']['product']: record for record in json.load(f)}
+
+def load_sku_counter(previous, use_state=True):
+    """Last SKU number issued (state file, or the highest in the catalogue)."""
+    last = 0
+    if use_state and SKU_STATE_FILE.exists():
+        last = json.loads(SKU_STATE_FILE.read_text(encoding='utf-8')).get('last_sku_number', 0)
+    for record in previous.values():
+        match = re.search(r'(\d+)$', record.get('sku', ''))
+        if match:
+            last = max(last, int(match.group(1)))
+    return last
+
 def get_category(garment_type, is_kid=False):
     """Map garment type to category."""
     garment_lower = garment_type.lower()
@@ -218,8 +389,96 @@ def get_subcategory(garment_type, is_kid=False):
     
     return garment_type.title()
 
-def build_catalogue():
-    """Build the product catalogue from existing images."""
+def product_record(product, derivatives=None):
+    """The catalogue record for one parsed, age-checked product.
+    
+    *derivatives* is the derivatives.py manifest; entries for the record's
+    images are embedded under "derivatives".
+    """
+    is_kid = product.get('is_kid', False)
+    
+    color = product['color'].replace('-', ' ').replace('_', ' ').title()
+    garment = product['garment_type'].replace('-', ' ').replace('_', ' ').title()
+    
+    if is_kid:
+        gender_label = "Boy's" if product['gender'] == 'boy' else "Girl's"
+        name = f"{gender_label} {color} {garment}"
+    else:
+        name = f"{color} {garment}"
+    
+    if product['pattern']:
+        name += f" - {product['pattern'].title()}"
+    
+    if is_kid:
+        gender_desc = "boy's" if product['gender'] == 'boy' else "girl's"
+        description = f"Adorable {gender_desc} {color.lower()} {garment.lower()}"
+    else:
+        description = f"{product['gender'].title()}'s {color.lower()} {garment.lower()}"
+    
+    if product['pattern']:
+        description += f" with {product['pattern'].lower()} design"
+    description += f". {product['style'].title()} style."
+    
+    # Gender category: Men, Women, or Kids
+    if is_kid:
+        gender_category = "Kids"
+    elif product['gender'].lower() in ['male', 'boy']:
+        gender_category = "Men"
+    elif product['gender'].lower() in ['female', 'girl']:
+        gender_category = "Women"
+    else:
+        gender_category = "Unisex"
+    
+    poses = product['poses']
+    images = {
+        "product": f"extracted-products/{product['filename']}",
+        "model_1": f"model-poses/{poses['front_standing']}" if poses['front_standing'] else None,
+        "model_2": f"model-poses/{poses['three_quarter']}" if poses['three_quarter'] else None,
+        "model_3": f"model-poses/{poses['casual_lifestyle']}" if poses['casual_lifestyle'] else None
+    }
+    record = {
+        "sku": product['sku'],
+        "name": name,
+        "description": description,
+        "category": get_category(product['garment_type'], is_kid),
+        "subcategory": get_subcategory(product['garment_type'], is_kid),
+        "gender": product['gender'].title(),
+        "gender_category": gender_category,
+        "age_group": "Kids" if is_kid else "Adults",
+        "color": color,
+        "pattern": product['pattern'],
+        "style": product['style'],
+        "is_kid": is_kid,
+        "images": images,
+        "status": "published",
+        "featured": False,
+        "created_at": product['created_at'],
+        "source_hash": product['source_hash']
+    }
+    if product.get('duplicates'):
+        record["duplicates"] = [f"extracted-products/{name}" for name in product['duplicates']]
+    if derivatives:
+        record["derivatives"] = {
+            key: catalogue_entry(derivatives[path]) for key, path in images.items() if path in derivatives
+        }
+    return record
+
+def build_catalogue(full=False, formats=DEFAULT_FORMATS, age_pack_size=AGE_PACK_SIZE,
+                    duplicate_radius=DUPLICATE_RADIUS):
+    """Build the product catalogue from existing images.
+    
+    Incremental by default: images whose content hash matches the previous
+    catalogue reuse their age detection, and existing products keep their
+    SKU and created_at. With full=True everything is re-analyzed and SKUs
+    are renumbered from 1.
+    
+    Each product's record is written to the output sinks (see
+    catalogue_sinks.py) as soon as it's built; products finished by an
+    interrupted run are picked up from its JSONL checkpoint.
+    
+    Garments within *duplicate_radius* bits of perceptual-hash distance of a
+    larger copy are left out (None keeps every garment).
+    """
     
     print("=" * 70)
     print("BUILDING PRODUCT CATALOGUE")
@@ -229,23 +488,73 @@ def build_catalogue():
     garment_files = [f for f in GARMENTS_FOLDER.glob('*.png') if not f.name.startswith('ORIGINAL')]
     print(f"\nFound {len(garment_files)} garment images")
     
-    pose_files = [f for f in POSES_FOLDER.glob('*.png') if not f.name.startswith('ORIGINAL')]
-    print(f"Found {len(pose_files)} model pose images")
-    
-    products = []
-    kids_count = 0
+    pose_index = get_pose_index()
+    print(f"Found {len(pose_index)} model pose images")
     
     print("\nAnalyzing products for age detection...")
     
-    for i, garment_file in enumerate(garment_files, 1):
-        info = parse_garment_filename(garment_file.name)
-        if not info:
-            continue
-        
-        image_path = GARMENTS_FOLDER / garment_file.name
-        print(f"  [{i}/{len(garment_files)}] {garment_file.name[:40]}...", end=" ")
-        
-        age_info = analyze_image_for_age(image_path)
+    parsed = [(f, parse_garment_filename(f.name)) for f in garment_files]
+    parsed = [(f, info) for f, info in parsed if info]
+    
+    # Collapse near-duplicates before paying for age detection on them
+    dropped, pose_map = {}, {}
+    if duplicate_radius is not None:
+        parsed, dropped = collapse_duplicates(parsed, duplicate_radius)
+        pose_map = pose_duplicates(duplicate_radius)
+        print(f"Collapsed {len(dropped)} duplicate garment(s), {len(pose_map)} duplicate pose(s)")
+    
+    # Compare content hashes with the previous catalogue
+    json_file = OUTPUT_FOLDER / "product_catalogue.json"
+    previous = {} if full else load_previous_catalogue(json_file)
+    checkpoint = read_checkpoint(checkpoint_path(OUTPUT_FOLDER, "product_catalogue"))
+    if checkpoint:
+        print(f"Resuming: {len(checkpoint)} products from the interrupted run")
+        previous.update(checkpoint)
+    sku_counter = load_sku_counter(previous, use_state=not full)
+    changed = []
+    unchanged = 0
+    for garment_file, info in parsed:
+        info['source_hash'] = open_image(GARMENTS_FOLDER / garment_file.name).sha256
+        info['previous'] = previous.get(f"extracted-products/{garment_file.name}")
+        if not info['previous']:
+            # A collapsed duplicate's existing row keeps its SKU
+            info['previous'] = next(
+                (previous[f"extracted-products/{name}"] for name in info.get('duplicates', [])
+                 if f"extracted-products/{name}" in previous), None
+            )
+        if info['previous'] and info['previous'].get('source_hash') == info['source_hash']:
+            unchanged += 1
+        else:
+            changed.append((garment_file, info))
+    current = {f"extracted-products/{f.name}" for f, _ in parsed}
+    removed = [path for path in previous if path not in current]
+    new_count = sum(1 for _, info in changed if not info['previous'])
+    print(f"New: {new_count}  Changed: {len(changed) - new_count}  "
+          f"Unchanged: {unchanged}  Removed: {len(removed)}")
+    
+    # With the batch backend all uncached age detections run as one job first
+    analysis_backend.prefetch((age_analysis_request(GARMENTS_FOLDER / f.name) for f, _ in changed), label="age")
+    
+    # Then whatever is still uncached is classified several images per request
+    classify_ages_packed([age_analysis_request(GARMENTS_FOLDER / f.name) for f, _ in changed], age_pack_size)
+    
+    # Age detection calls are independent - run them concurrently on the shared pool
+    changed_results = pool.map(lambda item: analyze_image_for_age(GARMENTS_FOLDER / item[0].name), changed)
+    detected = {f.name: age_info for (f, _), age_info in zip(changed, changed_results)}
+    age_results = [
+        detected.get(f.name) or {"is_kid": info['previous'].get('is_kid', False)}
+        for f, info in parsed
+    ]
+    
+    derivatives = load_manifest(OUTPUT_FOLDER)
+    if derivatives:
+        print(f"Derivative manifest: {len(derivatives)} images")
+    
+    now = datetime.now().isoformat()
+    sinks = open_sinks(OUTPUT_FOLDER, "product_catalogue", formats)
+    stats = {'total': 0, 'kids': 0, 'with_poses': 0, 'genders': {}, 'categories': {}}
+    for i, ((garment_file, info), age_info) in enumerate(zip(parsed, age_results), 1):
+        print(f"  [{i}/{len(parsed)}] {garment_file.name[:40]}...", end=" ")
         
         if age_info.get('is_kid', False):
             info['is_kid'] = True
@@ -254,202 +563,78 @@ def build_catalogue():
                 info['gender'] = 'boy'
             elif info['gender'].lower() == 'female':
                 info['gender'] = 'girl'
-            kids_count += 1
             print("👶 Kid")
         else:
             print("👤 Adult")
         
-        poses = find_model_poses(info['source_ref'], info['gender'])
-        info['poses'] = poses
-        products.append(info)
-    
-    print(f"\nTotal products: {len(products)}")
-    print(f"Kids products: {kids_count}")
-    print(f"Adult products: {len(products) - kids_count}")
-    
-    # Generate CSV
-    csv_file = OUTPUT_FOLDER / "product_catalogue.csv"
-    
-    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        
-        writer.writerow([
-            'sku', 'name', 'description', 'category', 'subcategory',
-            'gender', 'gender_category', 'age_group', 'color', 'pattern', 'style',
-            'product_image', 'model_image_1', 'model_image_2', 'model_image_3',
-            'status', 'featured', 'created_at'
-        ])
-        
-        for i, product in enumerate(products, 1):
-            is_kid = product.get('is_kid', False)
-            
-            if is_kid:
-                gender_code = 'B' if product['gender'] == 'boy' else 'G'
-                sku = f"ZC-K{gender_code}{i:04d}"
-            else:
-                gender_code = product['gender'][0].upper() if product['gender'] else 'U'
-                sku = f"ZC-{gender_code}{i:04d}"
-            
-            color = product['color'].replace('-', ' ').replace('_', ' ').title()
-            garment = product['garment_type'].replace('-', ' ').replace('_', ' ').title()
-            
-            if is_kid:
-                gender_label = "Boy's" if product['gender'] == 'boy' else "Girl's"
-                name = f"{gender_label} {color} {garment}"
-            else:
-                name = f"{color} {garment}"
-            
-            if product['pattern']:
-                name += f" - {product['pattern'].title()}"
-            
-            if is_kid:
-                gender_desc = "boy's" if product['gender'] == 'boy' else "girl's"
-                description = f"Adorable {gender_desc} {color.lower()} {garment.lower()}"
-            else:
-                description = f"{product['gender'].title()}'s {color.lower()} {garment.lower()}"
-            
-            if product['pattern']:
-                description += f" with {product['pattern'].lower()} design"
-            description += f". {product['style'].title()} style."
-            
-            category = get_category(product['garment_type'], is_kid)
-            subcategory = get_subcategory(product['garment_type'], is_kid)
-            age_group = "Kids" if is_kid else "Adults"
-            
-            # Gender category: Men, Women, or Kids
-            if is_kid:
-                gender_category = "Kids"
-            elif product['gender'].lower() in ['male', 'boy']:
-                gender_category = "Men"
-            elif product['gender'].lower() in ['female', 'girl']:
-                gender_category = "Women"
-            else:
-                gender_category = "Unisex"
-            
-            product_image = f"extracted-products/{product['filename']}"
-            model_1 = f"model-poses/{product['poses']['front_standing']}" if product['poses']['front_standing'] else ''
-            model_2 = f"model-poses/{product['poses']['three_quarter']}" if product['poses']['three_quarter'] else ''
-            model_3 = f"model-poses/{product['poses']['casual_lifestyle']}" if product['poses']['casual_lifestyle'] else ''
-            
-            writer.writerow([
-                sku, name, description, category, subcategory,
-                product['gender'].title(), gender_category, age_group, color, product['pattern'], product['style'],
-                product_image, model_1, model_2, model_3,
-                'published', 'false', datetime.now().isoformat()
-            ])
-    
-    print(f"\n✓ CSV saved: {csv_file}")
-    
-    # Also save as JSON
-    json_file = OUTPUT_FOLDER / "product_catalogue.json"
-    
-    json_products = []
-    for i, product in enumerate(products, 1):
-        is_kid = product.get('is_kid', False)
-        
-        if is_kid:
-            gender_code = 'B' if product['gender'] == 'boy' else 'G'
-            sku = f"ZC-K{gender_code}{i:04d}"
-        else:
-            gender_code = product['gender'][0].upper() if product['gender'] else 'U'
-            sku = f"ZC-{gender_code}{i:04d}"
-        
-        color = product['color'].replace('-', ' ').replace('_', ' ').title()
-        garment = product['garment_type'].replace('-', ' ').replace('_', ' ').title()
+        info['poses'] = find_model_poses(info['source_ref'], info['gender'], info['model_number'], pose_index)
+        for name in info.get('duplicates', []):
+            # Poses generated for a duplicate fill the ones this copy lacks
+            dup = parse_garment_filename(name)
+            for pose, filename in find_model_poses(dup['source_ref'], info['gender'], dup['model_number'], pose_index).items():
+                info['poses'][pose] = info['poses'][pose] or filename
+        info['poses'] = {pose: pose_map.get(filename, filename) for pose, filename in info['poses'].items()}
         
-        if is_kid:
-            gender_label = "Boy's" if product['gender'] == 'boy' else "Girl's"
-            name = f"{gender_label} {color} {garment}"
+        # Existing products keep their SKU and creation time
+        prev = info.pop('previous')
+        if prev:
+            info['sku'] = prev['sku']
+            info['created_at'] = prev.get('created_at') or now
         else:
-            name = f"{color} {garment}"
+            sku_counter += 1
+            info['sku'] = f"{sku_prefix(info)}{sku_counter:04d}"
+            info['created_at'] = now
         
-        if product['pattern']:
-            name += f" - {product['pattern'].title()}"
+        record = product_record(info, derivatives)
+        sinks.write(record)
         
-        if is_kid:
-            gender_desc = "boy's" if product['gender'] == 'boy' else "girl's"
-            description = f"Adorable {gender_desc} {color.lower()} {garment.lower()}"
-        else:
-            description = f"{product['gender'].title()}'s {color.lower()} {garment.lower()}"
-        
-        if product['pattern']:
-            description += f" with {product['pattern'].lower()} design"
-        description += f". {product['style'].title()} style."
-        
-        # Gender category: Men, Women, or Kids
-        if is_kid:
-            gender_category = "Kids"
-        elif product['gender'].lower() in ['male', 'boy']:
-            gender_category = "Men"
-        elif product['gender'].lower() in ['female', 'girl']:
-            gender_category = "Women"
-        else:
-            gender_category = "Unisex"
-        
-        json_products.append({
-            "sku": sku,
-            "name": name,
-            "description": description,
-            "category": get_category(product['garment_type'], is_kid),
-            "subcategory": get_subcategory(product['garment_type'], is_kid),
-            "gender": product['gender'].title(),
-            "gender_category": gender_category,
-            "age_group": "Kids" if is_kid else "Adults",
-            "color": color,
-            "pattern": product['pattern'],
-            "style": product['style'],
-            "is_kid": is_kid,
-            "images": {
-                "product": f"extracted-products/{product['filename']}",
-                "model_1": f"model-poses/{product['poses']['front_standing']}" if product['poses']['front_standing'] else None,
-                "model_2": f"model-poses/{product['poses']['three_quarter']}" if product['poses']['three_quarter'] else None,
-                "model_3": f"model-poses/{product['poses']['casual_lifestyle']}" if product['poses']['casual_lifestyle'] else None
-            },
-            "status": "published",
-            "featured": False,
-            "created_at": datetime.now().isoformat()
-        })
-    
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(json_products, f, indent=2)
-    
-    print(f"✓ JSON saved: {json_file}")
+        stats['total'] += 1
+        stats['kids'] += record['is_kid']
+        stats['with_poses'] += any(record['images'][f'model_{n}'] for n in (1, 2, 3))
+        stats['genders'][record['gender']] = stats['genders'].get(record['gender'], 0) + 1
+        stats['categories'][record['category']] = stats['categories'].get(record['category'], 0) + 1
+    
+    SKU_STATE_FILE.write_text(json.dumps({'last_sku_number': sku_counter}, indent=2), encoding='utf-8')
+    
+    print(f"\n{analysis_cache.stats()}")
+    print()
+    sinks.close()
     
     # Print summary
     print("\n" + "=" * 70)
     print("CATALOGUE SUMMARY")
     print("=" * 70)
     
-    categories = {}
-    genders = {}
-    products_with_poses = 0
-    
-    for product in products:
-        cat = get_category(product['garment_type'], product.get('is_kid', False))
-        categories[cat] = categories.get(cat, 0) + 1
-        
-        gender = product['gender'].title()
-        genders[gender] = genders.get(gender, 0) + 1
-        
-        if any(product['poses'].values()):
-            products_with_poses += 1
-    
-    print(f"\nTotal Products: {len(products)}")
-    print(f"Products with Model Poses: {products_with_poses}")
+    print(f"\nTotal Products: {stats['total']}")
+    print(f"Products with Model Poses: {stats['with_poses']}")
     
     print(f"\nBy Age Group:")
-    print(f"  Kids: {kids_count}")
-    print(f"  Adults: {len(products) - kids_count}")
+    print(f"  Kids: {stats['kids']}")
+    print(f"  Adults: {stats['total'] - stats['kids']}")
     
     print(f"\nBy Gender:")
-    for gender, count in sorted(genders.items()):
+    for gender, count in sorted(stats['genders'].items()):
         print(f"  {gender}: {count}")
     
     print(f"\nBy Category:")
-    for cat, count in sorted(categories.items()):
+    for cat, count in sorted(stats['categories'].items()):
         print(f"  {cat}: {count}")
     
     print("\n" + "=" * 70)
 
 if __name__ == "__main__":
-    build_catalogue()
+    parser = argparse.ArgumentParser(description="Build the product catalogue from extracted garments")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-analyze every image and renumber SKUs instead of updating the previous catalogue")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS),
+                        help="Comma-separated outputs: csv,json,jsonl,parquet (default: all)")
+    parser.add_argument("--age-pack-size", type=int, default=AGE_PACK_SIZE,
+                        help="Images per age-classification request, 1 to disable packing (default: %(default)s)")
+    parser.add_argument("--duplicate-radius", type=int, default=DUPLICATE_RADIUS,
+                        help="Perceptual-hash distance (of 64 bits) below which garments are duplicates (default: %(default)s)")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Don't collapse near-duplicate garments and poses")
+    args = parser.parse_args()
+    build_catalogue(full=args.full, formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+                    age_pack_size=args.age_pack_size,
+                    duplicate_radius=None if args.keep_duplicates else args.duplicate_radius)
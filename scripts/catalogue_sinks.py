@@ -0,0 +1,245 @@
+"""
+Streaming output sinks for the product catalogue.
+
+build_catalogue computes one record per product and hands it to every sink
+as soon as it is ready, so nothing is held in memory until the end:
+
+- CsvSink      product_catalogue.csv   (flat columns, read by update-products-from-csv.js)
+- JsonSink     product_catalogue.json  (pretty-printed array of records)
+- JsonlSink    product_catalogue.jsonl (one record per line)
+- ParquetSink  product_catalogue.parquet (needs pyarrow; skipped without it)
+
+Each sink writes to "<file>.partial" and flushes after every record. close()
+atomically renames the partial file over the final one, so a crashed run
+never leaves a truncated catalogue behind.
+
+Whatever the formats, every record is also appended to a hidden
+.product_catalogue.checkpoint.jsonl, which a clean close() removes. After a
+crash it holds every product finished so far - the next run reads it back
+with read_checkpoint and doesn't redo those products.
+
+Usage:
+    from catalogue_sinks import checkpoint_path, open_sinks, read_checkpoint
+
+    resumed = read_checkpoint(checkpoint_path(Path("."), "product_catalogue"))
+    sinks = open_sinks(Path("."), "product_catalogue", formats=("csv", "json"))
+    for record in records:
+        sinks.write(record)
+    sinks.close()
+"""
+
+import os
+import csv
+import json
+from pathlib import Path
+from typing import Dict, List
+
+CSV_COLUMNS = [
+    'sku', 'name', 'description', 'category', 'subcategory',
+    'gender', 'gender_category', 'age_group', 'color', 'pattern', 'style',
+    'product_image', 'model_image_1', 'model_image_2', 'model_image_3',
+    'status', 'featured', 'created_at', 'source_hash'
+]
+
+DEFAULT_FORMATS = ("csv", "json", "jsonl", "parquet")
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP = 1000
+
+
+def flat_record(record: Dict) -> Dict:
+    """A catalogue record with its images as model_image_N columns."""
+    images = record.get('images', {})
+    flat = {column: record.get(column) for column in CSV_COLUMNS}
+    flat.update({
+        'product_image': images.get('product'),
+        'model_image_1': images.get('model_1'),
+        'model_image_2': images.get('model_2'),
+        'model_image_3': images.get('model_3'),
+    })
+    return flat
+
+
+def checkpoint_path(folder: Path, stem: str) -> Path:
+    """The hidden JSONL checkpoint kept while <folder>/<stem>.* are written."""
+    return Path(folder) / f".{stem}.checkpoint.jsonl"
+
+
+def read_checkpoint(path: Path) -> Dict[str, Dict]:
+    """Records of interrupted runs' checkpoint, keyed by product image (latest wins)."""
+    records = {}
+    if not path.exists():
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line torn by a crash
+            records[record['images']['product']] = record
+    return records
+
+
+class Sink:
+    """Writes records to "<path>.partial" and renames it over *path* on close."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.partial = self.path.with_name(self.path.name + ".partial")
+        self.count = 0
+
+    def write(self, record: Dict):
+        raise NotImplementedError
+
+    def _finish(self):
+        """Write any trailer and close the file."""
+
+    def close(self):
+        self._finish()
+        os.replace(self.partial, self.path)
+        print(f"✓ {self.path.suffix[1:].upper()} saved: {self.path} ({self.count} products)")
+
+
+class CsvSink(Sink):
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.file = open(self.partial, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, record: Dict):
+        flat = flat_record(record)
+        flat['featured'] = 'true' if flat['featured'] else 'false'
+        self.writer.writerow(['' if flat[c] is None else flat[c] for c in CSV_COLUMNS])
+        self.file.flush()
+        self.count += 1
+
+    def _finish(self):
+        self.file.close()
+
+
+class JsonSink(Sink):
+    """Pretty-printed JSON array, written one element at a time."""
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.file = open(self.partial, 'w', encoding='utf-8')
+        self.file.write('[')
+
+    def write(self, record: Dict):
+        element = json.dumps(record, indent=2).replace('\n', '\n  ')
+        self.file.write((',\n  ' if self.count else '\n  ') + element)
+        self.file.flush()
+        self.count += 1
+
+    def _finish(self):
+        self.file.write('\n]' if self.count else ']')
+        self.file.close()
+
+
+class JsonlSink(Sink):
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.file = open(self.partial, 'w', encoding='utf-8')
+
+    def write(self, record: Dict):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.count += 1
+
+    def _finish(self):
+        self.file.close()
+
+
+class CheckpointSink(JsonlSink):
+    """Appends every record to the checkpoint; removed when the run closes cleanly.
+    
+    Appending keeps the records of earlier interrupted runs until this one
+    has written them again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.partial = self.path
+        self.count = 0
+        self.file = open(self.path, 'a+', encoding='utf-8')
+        if self.file.tell():
+            self.file.seek(self.file.tell() - 1)
+            if self.file.read(1) != '\n':
+                self.file.write('\n')  # start after a line torn by a crash
+
+    def close(self):
+        self._finish()
+        self.path.unlink()
+
+
+class ParquetSink(Sink):
+    """Columnar copy for analytics; row groups are written as they fill."""
+
+    def __init__(self, path: Path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        super().__init__(path)
+        self.pa = pa
+        fields = [(c, pa.string()) for c in CSV_COLUMNS]
+        fields[CSV_COLUMNS.index('featured')] = ('featured', pa.bool_())
+        self.schema = pa.schema(fields + [('is_kid', pa.bool_())])
+        self.writer = pq.ParquetWriter(str(self.partial), self.schema)
+        self.rows: List[Dict] = []
+
+    def write(self, record: Dict):
+        flat = flat_record(record)
+        flat['is_kid'] = bool(record.get('is_kid'))
+        self.rows.append(flat)
+        self.count += 1
+        if len(self.rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def _finish(self):
+        self._flush()
+        self.writer.close()
+
+
+class SinkGroup:
+    """Fans each record out to several sinks."""
+
+    def __init__(self, sinks: List[Sink]):
+        self.sinks = sinks
+
+    def write(self, record: Dict):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def close(self):
+        # The checkpoint is last, so it's only removed once every output is in place
+        for sink in self.sinks:
+            sink.close()
+
+
+def open_sinks(folder: Path, stem: str, formats=DEFAULT_FORMATS) -> SinkGroup:
+    """Open one sink per format as <folder>/<stem>.<format>, plus the checkpoint."""
+    sinks = []
+    for fmt in formats:
+        path = Path(folder) / f"{stem}.{fmt}"
+        if fmt == "csv":
+            sinks.append(CsvSink(path))
+        elif fmt == "json":
+            sinks.append(JsonSink(path))
+        elif fmt == "jsonl":
+            sinks.append(JsonlSink(path))
+        elif fmt == "parquet":
+            try:
+                sinks.append(ParquetSink(path))
+            except ImportError:
+                print("⚠️ pyarrow not installed - skipping Parquet output (pip install pyarrow)")
+        else:
+            raise ValueError(f"Unknown catalogue format: {fmt}")
+    sinks.append(CheckpointSink(checkpoint_path(folder, stem)))
+    return SinkGroup(sinks)
@@ -0,0 +1,213 @@
+"""
+Cloudinary uploads for the Python pipelines.
+
+Uploads used to happen in a second pass (upload-to-cloudinary.js) that
+re-sent every file each time. This uploader is called right where images
+are produced:
+
+- signed uploads to the REST API over one pooled requests.Session, with
+  at most CLOUDINARY_UPLOAD_WORKERS uploads in flight across all threads
+- files over CLOUDINARY_CHUNK_MB (default 20) are sent as a chunked upload
+  (Content-Range / X-Unique-Upload-Id), like the SDKs' upload_large
+- cloudinary-manifest.json (next to cloudinary-mapping.json) records the
+  content hash, URL and size of every public_id uploaded; an asset whose
+  hash matches its manifest entry is not sent again. It is written every
+  CLOUDINARY_MANIFEST_FLUSH (default 50) uploads, at the end of each
+  upload_many and at exit - not once per upload
+
+Credentials come from config.get_cloudinary_config (.env.local).
+TLS certificates are verified; CLOUDINARY_VERIFY_SSL=0 opts out.
+
+Usage:
+    from cloudinary_upload import get_cloudinary_uploader
+
+    uploader = get_cloudinary_uploader()
+    url = uploader.upload(path_or_bytes, "zecode/products/model-poses-generated/x")
+    urls = uploader.upload_many({public_id: path, ...})   # {public_id: url or None}
+    uploader.save_manifest()                               # after single upload() calls
+"""
+
+import os
+import json
+import atexit
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import get_cloudinary_config
+
+UPLOAD_WORKERS = int(os.getenv("CLOUDINARY_UPLOAD_WORKERS", "4"))
+CHUNK_SIZE = int(os.getenv("CLOUDINARY_CHUNK_MB", "20")) * 1024 * 1024
+# Certificates are checked unless CLOUDINARY_VERIFY_SSL=0 (the signed API credentials go over this connection)
+VERIFY_SSL = os.getenv("CLOUDINARY_VERIFY_SSL", "1").lower() not in ("0", "false", "no")
+MANIFEST_FLUSH_EVERY = int(os.getenv("CLOUDINARY_MANIFEST_FLUSH", "50"))
+
+MANIFEST_PATH = Path(__file__).parent / "cloudinary-manifest.json"
+
+
+class CloudinaryError(RuntimeError):
+    pass
+
+
+class CloudinaryUploader:
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, workers: int = UPLOAD_WORKERS,
+                 manifest_path: Path = MANIFEST_PATH, verify: bool = VERIFY_SSL):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.upload_url = f"https://api.cloudinary.com/v1_1/{cloud_name}/image/upload"
+        self.workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+        self.session = requests.Session()
+        retry = Retry(total=4, backoff_factor=1.0, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, respect_retry_after_header=True)
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.workers, max_retries=retry))
+        self.session.verify = verify
+        if not verify:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        self.manifest_path = Path(manifest_path)
+        self._lock = threading.Lock()
+        try:
+            self.manifest: Dict[str, Dict] = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.manifest = {}
+        self._unsaved = 0
+        self.counts = {"uploaded": 0, "unchanged": 0, "failed": 0}
+
+    # -----------------------------------------------------------------------
+    # Manifest
+    # -----------------------------------------------------------------------
+
+    def uploaded_url(self, public_id: str, sha256: Optional[str] = None) -> Optional[str]:
+        """URL of *public_id* if it was uploaded (with content *sha256*, if given)."""
+        entry = self.manifest.get(public_id)
+        if not entry or (sha256 is not None and entry["sha256"] != sha256):
+            return None
+        return entry["url"]
+
+    def _record(self, public_id: str, sha256: str, result: Dict):
+        with self._lock:
+            self.manifest[public_id] = {
+                "sha256": sha256,
+                "url": result["secure_url"],
+                "bytes": result.get("bytes"),
+                "version": result.get("version"),
+            }
+            self._unsaved += 1
+            if self._unsaved >= MANIFEST_FLUSH_EVERY:
+                self._write_manifest()
+
+    def _write_manifest(self):
+        tmp = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+        self._unsaved = 0
+
+    def save_manifest(self):
+        """Write uploads not yet in cloudinary-manifest.json."""
+        with self._lock:
+            if self._unsaved:
+                self._write_manifest()
+
+    # -----------------------------------------------------------------------
+    # Uploads
+    # -----------------------------------------------------------------------
+
+    def _signed(self, public_id: str) -> Dict[str, str]:
+        params = {"public_id": public_id, "overwrite": "true", "timestamp": str(int(time.time()))}
+        to_sign = "&".join(f"{key}={params[key]}" for key in sorted(params)) + self.api_secret
+        params["signature"] = hashlib.sha1(to_sign.encode("utf-8")).hexdigest()
+        params["api_key"] = self.api_key
+        return params
+
+    def _post(self, params: Dict, data: bytes, filename: str, headers: Optional[Dict] = None) -> Dict:
+        response = self.session.post(self.upload_url, data=params, files={"file": (filename, data)},
+                                     headers=headers, timeout=300)
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        if not response.ok or "error" in result:
+            message = result.get("error", {}).get("message") or response.text[:200]
+            raise CloudinaryError(f"HTTP {response.status_code}: {message}")
+        return result
+
+    def _send(self, data: bytes, public_id: str) -> Dict:
+        params = self._signed(public_id)
+        filename = public_id.rsplit("/", 1)[-1]
+        if len(data) <= CHUNK_SIZE:
+            return self._post(params, data, filename)
+        # Chunked upload: every part carries the same upload id; the last one returns the asset
+        upload_id = uuid.uuid4().hex
+        total = len(data)
+        result = {}
+        for start in range(0, total, CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, total) - 1
+            result = self._post(params, data[start:end + 1], filename, headers={
+                "X-Unique-Upload-Id": upload_id,
+                "Content-Range": f"bytes {start}-{end}/{total}",
+            })
+        return result
+
+    def upload(self, source: Union[bytes, str, Path], public_id: str) -> str:
+        """Upload *source* as *public_id* unless that content is already there; returns its URL."""
+        data = source if isinstance(source, bytes) else Path(source).read_bytes()
+        sha256 = hashlib.sha256(data).hexdigest()
+        url = self.uploaded_url(public_id, sha256)
+        if url:
+            with self._lock:
+                self.counts["unchanged"] += 1
+            return url
+        with self._slots:
+            result = self._send(data, public_id)
+        self._record(public_id, sha256, result)
+        with self._lock:
+            self.counts["uploaded"] += 1
+        return result["secure_url"]
+
+    def upload_many(self, items: Dict[str, Union[bytes, str, Path]]) -> Dict[str, Optional[str]]:
+        """Upload {public_id: source} concurrently; {public_id: url, or None if it failed}."""
+        def upload_one(public_id):
+            try:
+                return public_id, self.upload(items[public_id], public_id)
+            except (CloudinaryError, OSError, requests.RequestException) as e:
+                print(f"  ✗ Upload failed: {public_id} - {e}")
+                with self._lock:
+                    self.counts["failed"] += 1
+                return public_id, None
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                return dict(executor.map(upload_one, items))
+        finally:
+            self.save_manifest()
+
+    def stats(self) -> str:
+        return (f"cloudinary: {self.counts['uploaded']} uploaded, {self.counts['unchanged']} unchanged, "
+                f"{self.counts['failed']} failed")
+
+
+_cloudinary_uploader = None
+_cloudinary_lock = threading.Lock()
+
+
+def get_cloudinary_uploader() -> CloudinaryUploader:
+    """Process-wide uploader built from .env.local."""
+    global _cloudinary_uploader
+    with _cloudinary_lock:
+        if _cloudinary_uploader is None:
+            config = get_cloudinary_config()
+            _cloudinary_uploader = CloudinaryUploader(config["cloud_name"], config["api_key"], config["api_secret"])
+            atexit.register(_cloudinary_uploader.save_manifest)
+    return _cloudinary_uploader
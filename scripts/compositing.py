@@ -0,0 +1,198 @@
+"""
+Vectorized compositing for banner collages.
+
+The banner scripts used to draw gradients one line per row, vignettes as
+100 nested rectangles and drop shadows as extra full-size RGBA layers. Here
+a banner is a float32 (height, width, 4) NumPy canvas - RGB in 0-255, alpha
+in 0-1 - and every effect is one array operation over it. Blending follows
+PIL's paste-with-mask and alpha_composite rules, so banners look the same
+as the PIL-drawn originals:
+
+    gradient(w, h, top, bottom)       vertical background
+    drop_shadow(canvas, box)          darkened rectangle behind an image
+    paste(canvas, image, x, y)        alpha blend of an RGBA image
+    vignette(canvas, border, step)    edge darkening, alpha = step * d for d < border
+
+Sources are decoded once, shrunk with Image.draft (JPEG) and Image.reduce
+before a single LANCZOS resize to the slot size, and cached per size, so
+rendering the same collage at several banner sizes reuses the decode.
+
+Usage:
+    from compositing import Sources, gradient, paste, vignette, to_image
+
+    sources = Sources(paths)
+    canvas = gradient(1920, 800, (30, 30, 35), (10, 10, 10))
+    for i, (x, y, w, h) in enumerate(slots):
+        image = sources.fit(i, w, h)
+        paste(canvas, image, x + (w - image.width) // 2, y + (h - image.height) // 2)
+    vignette(canvas)
+    to_image(canvas, background=(0, 0, 0)).save("banner.jpg", quality=90)
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+ImageLike = Union[str, Path, Image.Image]
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+def fit_size(size: Tuple[int, int], box_w: int, box_h: int) -> Tuple[int, int]:
+    """Largest (w, h) with the aspect ratio of *size* that fits in the box."""
+    w, h = size
+    if w / h > box_w / box_h:
+        return box_w, max(1, int(box_w / (w / h)))
+    return max(1, int(box_h * (w / h))), box_h
+
+
+def open_scaled(path, min_size: Tuple[int, int]) -> Image.Image:
+    """Open *path* as RGBA, letting the decoder skip detail beyond *min_size*."""
+    image = Image.open(path)
+    # JPEG only: decode at 1/2, 1/4 or 1/8 scale while still >= min_size
+    image.draft("RGB", min_size)
+    return image.convert("RGBA")
+
+
+def shrink(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Resize to *size*: cheap integer reduce() first, then one LANCZOS pass."""
+    # Keep at least 2x the target for LANCZOS to work on
+    factor = min(image.width // size[0], image.height // size[1]) // 2
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return image
+
+
+class Sources:
+    """Collage source images, decoded once and fitted per slot size."""
+
+    def __init__(self, items: Sequence[ImageLike], max_size: Optional[Tuple[int, int]] = None):
+        self.items = list(items)
+        self.max_size = max_size    # largest slot any render will ask for
+        self._decoded: Dict[int, Image.Image] = {}
+        self._fitted: Dict[Tuple[int, int, int], Image.Image] = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def image(self, index: int) -> Image.Image:
+        if index not in self._decoded:
+            item = self.items[index]
+            if isinstance(item, Image.Image):
+                self._decoded[index] = item.convert("RGBA")
+            elif self.max_size:
+                self._decoded[index] = open_scaled(item, self.max_size)
+            else:
+                self._decoded[index] = Image.open(item).convert("RGBA")
+        return self._decoded[index]
+
+    def size(self, index: int) -> Tuple[int, int]:
+        return self.image(index).size
+
+    def fit(self, index: int, box_w: int, box_h: int) -> Image.Image:
+        """Source *index* scaled to fit the box, keeping its aspect ratio."""
+        return self.resized(index, fit_size(self.size(index), box_w, box_h))
+
+    def resized(self, index: int, size: Tuple[int, int]) -> Image.Image:
+        key = (index, size[0], size[1])
+        if key not in self._fitted:
+            self._fitted[key] = shrink(self.image(index), size)
+        return self._fitted[key]
+
+
+# ---------------------------------------------------------------------------
+# Canvas operations
+# ---------------------------------------------------------------------------
+
+def solid(width: int, height: int, color: Sequence[int]) -> np.ndarray:
+    canvas = np.empty((height, width, 4), dtype=np.float32)
+    canvas[..., :3] = color
+    canvas[..., 3] = 1.0
+    return canvas
+
+
+def gradient(width: int, height: int, top: Sequence[int], bottom: Sequence[int]) -> np.ndarray:
+    """Vertical gradient from *top* (row 0) towards *bottom* (row height)."""
+    t = (np.arange(height) / height)[:, None]
+    top = np.asarray(top, dtype=np.float64)
+    rows = np.floor(top - t * (top - np.asarray(bottom, dtype=np.float64)))
+    canvas = np.empty((height, width, 4), dtype=np.float32)
+    canvas[..., :3] = rows[:, None, :]
+    canvas[..., 3] = 1.0
+    return canvas
+
+
+def _clip(canvas: np.ndarray, x: int, y: int, w: int, h: int):
+    """Canvas and source slices for a w x h box at (x, y), or None if off-canvas."""
+    height, width = canvas.shape[:2]
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (slice(y0, y1), slice(x0, x1)), (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+
+
+def _blend(region: np.ndarray, rgb, alpha, mask):
+    """PIL paste-with-mask: every channel (alpha too) moves towards the source by *mask*."""
+    region[..., :3] = rgb * mask + region[..., :3] * (1.0 - mask)
+    region[..., 3:] = alpha * mask + region[..., 3:] * (1.0 - mask)
+
+
+def drop_shadow(canvas: np.ndarray, x: int, y: int, w: int, h: int,
+                alpha: int = 100, offset: int = 5):
+    """Black rectangle of opacity *alpha* under the box at (x, y), shifted by *offset*."""
+    clipped = _clip(canvas, x + offset, y + offset, w, h)
+    if clipped:
+        a = alpha / 255.0
+        _blend(canvas[clipped[0]], 0.0, a, a)
+
+
+def paste(canvas: np.ndarray, image: Image.Image, x: int, y: int):
+    """Paste *image* at (x, y), masked by its own alpha if it has one."""
+    clipped = _clip(canvas, x, y, image.width, image.height)
+    if not clipped:
+        return
+    dst, src = clipped
+    pixels = np.asarray(image, dtype=np.float32)[src]
+    if pixels.shape[2] == 4:
+        a = pixels[..., 3:4] / 255.0
+        _blend(canvas[dst], pixels[..., :3], a, a)
+    else:
+        canvas[dst][..., :3] = pixels
+        canvas[dst][..., 3] = 1.0
+
+
+def vignette(canvas: np.ndarray, border: int = 100, step: float = 1.5):
+    """Black overlay towards the edges: alpha = step * d for pixels d < border from an edge."""
+    height, width = canvas.shape[:2]
+    xs = np.arange(width)
+    ys = np.arange(height)
+    dx = np.minimum(xs, width - xs)
+    dy = np.minimum(ys, height - ys)
+    d = np.minimum(dy[:, None], dx[None, :])
+    overlay = (np.where(d < border, np.floor(d * step), 0) / 255.0).astype(np.float32)[..., None]
+    # alpha_composite of black at *overlay* over the canvas
+    alpha = canvas[..., 3:]
+    out_alpha = overlay + alpha * (1.0 - overlay)
+    np.divide(canvas[..., :3] * alpha * (1.0 - overlay), out_alpha,
+              out=canvas[..., :3], where=out_alpha > 0)
+    canvas[..., 3:] = out_alpha
+
+
+def to_image(canvas: np.ndarray, background: Optional[Sequence[int]] = None) -> Image.Image:
+    """The canvas as an 8-bit RGB image, flattened onto *background* (or with alpha dropped)."""
+    rgb = canvas[..., :3]
+    if background is not None:
+        alpha = canvas[..., 3:]
+        rgb = rgb * alpha + np.asarray(background, dtype=np.float32) * (1.0 - alpha)
+    return Image.fromarray(np.clip(np.rint(rgb), 0, 255).astype(np.uint8), "RGB")
+
+
+def render_sizes(render, sizes: Sequence[Tuple[int, int]]) -> List[Image.Image]:
+    """Call render(width, height) for every banner size (sources stay decoded between calls)."""
+    return [render(width, height) for width, height in sizes]
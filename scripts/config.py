@@ -67,3 +67,10 @@ def get_directus_config():
         print("❌ Missing DIRECTUS_ADMIN_EMAIL or DIRECTUS_ADMIN_PASSWORD in .env.local")
         sys.exit(1)
     return config
+
+
+def get_cache_dir():
+    """Get the local cache directory shared by the scripts (not committed)."""
+    cache_dir = Path(os.getenv("ZECODE_CACHE_DIR") or Path(__file__).parent / ".cache")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
@@ -1,8 +1,12 @@
 """
 Create a footwear collection banner collage from product images
+
+Usage:
+    python create_footwear_banner.py [--sizes 1200x500 800x800]
 """
 import os
-from PIL import Image, ImageDraw
+import argparse
+from compositing import Sources, gradient, drop_shadow, paste, vignette, to_image, render_sizes
 
 # Local product images directory
 PRODUCTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'public', 'products', 'extracted-products')
@@ -18,101 +22,81 @@ FOOTWEAR_IMAGES = [
 ]
 
 def load_local_image(filename):
-    """Load image from local products directory"""
+    """Path of a local product image, or None if it's missing"""
     path = os.path.join(PRODUCTS_DIR, filename)
     print(f"Loading: {path}")
-    try:
-        if os.path.exists(path):
-            return Image.open(path).convert('RGBA')
-        else:
-            print(f"  File not found")
-            return None
-    except Exception as e:
-        print(f"  Error: {e}")
+    if not os.path.exists(path):
+        print(f"  File not found")
         return None
+    return path
 
-def create_collage(images, output_path, width=1920, height=800):
-    """Create a stylish collage banner"""
-    # Create base image with gradient background
-    banner = Image.new('RGBA', (width, height))
-    draw = ImageDraw.Draw(banner)
-    
-    # Create gradient background (dark to darker)
-    for y in range(height):
-        # Gradient from dark gray to black
-        r = int(30 - (y / height) * 20)
-        g = int(30 - (y / height) * 20)
-        b = int(35 - (y / height) * 25)
-        draw.line([(0, y), (width, y)], fill=(r, g, b, 255))
-    
-    # Calculate positions for images
-    num_images = len(images)
-    if num_images == 0:
-        print("No images to create collage")
-        return
-    
-    # Layout: spread images across the banner with overlap
+def collage_slots(num_images, width, height):
+    """(x, y, w, h) slot per image: spread across the banner with overlap"""
     img_width = width // 3  # Each image takes 1/3 of width
     img_height = int(height * 0.85)  # 85% of banner height
-    
-    # Position images with overlap for visual appeal
-    positions = []
     spacing = (width - img_width) // (num_images - 1) if num_images > 1 else width // 2
     
+    slots = []
     for i in range(num_images):
         x = i * spacing
         y = (height - img_height) // 2 + (i % 2) * 20  # Slight stagger
-        positions.append((x, y))
+        slots.append((x, y, img_width, img_height))
+    return slots
+
+def render_collage(sources, width=1920, height=800):
+    """Render the collage banner as an RGB image (see compositing.py)"""
+    # Gradient from dark gray to black
+    canvas = gradient(width, height, (30, 30, 35), (10, 10, 10))
     
     # Place images (from back to front for overlap effect)
-    for i, (img, pos) in enumerate(zip(images, positions)):
-        if img is None:
-            continue
-        
-        # Resize image maintaining aspect ratio
-        img_ratio = img.width / img.height
-        target_ratio = img_width / img_height
-        
-        if img_ratio > target_ratio:
-            new_width = img_width
-            new_height = int(img_width / img_ratio)
-        else:
-            new_height = img_height
-            new_width = int(img_height * img_ratio)
-        
-        resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    for i, (x, y, w, h) in enumerate(collage_slots(len(sources), width, height)):
+        image = sources.fit(i, w, h)
         
         # Center the image in its slot
-        x = pos[0] + (img_width - new_width) // 2
-        y = pos[1] + (img_height - new_height) // 2
-        
-        # Add subtle shadow
-        shadow = Image.new('RGBA', resized.size, (0, 0, 0, 100))
-        banner.paste(shadow, (x + 5, y + 5), shadow)
+        x += (w - image.width) // 2
+        y += (h - image.height) // 2
         
-        # Paste image
-        banner.paste(resized, (x, y), resized)
+        drop_shadow(canvas, x, y, image.width, image.height, alpha=100, offset=5)
+        paste(canvas, image, x, y)
     
-    # Add subtle vignette overlay
-    vignette = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-    vignette_draw = ImageDraw.Draw(vignette)
-    for i in range(100):
-        alpha = int(i * 1.5)
-        vignette_draw.rectangle([i, i, width - i, height - i], outline=(0, 0, 0, alpha))
-    banner = Image.alpha_composite(banner, vignette)
+    vignette(canvas, border=100, step=1.5)
+    return to_image(canvas, background=(0, 0, 0))
+
+def create_collage(images, output_path, width=1920, height=800, sizes=()):
+    """Create a stylish collage banner
     
-    # Convert to RGB for saving as JPG
-    banner_rgb = Image.new('RGB', banner.size, (0, 0, 0))
-    banner_rgb.paste(banner, mask=banner.split()[3] if banner.mode == 'RGBA' else None)
+    *images* are paths or PIL images. Extra *sizes* ((w, h) pairs) are
+    rendered from the same decoded sources as <name>_<w>x<h>.jpg.
+    """
+    images = [img for img in images if img is not None]
+    if not images:
+        print("No images to create collage")
+        return
+    
+    all_sizes = [(width, height)] + [tuple(s) for s in sizes if tuple(s) != (width, height)]
+    # Sources are decoded once at the largest slot size any banner needs
+    largest = max(all_sizes, key=lambda s: s[0] * s[1])
+    sources = Sources(images, max_size=(largest[0] // 3, int(largest[1] * 0.85)))
     
-    # Save
-    banner_rgb.save(output_path, 'JPEG', quality=90)
-    print(f"Banner saved to: {output_path}")
+    root, _ = os.path.splitext(output_path)
+    for (w, h), banner in zip(all_sizes, render_sizes(lambda w, h: render_collage(sources, w, h), all_sizes)):
+        path = output_path if (w, h) == (width, height) else f"{root}_{w}x{h}.jpg"
+        banner.save(path, 'JPEG', quality=90)
+        print(f"Banner saved to: {path}")
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
 
 def main():
+    parser = argparse.ArgumentParser(description="Create the footwear collection banner")
+    parser.add_argument("--sizes", nargs="*", type=parse_size, default=[],
+                        help="Extra banner sizes to render, e.g. 1200x500 800x800")
+    args = parser.parse_args()
+    
     print("Creating footwear collection banner...")
     
-    # Load all footwear images from local files
+    # Collect the footwear images from local files
     images = []
     for filename in FOOTWEAR_IMAGES:
         img = load_local_image(filename)
@@ -122,7 +106,7 @@ def main():
     print(f"\nLoaded {len(images)} images")
     
     if len(images) == 0:
-        print("No images downloaded, cannot create banner")
+        print("No images found, cannot create banner")
         return
     
     # Create output directory if needed
@@ -131,7 +115,7 @@ def main():
     
     # Create banner
     output_path = os.path.join(output_dir, 'footwear_collage.jpg')
-    create_collage(images, output_path)
+    create_collage(images, output_path, sizes=args.sizes)
     
     print("\nDone! Now upload to Cloudinary:")
     print(f"  Image: {output_path}")
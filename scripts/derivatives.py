@@ -0,0 +1,235 @@
+"""
+Responsive-image derivatives for the catalogue images.
+
+The garment and pose PNGs come straight from Gemini: large, lossless and in
+a single size. This writes WebP / AVIF / JPEG copies at a set of widths for
+every image in extracted-products/ and model-poses/:
+
+    derivatives/<folder>/<stem>_<width>.<ext>
+
+and records them in derivatives/manifest.json, keyed by the source path
+(e.g. "extracted-products/x.png"), with the source's content hash, size and
+each variant's width, path and byte size. build_catalogue embeds the
+manifest entries (srcset strings included) into product_catalogue.json.
+
+Sources whose content hash matches the manifest and whose variants all
+exist are skipped. The rest are encoded on a process pool, each decoded
+once and scaled down width by width. Widths above the source width are
+replaced by one full-size variant (no upscaling). AVIF needs a Pillow build with AVIF support and is skipped with
+a warning otherwise.
+
+Configuration: DERIVATIVE_WIDTHS (default 320,640,960,1280) and
+DERIVATIVE_FORMATS (default webp,avif,jpeg).
+
+Usage:
+    python derivatives.py [--root DIR] [--widths 320,640] [--formats webp,jpeg] [--workers N]
+
+    from derivatives import load_manifest, srcset
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from PIL import Image, features
+
+DERIVATIVE_WIDTHS = [int(w) for w in os.getenv("DERIVATIVE_WIDTHS", "320,640,960,1280").split(",") if w.strip()]
+DERIVATIVE_FORMATS = [f.strip() for f in os.getenv("DERIVATIVE_FORMATS", "webp,avif,jpeg").split(",") if f.strip()]
+
+SOURCE_FOLDERS = ("extracted-products", "model-poses")
+DERIVATIVES_FOLDER = "derivatives"
+MANIFEST_NAME = "manifest.json"
+
+# Encoder settings per format
+ENCODERS = {
+    "webp": {"ext": "webp", "format": "WEBP", "options": {"quality": 80, "method": 4}},
+    "avif": {"ext": "avif", "format": "AVIF", "options": {"quality": 60, "speed": 6}},
+    "jpeg": {"ext": "jpg", "format": "JPEG", "options": {"quality": 82, "optimize": True, "progressive": True}},
+}
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def supported_formats(formats: Sequence[str]) -> List[str]:
+    """*formats* this Pillow build can encode (warns about the rest)."""
+    result = []
+    for fmt in formats:
+        if fmt not in ENCODERS:
+            raise ValueError(f"Unknown derivative format: {fmt}")
+        if fmt in ("webp", "avif") and not features.check(fmt):
+            print(f"⚠️ Pillow has no {fmt.upper()} support - skipping {fmt} derivatives")
+            continue
+        result.append(fmt)
+    return result
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """RGB copy for JPEG (alpha composited onto white)."""
+    if img.mode == "RGBA":
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[3])
+        return background
+    return img.convert("RGB")
+
+
+def render_derivatives(source: str, root: str, widths: Sequence[int], formats: Sequence[str]) -> Dict:
+    """Encode every (width, format) variant of *source*; runs in a worker process."""
+    root_path = Path(root)
+    source_path = root_path / source
+    out_dir = root_path / DERIVATIVES_FOLDER / Path(source).parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = Path(source).stem
+
+    with Image.open(source_path) as img:
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+        width, height = img.size
+        variants = {fmt: [] for fmt in formats}
+        targets = [w for w in widths if w < width]
+        if len(targets) < len(widths):
+            targets.append(width)  # full size stands in for the widths it can't reach
+        # Largest first, each scaled down from the previous
+        for target in sorted(targets, reverse=True):
+            size = (target, max(1, round(height * target / width)))
+            if img.size != size:
+                img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            for fmt in formats:
+                spec = ENCODERS[fmt]
+                out_path = out_dir / f"{stem}_{target}.{spec['ext']}"
+                tmp = out_path.with_name(out_path.name + ".tmp")
+                frame = _flatten(img) if fmt == "jpeg" else img
+                frame.save(tmp, spec["format"], **spec["options"])
+                os.replace(tmp, out_path)
+                variants[fmt].append({
+                    "width": target,
+                    "height": size[1],
+                    "path": out_path.relative_to(root_path).as_posix(),
+                    "bytes": out_path.stat().st_size,
+                })
+    for fmt in formats:
+        variants[fmt].sort(key=lambda v: v["width"])
+    return {"width": width, "height": height, "variants": variants}
+
+
+def load_manifest(root: Path) -> Dict[str, Dict]:
+    path = Path(root) / DERIVATIVES_FOLDER / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(root: Path, manifest: Dict[str, Dict]):
+    path = Path(root) / DERIVATIVES_FOLDER / MANIFEST_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def srcset(entry: Dict, fmt: str) -> str:
+    """HTML srcset string for one format of a manifest entry."""
+    return ", ".join(f"{v['path']} {v['width']}w" for v in entry["variants"].get(fmt, []))
+
+
+def catalogue_entry(entry: Optional[Dict]) -> Optional[Dict]:
+    """Manifest entry as embedded in product_catalogue.json (adds srcset strings)."""
+    if not entry:
+        return None
+    return {
+        "width": entry["width"],
+        "height": entry["height"],
+        "srcset": {fmt: srcset(entry, fmt) for fmt in entry["variants"]},
+        "variants": entry["variants"],
+    }
+
+
+def _up_to_date(root: Path, entry: Optional[Dict], sha: str, widths, formats) -> bool:
+    if not entry or entry.get("sha256") != sha or entry.get("settings") != {"widths": list(widths), "formats": list(formats)}:
+        return False
+    return all((root / v["path"]).exists() for fmt in formats for v in entry["variants"].get(fmt, []))
+
+
+def build_derivatives(root: Path, widths: Sequence[int] = DERIVATIVE_WIDTHS,
+                      formats: Sequence[str] = DERIVATIVE_FORMATS, workers: Optional[int] = None) -> Dict[str, Dict]:
+    """Bring derivatives/ up to date for every image under *root*'s source folders."""
+    root = Path(root)
+    formats = supported_formats(formats)
+    widths = sorted(set(widths))
+    manifest = load_manifest(root)
+
+    sources = []
+    for folder in SOURCE_FOLDERS:
+        if (root / folder).is_dir():
+            sources.extend(
+                f"{folder}/{p.name}" for p in sorted((root / folder).glob("*.png")) if not p.name.startswith("ORIGINAL")
+            )
+
+    todo = {}
+    for source in sources:
+        sha = file_sha256(root / source)
+        if not _up_to_date(root, manifest.get(source), sha, widths, formats):
+            todo[source] = sha
+    removed = [source for source in manifest if source not in set(sources)]
+    for source in removed:
+        del manifest[source]
+
+    print(f"Derivatives: {len(sources)} source(s), {len(todo)} to render, "
+          f"{len(sources) - len(todo)} unchanged, {len(removed)} removed")
+    if todo:
+        failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(render_derivatives, source, str(root), widths, formats): source for source in todo
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                source = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"  ✗ {source}: {e}")
+                    failed += 1
+                    continue
+                entry.update({"sha256": todo[source], "settings": {"widths": widths, "formats": formats}})
+                manifest[source] = entry
+                if done % 50 == 0:
+                    save_manifest(root, manifest)  # checkpoint
+                    print(f"  {done}/{len(todo)} rendered")
+        print(f"  ✓ {len(todo) - failed} rendered, {failed} failed")
+    save_manifest(root, manifest)
+
+    source_bytes = sum((root / s).stat().st_size for s in sources if (root / s).exists())
+    for fmt in formats:
+        largest = sum(e["variants"][fmt][-1]["bytes"] for e in manifest.values() if e["variants"].get(fmt))
+        if source_bytes:
+            print(f"  {fmt}: largest variants {largest / 1e6:.1f} MB vs {source_bytes / 1e6:.1f} MB of PNG sources")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build responsive-image derivatives for the catalogue images")
+    parser.add_argument("--root", type=Path, default=Path("."),
+                        help="Folder holding extracted-products/ and model-poses/ (default: current directory)")
+    parser.add_argument("--widths", default=",".join(map(str, DERIVATIVE_WIDTHS)))
+    parser.add_argument("--formats", default=",".join(DERIVATIVE_FORMATS))
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    build_derivatives(
+        args.root,
+        widths=[int(w) for w in args.widths.split(",") if w.strip()],
+        formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
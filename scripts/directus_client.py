@@ -0,0 +1,303 @@
+"""
+Shared Directus REST client for the Python scripts.
+
+- One pooled requests.Session (keep-alive, retries on 429/5xx) per process
+- Logs in with DIRECTUS_ADMIN_EMAIL / DIRECTUS_ADMIN_PASSWORD, caches the
+  access and refresh tokens in <cache>/directus-token.json and refreshes
+  them before they expire (or on a 401), so scripts don't log in per run
+- Filters and field projection go to the server, never applied client-side
+- Collections are scanned with keyset pagination (id > last id, sorted by
+  id) instead of offsets, which stays fast deep into big tables. For integer
+  ids the id range is split into DIRECTUS_SCAN_WORKERS slices that are
+  scanned in parallel; items are yielded as pages arrive, so callers can
+  start work before the scan finishes and memory stays at a few pages
+
+Environment: DIRECTUS_URL, DIRECTUS_ADMIN_EMAIL, DIRECTUS_ADMIN_PASSWORD,
+DIRECTUS_PAGE_SIZE (default 500), DIRECTUS_SCAN_WORKERS (default 4),
+DIRECTUS_VERIFY_SSL (default on; set 0 to skip certificate checks).
+
+Usage:
+    from directus_client import get_directus_client
+
+    directus = get_directus_client()
+    for product in directus.iter_items("products",
+                                       filter={"model_image_1": {"_null": True}},
+                                       fields=["id", "name", "image_url"]):
+        ...
+    directus.count("products", filter={...})
+    directus.update_many("products", [{"id": 1, "model_image_1": "..."}, ...])
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import get_directus_config, get_cache_dir
+
+PAGE_SIZE = int(os.getenv("DIRECTUS_PAGE_SIZE", "500"))
+SCAN_WORKERS = int(os.getenv("DIRECTUS_SCAN_WORKERS", "4"))
+# Certificates are checked unless DIRECTUS_VERIFY_SSL=0 (the bearer token goes over this connection)
+VERIFY_SSL = os.getenv("DIRECTUS_VERIFY_SSL", "1").lower() not in ("0", "false", "no")
+
+# Refresh the access token this long before Directus says it expires
+TOKEN_MARGIN_SECONDS = 60
+
+TOKEN_FILE = "directus-token.json"
+
+_DONE = object()
+
+
+class DirectusError(RuntimeError):
+    """A Directus request failed; carries the HTTP status and Directus error body."""
+
+    def __init__(self, response: requests.Response):
+        self.status = response.status_code
+        try:
+            errors = response.json().get("errors", [])
+            message = "; ".join(e.get("message", "") for e in errors) or response.text[:200]
+        except ValueError:
+            message = response.text[:200]
+        super().__init__(f"{response.request.method} {response.url} -> {self.status}: {message}")
+
+
+class DirectusClient:
+
+    def __init__(self, url: str, email: str, password: str, workers: int = SCAN_WORKERS,
+                 page_size: int = PAGE_SIZE, verify: bool = VERIFY_SSL):
+        self.url = url.rstrip("/")
+        self.email = email
+        self.password = password
+        self.workers = max(1, workers)
+        self.page_size = page_size
+
+        self.session = requests.Session()
+        retry = Retry(total=4, backoff_factor=1.0, status_forcelist=(429, 502, 503, 504),
+                      allowed_methods=None, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers * 2, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.verify = verify
+        if not verify:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        self._token_lock = threading.Lock()
+        self._token_path = get_cache_dir() / TOKEN_FILE
+        self._tokens = self._load_tokens()
+
+    # -----------------------------------------------------------------------
+    # Authentication
+    # -----------------------------------------------------------------------
+
+    def _load_tokens(self) -> Dict:
+        try:
+            tokens = json.loads(self._token_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if tokens.get("url") != self.url or tokens.get("email") != self.email:
+            return {}
+        return tokens
+
+    def _store_tokens(self, data: Dict):
+        self._tokens = {
+            "url": self.url,
+            "email": self.email,
+            "access_token": data["access_token"],
+            "refresh_token": data.get("refresh_token"),
+            "expires_at": time.time() + data.get("expires", 900_000) / 1000,
+        }
+        tmp = self._token_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self._tokens), encoding="utf-8")
+        os.replace(tmp, self._token_path)
+
+    def _authenticate(self):
+        """Refresh the session with the refresh token, or log in again."""
+        refresh_token = self._tokens.get("refresh_token")
+        if refresh_token:
+            response = self.session.post(f"{self.url}/auth/refresh",
+                                         json={"refresh_token": refresh_token, "mode": "json"})
+            if response.ok:
+                self._store_tokens(response.json()["data"])
+                return
+        response = self.session.post(f"{self.url}/auth/login",
+                                     json={"email": self.email, "password": self.password})
+        if not response.ok:
+            raise DirectusError(response)
+        self._store_tokens(response.json()["data"])
+
+    def token(self, force_refresh: bool = False) -> str:
+        """A valid access token (refreshed shortly before it expires)."""
+        with self._token_lock:
+            if (force_refresh or not self._tokens.get("access_token")
+                    or time.time() > self._tokens.get("expires_at", 0) - TOKEN_MARGIN_SECONDS):
+                self._authenticate()
+            return self._tokens["access_token"]
+
+    # -----------------------------------------------------------------------
+    # Requests
+    # -----------------------------------------------------------------------
+
+    def request(self, method: str, path: str, **kwargs):
+        """Authenticated request; returns the response's "data" (None for 204)."""
+        token = self.token()
+        for attempt in range(2):
+            response = self.session.request(method, f"{self.url}/{path.lstrip('/')}",
+                                            headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            if response.status_code == 401 and attempt == 0:
+                # Revoked or expired early - refresh once and retry
+                token = self.token(force_refresh=True)
+                continue
+            break
+        if not response.ok:
+            raise DirectusError(response)
+        if response.status_code == 204 or not response.content:
+            return None
+        return response.json().get("data")
+
+    def get(self, path: str, params: Optional[Dict] = None):
+        return self.request("GET", path, params=params)
+
+    def patch(self, path: str, payload):
+        return self.request("PATCH", path, json=payload)
+
+    @staticmethod
+    def _query(filter: Optional[Dict] = None, fields: Optional[Sequence[str]] = None, **params) -> Dict:
+        query = {key: value for key, value in params.items() if value is not None}
+        if filter:
+            query["filter"] = json.dumps(filter)
+        if fields:
+            query["fields"] = ",".join(fields)
+        return query
+
+    def count(self, collection: str, filter: Optional[Dict] = None) -> int:
+        data = self.get(f"items/{collection}", self._query(filter, **{"aggregate[count]": "*"}))
+        return int(data[0]["count"]) if data else 0
+
+    def id_range(self, collection: str, filter: Optional[Dict] = None, key: str = "id"):
+        """(min, max) of *key* over the matching items, or None if there are none."""
+        data = self.get(f"items/{collection}",
+                        self._query(filter, **{"aggregate[min]": key, "aggregate[max]": key}))
+        if not data or data[0]["min"][key] is None:
+            return None
+        return data[0]["min"][key], data[0]["max"][key]
+
+    def get_many(self, collection: str, ids: Sequence, fields: Optional[Sequence[str]] = None,
+                 batch_size: int = 100) -> Dict:
+        """{id: item} for *ids*, fetched *batch_size* ids per request."""
+        ids = list(ids)
+        fields = list(fields) if fields else None
+        if fields and "id" not in fields:
+            fields.append("id")
+        items = {}
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            page = self.get(f"items/{collection}",
+                            self._query({"id": {"_in": chunk}}, fields, limit=len(chunk)))
+            items.update((item["id"], item) for item in page or [])
+        return items
+
+    def update_many(self, collection: str, items: List[Dict]):
+        """Batch PATCH: each item carries its "id" plus the fields to change."""
+        return self.patch(f"items/{collection}", items)
+
+    # -----------------------------------------------------------------------
+    # Scans
+    # -----------------------------------------------------------------------
+
+    def _scan(self, collection: str, filter: Optional[Dict], fields: Optional[List[str]],
+              key: str, lower=None, upper=None, page_size: int = PAGE_SIZE) -> Iterator[List[Dict]]:
+        """Pages of items with lower < key <= upper, by keyset pagination."""
+        last = lower
+        while True:
+            bounds = []
+            if last is not None:
+                bounds.append({key: {"_gt": last}})
+            if upper is not None:
+                bounds.append({key: {"_lte": upper}})
+            page_filter = {"_and": ([filter] if filter else []) + bounds} if bounds else filter
+            page = self.get(f"items/{collection}", self._query(page_filter, fields, sort=key, limit=page_size))
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last = page[-1][key]
+
+    def iter_items(self, collection: str, filter: Optional[Dict] = None,
+                   fields: Optional[Sequence[str]] = None, key: str = "id",
+                   page_size: Optional[int] = None) -> Iterator[Dict]:
+        """Every item matching *filter*, streamed as pages arrive.
+
+        Items come in *key* order within a slice; with parallel slices the
+        overall order is not guaranteed.
+        """
+        page_size = page_size or self.page_size
+        fields = list(fields) if fields else None
+        if fields and key not in fields:
+            fields.append(key)  # needed for the keyset cursor
+
+        bounds = self.id_range(collection, filter, key) if self.workers > 1 else None
+        if not bounds or not all(isinstance(b, int) for b in bounds) or bounds[1] - bounds[0] < page_size:
+            for page in self._scan(collection, filter, fields, key, page_size=page_size):
+                yield from page
+            return
+
+        # Split the id range into slices scanned concurrently
+        low, high = bounds
+        step = -(-(high - low + 1) // self.workers)
+        slices = [(start - 1, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+        pages: queue.Queue = queue.Queue(maxsize=self.workers * 2)
+        stop = threading.Event()
+
+        def scan_slice(lower, upper):
+            try:
+                for page in self._scan(collection, filter, fields, key, lower, upper, page_size):
+                    if stop.is_set():
+                        return
+                    pages.put(page)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(_DONE)
+
+        with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+            for lower, upper in slices:
+                executor.submit(scan_slice, lower, upper)
+            remaining = len(slices)
+            try:
+                while remaining:
+                    item = pages.get()
+                    if item is _DONE:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield from item
+            finally:
+                # Consumer stopped early or failed: let the scanners finish
+                stop.set()
+                while remaining:
+                    if pages.get() is _DONE:
+                        remaining -= 1
+
+
+_directus_client = None
+_directus_lock = threading.Lock()
+
+
+def get_directus_client() -> DirectusClient:
+    """Process-wide Directus client built from .env.local."""
+    global _directus_client
+    with _directus_lock:
+        if _directus_client is None:
+            config = get_directus_config()
+            _directus_client = DirectusClient(config["url"], config["email"], config["password"])
+    return _directus_client
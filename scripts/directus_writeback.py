@@ -0,0 +1,103 @@
+"""
+Batched, idempotent write-back of field updates to a Directus collection.
+
+The pipelines produce updates as {item id: {field: value}} (e.g. a
+product's model_image_1..3 after pose generation). write_back:
+
+1. drops updates the job ledger already records as written (same payload
+   hash - stage "directus.<collection>", one unit per item)
+2. reads the current values of the remaining items, DIRECTUS_BATCH_SIZE
+   ids per request, and drops updates Directus already has
+3. sends the rest as batch PATCH requests of DIRECTUS_BATCH_SIZE items
+   (default 100) and records each item in the ledger
+
+Rerunning after a crash only sends what didn't go through. With
+dry_run=True nothing is written; the diff of every pending item is printed
+instead.
+
+Usage:
+    from directus_writeback import write_back
+
+    write_back("products", {42: {"model_image_1": "/products/x.png"}}, dry_run=True)
+"""
+
+import os
+import json
+import hashlib
+from typing import Dict, Optional
+
+import requests
+
+from directus_client import DirectusClient, DirectusError, get_directus_client
+from job_ledger import get_job_ledger
+
+BATCH_SIZE = int(os.getenv("DIRECTUS_BATCH_SIZE", "100"))
+
+
+def payload_fingerprint(payload: Dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def write_back(collection: str, updates: Dict[object, Dict], dry_run: bool = False,
+               batch_size: int = BATCH_SIZE, client: Optional[DirectusClient] = None) -> Dict[str, int]:
+    """Apply *updates* ({id: {field: value}}) to *collection*; returns counts."""
+    client = client or get_directus_client()
+    ledger = get_job_ledger()
+    stage = f"directus.{collection}"
+    stats = {"written": 0, "unchanged": 0, "already_written": 0, "missing": 0, "failed": 0}
+
+    pending = {}
+    for item_id, payload in updates.items():
+        if ledger.is_done(stage, str(item_id), fingerprint=payload_fingerprint(payload)):
+            stats["already_written"] += 1
+        else:
+            pending[item_id] = payload
+
+    fields = sorted({field for payload in pending.values() for field in payload})
+    current = client.get_many(collection, list(pending), fields, batch_size=batch_size) if pending else {}
+
+    changes = {}
+    for item_id, payload in pending.items():
+        item = current.get(item_id)
+        if item is None:
+            print(f"  ⚠ {collection} {item_id} not found in Directus")
+            stats["missing"] += 1
+            continue
+        diff = {field: (item.get(field), value) for field, value in payload.items() if item.get(field) != value}
+        if diff:
+            changes[item_id] = diff
+            continue
+        stats["unchanged"] += 1
+        if not dry_run:
+            ledger.start(stage, str(item_id), fingerprint=payload_fingerprint(payload))
+            ledger.done(stage, str(item_id))
+
+    print(f"Directus {collection}: {len(changes)} to update, {stats['unchanged']} already up to date, "
+          f"{stats['already_written']} written before, {stats['missing']} missing")
+    if dry_run:
+        for item_id, diff in changes.items():
+            print(f"  {collection} {item_id}:")
+            for field, (old, new) in diff.items():
+                print(f"    {field}: {old!r} -> {new!r}")
+        return stats
+
+    ids = list(changes)
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        for item_id in chunk:
+            ledger.start(stage, str(item_id), fingerprint=payload_fingerprint(updates[item_id]))
+        try:
+            client.update_many(collection, [{"id": item_id, **updates[item_id]} for item_id in chunk])
+        except (DirectusError, requests.RequestException) as e:
+            # Rejected, or the connection failed after the session's retries -
+            # either way the ledger records this batch as not written
+            print(f"  ✗ Batch of {len(chunk)} failed: {e}")
+            for item_id in chunk:
+                ledger.failed(stage, str(item_id), error=e)
+            stats["failed"] += len(chunk)
+            continue
+        for item_id in chunk:
+            ledger.done(stage, str(item_id))
+        stats["written"] += len(chunk)
+        print(f"  ✓ Updated {stats['written']}/{len(ids)}")
+    return stats
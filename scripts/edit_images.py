@@ -5,22 +5,20 @@ Uses the 'nana banana pro' theme (Gemini 3 Pro Image Preview).
 """
 
 import os
-import time
 import ssl
 import certifi
 from pathlib import Path
-from config import get_google_api_key
 
 # Workaround for SSL certificate issues
 os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 
-# Initialize Gemini Client
-from google import genai
+# Shared Gemini client pool
 from google.genai import types
+from gemini_client import get_pool
+from image_source import open_image
 
-API_KEY = get_google_api_key()
-client = genai.Client(api_key=API_KEY)
+pool = get_pool()
 MODEL_NAME = "gemini-3-pro-image-preview"
 
 # Configuration
@@ -99,13 +97,6 @@ IMAGE_TASKS = [
     }
 ]
 
-def get_mime_type(path):
-    suffix = path.suffix.lower()
-    if suffix == '.png': return 'image/png'
-    if suffix in ['.jpg', '.jpeg']: return 'image/jpeg'
-    if suffix == '.webp': return 'image/webp'
-    return 'image/jpeg'
-
 def generate_image(task):
     target_rel = task["target"]
     target_path = PUBLIC_DIR / target_rel
@@ -122,9 +113,8 @@ def generate_image(task):
         if src_path.exists():
             print(f"  + Reference: {src_rel}")
             try:
-                img_data = src_path.read_bytes()
-                mime_type = get_mime_type(src_path)
-                parts.append(types.Part.from_bytes(data=img_data, mime_type=mime_type))
+                # Shared sources: tasks reusing a reference image read it once
+                parts.append(open_image(src_path).part())
             except Exception as e:
                 print(f"    Warning: Could not read {src_rel}: {e}")
         else:
@@ -136,7 +126,7 @@ def generate_image(task):
     # Call API
     try:
         print("  > Sending request to Gemini...")
-        response = client.models.generate_content(
+        response = pool.generate_content(
             model=MODEL_NAME,
             contents=[types.Content(role="user", parts=parts)],
             config=types.GenerateContentConfig(
@@ -160,10 +150,8 @@ def generate_image(task):
         return False
 
     except Exception as e:
+        # Rate limits are retried by the pool before we get here
         print(f"  ❌ API Error: {e}")
-        if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-            print("    Rate limit hit. Waiting 30 seconds...")
-            time.sleep(30)
         return False
 
 def main():
@@ -173,11 +161,8 @@ def main():
     print("=" * 70)
     print(f"Target Directory: {PUBLIC_DIR}")
     
-    success_count = 0
-    for task in IMAGE_TASKS:
-        if generate_image(task):
-            success_count += 1
-        time.sleep(5)  # Pause between requests to avoid rate limits
+    # Tasks are independent - the pool caps how many run at once
+    success_count = sum(1 for ok in pool.map(generate_image, IMAGE_TASKS) if ok)
 
     print("\n" + "=" * 70)
     print(f"Workflow Complete. Generated {success_count}/{len(IMAGE_TASKS)} images.")
@@ -7,24 +7,38 @@ Extract ALL garments from fashion images using Gemini 3 Pro Image Preview.
 
 import os
 import json
-import time
-import base64
 import shutil
+import threading
 from pathlib import Path
-from google import genai
 from google.genai import types
-from config import get_google_api_key
+from gemini_client import get_pool
+from file_registry import get_file_registry
+from image_pyramid import pyramid_source
+from analysis_cache import get_analysis_cache
+from analysis_backend import AnalysisRequest, analyze, get_analysis_backend
+from artifact_store import get_artifact_store
+from job_ledger import get_job_ledger, source_fingerprint
+from perceptual_hash import canonical_images
+from staged_pipeline import Stage, run_pipeline
 
-# Configuration - from environment
-API_KEY = get_google_api_key()
+# Configuration
 IMAGE_MODEL = "gemini-3-pro-image-preview"
 ANALYSIS_MODEL = "gemini-2.5-flash"
 
-# Initialize client
-client = genai.Client(api_key=API_KEY)
+# Pyramid level sent with each request (see image_pyramid.py)
+ANALYSIS_LEVEL = "analysis"
+GENERATION_LEVEL = "generation"
+
+# Shared client pool (API key comes from .env.local via config)
+pool = get_pool()
+analysis_cache = get_analysis_cache()
+artifact_store = get_artifact_store()
+analysis_backend = get_analysis_backend()
+ledger = get_job_ledger()
+file_registry = get_file_registry()
 
 # Folders
-WORKSPACE = Path(r"D:\Avadhut\ZCode\Digial Marketing\Zecode-Website\website-raw-images")
+WORKSPACE = Path(os.getenv("ZECODE_WORKSPACE", r"D:\Avadhut\ZCode\Digial Marketing\Zecode-Website\website-raw-images"))
 OUTPUT_FOLDER = WORKSPACE / "extracted-products"
 OUTPUT_FOLDER.mkdir(exist_ok=True)
 
@@ -37,31 +51,12 @@ def get_image_files():
             images.append(f)
     return sorted(images)
 
-def load_image_as_base64(image_path):
-    """Load image and return base64 encoded data."""
-    with open(image_path, 'rb') as f:
-        return base64.b64encode(f.read()).decode('utf-8')
-
-def get_mime_type(image_path):
-    """Get MIME type based on file extension."""
-    ext = image_path.suffix.lower()
-    mime_types = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.webp': 'image/webp',
-        '.gif': 'image/gif',
-        '.bmp': 'image/bmp'
-    }
-    return mime_types.get(ext, 'image/jpeg')
-
-def analyze_all_garments(image_path):
-    """
-    Analyze image to detect ALL models and ALL their garments.
-    Returns detailed list of every garment worn by every person.
+def garment_analysis_request(image_path, source=None):
+    """The garment inventory prompt for *image_path* as an AnalysisRequest.
+    
+    *source* is its analysis-level ImageSource, if the caller already has it.
     """
-    image_data = load_image_as_base64(image_path)
-    mime_type = get_mime_type(image_path)
+    source = source or pyramid_source(image_path, ANALYSIS_LEVEL)
     
     prompt = """Analyze this fashion image carefully. Identify EVERY person/model and EVERY garment they are wearing.
 
@@ -108,41 +103,41 @@ Return as JSON array:
     ]
 }"""
 
+    config = types.GenerateContentConfig(
+        temperature=0.1,
+        response_mime_type="application/json"
+    )
+    
+    return AnalysisRequest(
+        # Unchanged images are served from the on-disk cache
+        key=analysis_cache.key(source.sha256, ANALYSIS_MODEL, prompt, config),
+        model=ANALYSIS_MODEL,
+        source=source,
+        prompt=prompt,
+        config=config,
+        parse=json.loads,
+        name=image_path.name,
+    )
+
+def analyze_all_garments(image_path, source=None):
+    """
+    Analyze image to detect ALL models and ALL their garments.
+    Returns detailed list of every garment worn by every person.
+    """
     try:
-        response = client.models.generate_content(
-            model=ANALYSIS_MODEL,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_bytes(
-                            data=base64.b64decode(image_data),
-                            mime_type=mime_type
-                        ),
-                        types.Part.from_text(text=prompt)
-                    ]
-                )
-            ],
-            config=types.GenerateContentConfig(
-                temperature=0.1,
-                response_mime_type="application/json"
-            )
-        )
-        
-        result = json.loads(response.text)
-        return result
-        
+        return analyze(garment_analysis_request(image_path, source))
     except Exception as e:
         print(f"    Analysis error: {e}")
         return None
 
-def extract_garment_image(image_path, garment_info, original_name):
+def extract_garment_image(image_path, garment_info, original_name, source=None):
     """
     Use Gemini 3 Pro Image Preview to extract a specific garment
     with exact graphics, colors, and details preserved.
+    Returns the artifact-store key of the extracted image, or None.
+    *source* is the generation-level ImageSource, if already resolved.
     """
-    image_data = load_image_as_base64(image_path)
-    mime_type = get_mime_type(image_path)
+    source = source or pyramid_source(image_path, GENERATION_LEVEL)
     
     # Build detailed extraction prompt
     garment_desc = f"{garment_info['primary_color']} {garment_info['garment_type']}"
@@ -177,49 +172,48 @@ The garment should be shown from the front, laid flat as if for an e-commerce li
 PRESERVE ALL GRAPHICS, TEXT, AND PRINTS EXACTLY AS THEY APPEAR - this is critical.
 Do NOT simplify or modify any designs on the garment."""
 
-    max_attempts = 3
-    for attempt in range(max_attempts):
+    temperature = 0.2
+    
+    def generate():
+        max_attempts = 3
+        # Rate limits and transient errors are retried inside the pool; only a
+        # reply without an image is asked again here
         try:
-            response = client.models.generate_content(
-                model=IMAGE_MODEL,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part.from_bytes(
-                                data=base64.b64decode(image_data),
-                                mime_type=mime_type
-                            ),
-                            types.Part.from_text(text=prompt)
-                        ]
+            for attempt in range(max_attempts):
+                response = file_registry.call(source, lambda image_part: pool.generate_content(
+                    model=IMAGE_MODEL,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                image_part,
+                                types.Part.from_text(text=prompt)
+                            ]
+                        )
+                    ],
+                    config=types.GenerateContentConfig(
+                        response_modalities=["IMAGE", "TEXT"],
+                        temperature=temperature
                     )
-                ],
-                config=types.GenerateContentConfig(
-                    response_modalities=["IMAGE", "TEXT"],
-                    temperature=0.2
-                )
-            )
-            
-            # Extract generated image
-            if response.candidates:
-                for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        return part.inline_data.data
-            
-            print(f"    Attempt {attempt+1}: No image generated, retrying...")
-            time.sleep(2)
-            
+                ))
+                
+                # Extract generated image
+                if response.candidates:
+                    for part in response.candidates[0].content.parts:
+                        if hasattr(part, 'inline_data') and part.inline_data:
+                            return part.inline_data.data
+                
+                print(f"    Attempt {attempt+1}: No image generated, retrying...")
+                
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                wait_time = 60 if attempt < max_attempts - 1 else 120
-                print(f"    Rate limited. Waiting {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                print(f"    Error: {error_str[:100]}")
-                time.sleep(3)
+            # No local retry: the pool already retried it, or the daily quota is spent
+            print(f"    Error: {str(e)[:100]}")
+        
+        return None
     
-    return None
+    # Reuse a previously generated image for the same source/descriptor/prompt
+    key = artifact_store.key(source.sha256, garment_info, prompt, IMAGE_MODEL, temperature)
+    return artifact_store.get_or_generate(key, generate, model=IMAGE_MODEL, meta={"source": original_name})
 
 def create_filename(garment_info, original_name, index):
     """Create descriptive filename for the extracted garment."""
@@ -266,84 +260,167 @@ def create_filename(garment_info, original_name, index):
     filename = "".join(c for c in filename if c.isalnum() or c in '_-')
     return filename[:120] + ".png"
 
+# Accessories are not extracted (remove from the list if you want these too)
+SKIP_TYPES = ['shoes', 'sandals', 'sneakers', 'boots', 'bag', 'purse', 'hat', 'cap', 'sunglasses', 'watch', 'jewelry', 'belt', 'socks']
+
 def process_images():
-    """Main processing function."""
+    """Main processing function.
+    
+    Runs as a staged pipeline (see staged_pipeline.py) so stages overlap
+    across images:
+      read     - ledger check, copy the original, build its pyramid levels once
+      analyze  - garment inventory; fans out one task per garment
+      extract  - one image-model call per garment
+      write    - materialize the result and update the ledger
+    Worker counts per stage: GARMENTS_READ_WORKERS, GARMENTS_ANALYSIS_WORKERS,
+    GARMENTS_EXTRACT_WORKERS, GARMENTS_WRITE_WORKERS.
+    """
     print("=" * 70)
     print("GARMENT EXTRACTION - All Models, All Layers")
     print("Using Gemini 3 Pro Image Preview")
     print("=" * 70)
     
-    images = get_image_files()
+    # Only the largest copy of each raw frame goes to Gemini
+    images, _ = canonical_images(get_image_files())
     print(f"\nFound {len(images)} images to process\n")
+
+    # With the batch backend every uncached analysis runs as one job up front
+    analysis_backend.prefetch((garment_analysis_request(p) for p in images), label="garments")
     
-    total_extracted = 0
+    counts = {"extracted": 0, "skipped": 0}
     failed_extractions = []
+    lock = threading.Lock()
+    
+    def finish_image(job):
+        if job['complete']:
+            ledger.done("garments.image", job['name'])
+        else:
+            ledger.failed("garments.image", job['name'], error="some garments failed")
     
-    for img_idx, image_path in enumerate(images, 1):
-        print(f"\n[{img_idx}/{len(images)}] Processing: {image_path.stem}")
+    def read_image(item):
+        img_idx, image_path = item
+        # Images whose garments were all extracted are skipped via the ledger
+        fingerprint = source_fingerprint(image_path)
+        if ledger.is_done("garments.image", image_path.name, fingerprint=fingerprint):
+            print(f"[{img_idx}/{len(images)}] Skipping (already done): {image_path.stem}")
+            with lock:
+                counts["skipped"] += 1
+            return None
+        
+        print(f"[{img_idx}/{len(images)}] Reading: {image_path.stem}")
         
         # Copy original image for reference
         original_copy_name = f"ORIGINAL_{image_path.stem}{image_path.suffix}"
         original_copy_path = OUTPUT_FOLDER / original_copy_name
-        shutil.copy2(image_path, original_copy_path)
-        print(f"  Saved original: {original_copy_name}")
+        if not original_copy_path.exists():
+            shutil.copy2(image_path, original_copy_path)
         
-        # Step 1: Analyze all garments in image
-        print("  Analyzing all models and garments...")
-        analysis = analyze_all_garments(image_path)
+        # Read the workspace file once; later stages use the local pyramid copies
+        # held on the job, so they never go back to the original
+        return {"path": image_path, "name": image_path.name, "fingerprint": fingerprint,
+                "analysis_source": pyramid_source(image_path, ANALYSIS_LEVEL),
+                "generation_source": pyramid_source(image_path, GENERATION_LEVEL),
+                "pending": 0, "complete": True}
+    
+    def analyze_image(job):
+        image_path, fingerprint = job['path'], job['fingerprint']
+        ledger.start("garments.analysis", job['name'], fingerprint=fingerprint)
+        analysis = analyze_all_garments(image_path, job['analysis_source'])
         
         if not analysis or not analysis.get('garments'):
-            print("  ⚠ Could not analyze garments")
-            failed_extractions.append((image_path.name, "Analysis failed"))
-            continue
+            print(f"  ⚠ {image_path.stem}: could not analyze garments")
+            ledger.failed("garments.analysis", job['name'], error="analysis failed")
+            with lock:
+                failed_extractions.append((job['name'], "Analysis failed"))
+            return None
+        ledger.done("garments.analysis", job['name'])
         
         garments = analysis['garments']
         total_models = analysis.get('total_models', 1)
-        print(f"  Found {total_models} model(s) with {len(garments)} garment(s)")
+        print(f"  {image_path.stem}: {total_models} model(s) with {len(garments)} garment(s)")
         
-        # Step 2: Extract each garment
+        tasks = []
         for g_idx, garment in enumerate(garments, 1):
             garment_type = garment.get('garment_type', 'unknown')
-            layer = garment.get('layer', 'main')
-            model_num = garment.get('model_number', 1)
-            color = garment.get('primary_color', '')
-            
-            print(f"  [{g_idx}/{len(garments)}] Model {model_num}: {color} {garment_type} ({layer})")
-            
-            # Skip accessories like shoes, bags, etc. (optional - remove if you want these too)
-            skip_types = ['shoes', 'sandals', 'sneakers', 'boots', 'bag', 'purse', 'hat', 'cap', 'sunglasses', 'watch', 'jewelry', 'belt', 'socks']
-            if garment_type.lower() in skip_types:
-                print(f"    Skipping accessory: {garment_type}")
+            if garment_type.lower() in SKIP_TYPES:
                 continue
             
-            # Extract the garment
-            image_data = extract_garment_image(image_path, garment, image_path.stem)
-            
-            if image_data:
-                # Save the extracted image
-                filename = create_filename(garment, image_path.stem, g_idx)
+            unit = f"{g_idx}:{garment_type}"
+            if ledger.is_done("garments.extract", job['name'], unit, fingerprint):
+                continue
+            if not ledger.should_run("garments.extract", job['name'], unit, fingerprint):
+                print(f"    {image_path.stem} [{unit}]: giving up after repeated failures (see job_ledger.py failures)")
+                job['complete'] = False
+                continue
+            tasks.append({"job": job, "g_idx": g_idx, "garment": garment, "unit": unit})
+        
+        ledger.start("garments.image", job['name'], fingerprint=fingerprint)
+        job['pending'] = len(tasks)
+        if not tasks:
+            finish_image(job)
+            return None
+        return tasks
+    
+    def extract(task):
+        job, garment = task['job'], task['garment']
+        ledger.start("garments.extract", job['name'], task['unit'], job['fingerprint'])
+        try:
+            task['artifact_key'] = extract_garment_image(job['path'], garment, job['path'].stem,
+                                                         job['generation_source'])
+        except Exception as e:
+            print(f"    Error: {str(e)[:100]}")
+            task['artifact_key'] = None
+        return task
+    
+    def write(task):
+        job, garment, unit = task['job'], task['garment'], task['unit']
+        label = f"{garment.get('primary_color', '')} {garment.get('garment_type', 'unknown')} ({garment.get('layer', 'main')})"
+        saved = False
+        try:
+            if task['artifact_key']:
+                # Save the extracted image (a view over the artifact store)
+                filename = create_filename(garment, job['path'].stem, task['g_idx'])
                 output_path = OUTPUT_FOLDER / filename
-                
-                with open(output_path, 'wb') as f:
-                    f.write(image_data)
-                
+                artifact_store.materialize(task['artifact_key'], output_path)
+                ledger.done("garments.extract", job['name'], unit, output_path)
+                saved = True
                 print(f"    ✓ Saved: {filename}")
-                total_extracted += 1
             else:
-                print(f"    ✗ Failed to extract")
-                failed_extractions.append((image_path.name, f"{garment_type} ({layer})"))
-            
-            # Small delay between garments
-            time.sleep(2)
-        
-        # Delay between images
-        time.sleep(3)
+                print(f"    ✗ Failed to extract {label} from {job['path'].stem}")
+                ledger.failed("garments.extract", job['name'], unit, error="no image generated")
+        except Exception as e:
+            print(f"    ✗ Failed to save {label} from {job['path'].stem}: {e}")
+            ledger.failed("garments.extract", job['name'], unit, error=e)
+        finally:
+            # The image is finished once every garment is accounted for, even on errors
+            with lock:
+                if saved:
+                    counts["extracted"] += 1
+                else:
+                    failed_extractions.append((job['name'], label))
+                    job['complete'] = False
+                job['pending'] -= 1
+                last = job['pending'] == 0
+            if last:
+                finish_image(job)
+        return task
+    
+    run_pipeline(enumerate(images, 1), [
+        Stage.from_env("read", read_image, "GARMENTS_READ_WORKERS", 2),
+        Stage.from_env("analyze", analyze_image, "GARMENTS_ANALYSIS_WORKERS", 4),
+        Stage.from_env("extract", extract, "GARMENTS_EXTRACT_WORKERS", 8),
+        Stage.from_env("write", write, "GARMENTS_WRITE_WORKERS", 2),
+    ])
     
     # Summary
     print("\n" + "=" * 70)
     print("EXTRACTION COMPLETE")
     print("=" * 70)
-    print(f"Total garments extracted: {total_extracted}")
+    print(f"Skipped (already done): {counts['skipped']}")
+    print(f"Total garments extracted: {counts['extracted']}")
+    print(f"{analysis_cache.stats()}")
+    print(f"{artifact_store.stats()}")
+    print(f"{file_registry.stats()}")
     print(f"Failed extractions: {len(failed_extractions)}")
     
     if failed_extractions:
@@ -5,24 +5,38 @@ Uses Gemini 3 Pro Image Preview for high-quality model extraction and pose gener
 
 import os
 import json
-import time
-import base64
 import shutil
+from collections import Counter
 from pathlib import Path
-from google import genai
 from google.genai import types
-from config import get_google_api_key
+from gemini_client import get_pool
+from file_registry import get_file_registry
+from image_pyramid import pyramid_source
+from analysis_cache import get_analysis_cache
+from analysis_backend import AnalysisRequest, analyze, get_analysis_backend
+from artifact_store import get_artifact_store
+from job_ledger import get_job_ledger, source_fingerprint
+from perceptual_hash import canonical_images
+from pose_index import PoseIndex, source_key
 
-# Configuration - from environment
-API_KEY = get_google_api_key()
+# Configuration
 IMAGE_MODEL = "gemini-2.0-flash-exp-image-generation"  # Working model for image gen
 ANALYSIS_MODEL = "gemini-2.5-flash"
 
-# Initialize client
-client = genai.Client(api_key=API_KEY)
+# Pyramid level sent with each request (see image_pyramid.py)
+ANALYSIS_LEVEL = "analysis"
+GENERATION_LEVEL = "generation"
+
+# Shared client pool (API key comes from .env.local via config)
+pool = get_pool()
+analysis_cache = get_analysis_cache()
+artifact_store = get_artifact_store()
+analysis_backend = get_analysis_backend()
+ledger = get_job_ledger()
+file_registry = get_file_registry()
 
 # Folders
-WORKSPACE = Path(r"D:\Avadhut\ZCode\Digial Marketing\Zecode-Website\website-raw-images")
+WORKSPACE = Path(os.getenv("ZECODE_WORKSPACE", r"D:\Avadhut\ZCode\Digial Marketing\Zecode-Website\website-raw-images"))
 OUTPUT_FOLDER = WORKSPACE / "model-poses"
 OUTPUT_FOLDER.mkdir(exist_ok=True)
 
@@ -51,31 +65,9 @@ def get_image_files():
             images.append(f)
     return sorted(images)
 
-def load_image_as_base64(image_path):
-    """Load image and return base64 encoded data."""
-    with open(image_path, 'rb') as f:
-        return base64.b64encode(f.read()).decode('utf-8')
-
-def get_mime_type(image_path):
-    """Get MIME type based on file extension."""
-    ext = image_path.suffix.lower()
-    mime_types = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.webp': 'image/webp',
-        '.gif': 'image/gif',
-        '.bmp': 'image/bmp'
-    }
-    return mime_types.get(ext, 'image/jpeg')
-
-def analyze_models_in_image(image_path):
-    """
-    Analyze image to detect all models and their outfits.
-    Returns details about each model for pose generation.
-    """
-    image_data = load_image_as_base64(image_path)
-    mime_type = get_mime_type(image_path)
+def model_analysis_request(image_path):
+    """The model description prompt for *image_path* as an AnalysisRequest."""
+    source = pyramid_source(image_path, ANALYSIS_LEVEL)
     
     prompt = """Analyze this fashion image and identify each model/person.
 
@@ -112,30 +104,29 @@ Return as JSON:
     ]
 }"""
 
+    config = types.GenerateContentConfig(
+        temperature=0.1,
+        response_mime_type="application/json"
+    )
+    
+    return AnalysisRequest(
+        # Unchanged images are served from the on-disk cache
+        key=analysis_cache.key(source.sha256, ANALYSIS_MODEL, prompt, config),
+        model=ANALYSIS_MODEL,
+        source=source,
+        prompt=prompt,
+        config=config,
+        parse=json.loads,
+        name=image_path.name,
+    )
+
+def analyze_models_in_image(image_path):
+    """
+    Analyze image to detect all models and their outfits.
+    Returns details about each model for pose generation.
+    """
     try:
-        response = client.models.generate_content(
-            model=ANALYSIS_MODEL,
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=[
-                        types.Part.from_bytes(
-                            data=base64.b64decode(image_data),
-                            mime_type=mime_type
-                        ),
-                        types.Part.from_text(text=prompt)
-                    ]
-                )
-            ],
-            config=types.GenerateContentConfig(
-                temperature=0.1,
-                response_mime_type="application/json"
-            )
-        )
-        
-        result = json.loads(response.text)
-        return result
-        
+        return analyze(model_analysis_request(image_path))
     except Exception as e:
         print(f"    Analysis error: {e}")
         return None
@@ -144,9 +135,9 @@ def generate_model_pose(image_path, model_info, pose_info, original_name):
     """
     Generate a specific pose variation of the model.
     Preserves the exact outfit, colors, and model appearance.
+    Returns the artifact-store key of the generated pose, or None.
     """
-    image_data = load_image_as_base64(image_path)
-    mime_type = get_mime_type(image_path)
+    source = pyramid_source(image_path, GENERATION_LEVEL)
     
     # Build detailed prompt for pose generation
     model_desc = f"{model_info.get('gender', 'person')}"
@@ -188,49 +179,48 @@ CRITICAL REQUIREMENTS:
 
 Generate a professional product photography image of this model in the new pose."""
 
-    max_attempts = 3
-    for attempt in range(max_attempts):
+    temperature = 0.3
+    
+    def generate():
+        max_attempts = 3
+        # Rate limits and transient errors are retried inside the pool; only a
+        # reply without an image is asked again here
         try:
-            response = client.models.generate_content(
-                model=IMAGE_MODEL,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part.from_bytes(
-                                data=base64.b64decode(image_data),
-                                mime_type=mime_type
-                            ),
-                            types.Part.from_text(text=prompt)
-                        ]
+            for attempt in range(max_attempts):
+                response = file_registry.call(source, lambda image_part: pool.generate_content(
+                    model=IMAGE_MODEL,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                image_part,
+                                types.Part.from_text(text=prompt)
+                            ]
+                        )
+                    ],
+                    config=types.GenerateContentConfig(
+                        response_modalities=["IMAGE", "TEXT"],
+                        temperature=temperature
                     )
-                ],
-                config=types.GenerateContentConfig(
-                    response_modalities=["IMAGE", "TEXT"],
-                    temperature=0.3
-                )
-            )
-            
-            # Extract generated image
-            if response.candidates:
-                for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        return part.inline_data.data
-            
-            print(f"      Attempt {attempt+1}: No image generated, retrying...")
-            time.sleep(2)
-            
+                ))
+                
+                # Extract generated image
+                if response.candidates:
+                    for part in response.candidates[0].content.parts:
+                        if hasattr(part, 'inline_data') and part.inline_data:
+                            return part.inline_data.data
+                
+                print(f"      Attempt {attempt+1}: No image generated, retrying...")
+                
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                wait_time = 60 if attempt < max_attempts - 1 else 120
-                print(f"      Rate limited. Waiting {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                print(f"      Error: {error_str[:80]}")
-                time.sleep(3)
+            # No local retry: the pool already retried it, or the daily quota is spent
+            print(f"      Error: {str(e)[:80]}")
+        
+        return None
     
-    return None
+    # Reuse a previously generated image for the same source/descriptor/prompt
+    key = artifact_store.key(source.sha256, {"model": model_info, "pose": pose_info}, prompt, IMAGE_MODEL, temperature)
+    return artifact_store.get_or_generate(key, generate, model=IMAGE_MODEL, meta={"source": original_name})
 
 def create_filename(model_info, pose_name, original_name, model_num):
     """Create descriptive filename for the model pose."""
@@ -259,24 +249,20 @@ def create_filename(model_info, pose_name, original_name, model_num):
     filename = "".join(c for c in filename if c.isalnum() or c in '_-')
     return filename[:120] + ".png"
 
-def get_already_processed():
-    """Get list of source images that already have poses generated."""
-    processed = set()
-    for f in OUTPUT_FOLDER.glob('*.png'):
-        name = f.stem
-        if 'ORIGINAL' in name:
-            continue
-        # Extract source reference from pose filename
-        # Format: gender_style_pose_source or modelN_gender_style_pose_source
-        parts = name.split('_')
-        # Find DSC or similar source markers
-        for i, part in enumerate(parts):
-            if part.startswith('DSC') or part.startswith('SONY') or part.startswith('file'):
-                # Reconstruct source name
-                source = '_'.join(parts[i:])
-                processed.add(source.lower())
-                break
-    return processed
+def seed_pose(image_path, unit, fingerprint, existing):
+    """Record a pose generated before the job ledger existed as a done unit.
+    
+    Only units the ledger has never seen are seeded, from a pose file that
+    is still on disk; returns True if the unit was seeded.
+    """
+    if not existing or ledger.get("poses.generate", image_path.name, unit) is not None:
+        return False
+    output_path = OUTPUT_FOLDER / existing
+    if not output_path.exists():
+        return False
+    ledger.start("poses.generate", image_path.name, unit, fingerprint)
+    ledger.done("poses.generate", image_path.name, unit, output_path)
+    return True
 
 def process_images():
     """Main processing function."""
@@ -285,21 +271,32 @@ def process_images():
     print("Using Gemini 2.0 Flash Exp Image Generation")
     print("=" * 70)
     
-    images = get_image_files()
-    already_processed = get_already_processed()
+    # Only the largest copy of each raw frame goes to Gemini
+    images, _ = canonical_images(get_image_files())
+    # Existing poses by canonical source key (persisted, rescanned only on change)
+    pose_index = PoseIndex.load(OUTPUT_FOLDER)
+    # Distinct images sharing a key (e.g. the same Sony frame from two shoots)
+    # can't tell whose poses the index holds - those rely on the ledger alone
+    key_counts = Counter(source_key(p.stem) for p in images)
+    ambiguous = {key for key, n in key_counts.items() if n > 1}
+    if ambiguous:
+        print(f"⚠ {len(ambiguous)} source key(s) shared by several images; not using the pose index for them")
     
     print(f"\nFound {len(images)} total images")
-    print(f"Already processed: {len(already_processed)} images")
+    print(f"Existing poses: {len(pose_index)}")
     print(f"Will generate {len(POSE_VARIATIONS)} poses per model\n")
+
+    # With the batch backend every uncached analysis runs as one job up front
+    analysis_backend.prefetch((model_analysis_request(p) for p in images), label="models")
     
     total_generated = 0
     failed_generations = []
     skipped = 0
     
     for img_idx, image_path in enumerate(images, 1):
-        # Check if already processed
-        stem_lower = image_path.stem.lower().replace(' ', '_')
-        if any(stem_lower in proc or proc in stem_lower for proc in already_processed):
+        # Only the ledger decides whether an image is done; failed poses are retried below
+        fingerprint = source_fingerprint(image_path)
+        if ledger.is_done("poses.image", image_path.name, fingerprint=fingerprint):
             print(f"[{img_idx}/{len(images)}] Skipping (already done): {image_path.stem}")
             skipped += 1
             continue
@@ -315,17 +312,22 @@ def process_images():
         
         # Step 1: Analyze models in image
         print("  Analyzing models...")
+        ledger.start("poses.analysis", image_path.name, fingerprint=fingerprint)
         analysis = analyze_models_in_image(image_path)
         
         if not analysis or not analysis.get('models'):
             print("  ⚠ Could not analyze models")
+            ledger.failed("poses.analysis", image_path.name, error="analysis failed")
             failed_generations.append((image_path.name, "Analysis failed"))
             continue
+        ledger.done("poses.analysis", image_path.name)
         
         models = analysis['models']
         print(f"  Found {len(models)} model(s)")
         
         # Step 2: Generate poses for each model
+        ledger.start("poses.image", image_path.name, fingerprint=fingerprint)
+        image_complete = True
         for model in models:
             model_num = model.get('model_number', 1)
             gender = model.get('gender', 'model')
@@ -333,34 +335,58 @@ def process_images():
             
             print(f"\n  Model {model_num}: {gender}, {style} style")
             
-            # Generate each pose variation
-            for pose_idx, pose in enumerate(POSE_VARIATIONS, 1):
-                print(f"    [{pose_idx}/3] Generating {pose['name']} pose...")
-                
-                image_data = generate_model_pose(image_path, model, pose, image_path.stem)
+            # Only poses the ledger doesn't have yet (failed ones are retried);
+            # poses already in the index from before the ledger count as done
+            pending = []
+            for pose in POSE_VARIATIONS:
+                unit = f"model{model_num}:{pose['name']}"
+                key = source_key(image_path.stem)
+                existing = None if key in ambiguous else pose_index.lookup(key, gender, pose['name'], model_num)
+                if seed_pose(image_path, unit, fingerprint, existing):
+                    continue
+                if ledger.is_done("poses.generate", image_path.name, unit, fingerprint):
+                    continue
+                if not ledger.should_run("poses.generate", image_path.name, unit, fingerprint):
+                    print(f"    {pose['name']}: giving up after repeated failures")
+                    image_complete = False
+                    continue
+                ledger.start("poses.generate", image_path.name, unit, fingerprint)
+                pending.append((pose, unit))
+            if not pending:
+                print("    All poses already generated")
+                continue
+            
+            # Generate the pose variations concurrently on the shared pool
+            print(f"    Generating {len(pending)} poses...")
+            pose_results = pool.map(
+                lambda item: generate_model_pose(image_path, model, item[0], image_path.stem),
+                pending
+            )
+            
+            for pose_idx, ((pose, unit), artifact_key) in enumerate(zip(pending, pose_results), 1):
+                print(f"    [{pose_idx}/{len(pending)}] {pose['name']}:")
                 
-                if image_data:
-                    # Save the generated pose
+                if artifact_key:
+                    # Save the generated pose (a view over the artifact store)
                     filename = create_filename(model, pose['name'], image_path.stem, model_num)
                     output_path = OUTPUT_FOLDER / filename
-                    
-                    with open(output_path, 'wb') as f:
-                        f.write(image_data)
+                    artifact_store.materialize(artifact_key, output_path)
+                    ledger.done("poses.generate", image_path.name, unit, output_path)
+                    pose_index.add(filename)
                     
                     print(f"      ✓ Saved: {filename}")
                     total_generated += 1
                 else:
                     print(f"      ✗ Failed to generate")
+                    ledger.failed("poses.generate", image_path.name, unit, error="no image generated")
                     failed_generations.append((image_path.name, f"Model {model_num} - {pose['name']}"))
-                
-                # Delay between poses
-                time.sleep(2)
-            
-            # Delay between models
-            time.sleep(2)
+                    image_complete = False
         
-        # Delay between images
-        time.sleep(3)
+        if image_complete:
+            ledger.done("poses.image", image_path.name)
+        else:
+            ledger.failed("poses.image", image_path.name, error="some poses failed")
+        pose_index.save()
     
     # Summary
     print("\n" + "=" * 70)
@@ -368,6 +394,9 @@ def process_images():
     print("=" * 70)
     print(f"Skipped (already processed): {skipped}")
     print(f"Total poses generated: {total_generated}")
+    print(f"{analysis_cache.stats()}")
+    print(f"{artifact_store.stats()}")
+    print(f"{file_registry.stats()}")
     print(f"Failed generations: {len(failed_generations)}")
     
     if failed_generations:
@@ -1,16 +1,54 @@
 """
 Batch Outfit Extraction using Gemini 3 Pro Image (Nano Banana Pro)
 Uses Google GenAI SDK for high-throughput processing
+
+Runs the whole extraction as one Batch API job (higher limits, lower price -
+meant for overnight catalogue refreshes):
+1. Upload images in parallel (reused through the file registry)
+2. Write the JSONL request file and submit the job
+3. Poll until the job finishes, download the results file
+4. Decode each response's JSON analysis + inline image into extracted-outfits/
+   with the same build_filename naming as extract_with_nano_banana.py
+
+Progress is kept in batch_state.json, so rerunning after a crash resumes the
+submitted job instead of submitting a new one.
+
+Usage:
+    python extract_outfits_batch.py [--input DIR] [--new]
 """
 
 import os
 import json
-import time
+import argparse
 import urllib3
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
-from google import genai
 from google.genai import types
+from gemini_client import GeminiPool, get_pool
+from image_source import open_image
+from file_registry import get_file_registry
+from artifact_store import get_artifact_store
+from outfit_naming import build_filename, OUTPUT_FOLDER
+import batch_jobs
+from batch_jobs import BATCH_MIN_TTL
+
+STATE_FILE = "batch_state.json"
+
+PROMPT = """
+Task 1: Analyze this fashion image and return a JSON object with:
+{
+    "gender": "male/female/unisex",
+    "primary_color": "color",
+    "garment_type": "type",
+    "fit_style": "style",
+    "graphics": ["description of each graphic/print"],
+    "text_on_clothing": "text"
+}
+
+Task 2: Remove the background and isolate the main clothing item on a pure white background. Preserve all details.
+"""
+TEMPERATURE = 0.4
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -40,23 +78,61 @@ def patched_client(*args, **kwargs):
     return original_client(*args, **kwargs)
 httpx.Client = patched_client
 
+
+def parse_analysis_text(text: str) -> Dict:
+    """Parse the JSON analysis out of a response's text parts."""
+    text = text.strip()
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        return {}
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+
+
 class NanaBananaBatchExtractor:
     """Extract outfits using Gemini Batch API via SDK"""
-    
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.getenv('GOOGLE_API_KEY')
-        if not self.api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable must be set")
-        
-        # Initialize SDK Client
-        self.client = genai.Client(api_key=self.api_key)
-        self.model = "gemini-3-pro-image-preview" 
-        
+
+    def __init__(self, api_key: Optional[str] = None, state_path: Optional[Path] = None):
+        # Shared keep-alive client unless a specific key is requested
+        self.pool = GeminiPool(api_key=api_key) if api_key else get_pool()
+        self.client = self.pool.client
+        self.registry = get_file_registry(self.pool)
+        self.artifact_store = get_artifact_store()
+        self.model = "gemini-3-pro-image-preview"
+        self.state_path = state_path
+        self.state = {}
+
+    # -----------------------------------------------------------------------
+    # Resumable state
+    # -----------------------------------------------------------------------
+
+    def load_state(self) -> Dict:
+        if self.state_path and self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        return self.state
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    # -----------------------------------------------------------------------
+    # Request preparation
+    # -----------------------------------------------------------------------
+
     def upload_file(self, file_path: Path):
-        """Upload a file to Gemini File API"""
+        """Upload a file to Gemini File API (reused while a previous upload is live)"""
         print(f"  Uploading {file_path.name}...")
         try:
-            file_obj = self.client.files.upload(file=file_path)
+            file_obj = self.registry.upload(open_image(file_path), min_ttl=BATCH_MIN_TTL)
             print(f"  ✓ Uploaded: {file_obj.name}")
             return file_obj
         except Exception as e:
@@ -64,128 +140,202 @@ class NanaBananaBatchExtractor:
             raise
 
     def create_batch_requests(self, images: List[Path], output_path: Path) -> Path:
-        """Create JSONL file for batch requests"""
+        """Upload images in parallel and write the JSONL request file.
+
+        Each request's custom_id (the JSONL "key") is recorded in the state
+        with its source image, so results and errors map back to files.
+        """
         print(f"\nPreparing batch requests for {len(images)} images...")
         print(f"Writing to: {output_path}")
-        
+
+        def upload(img_path):
+            try:
+                return self.upload_file(img_path)
+            except Exception as e:
+                return e
+
+        uploads = self.pool.map(upload, images)
+
+        requests = {}
+        errors = {}
         with open(output_path, 'w') as f:
-            for i, img_path in enumerate(images):
-                # Upload image first
-                try:
-                    file_obj = self.upload_file(img_path)
-                except Exception:
+            for i, (img_path, file_obj) in enumerate(zip(images, uploads), start=1):
+                custom_id = f"req_{i}_{img_path.stem}"
+                if isinstance(file_obj, Exception):
+                    errors[custom_id] = f"upload failed: {file_obj}"
                     continue
-                
-                # Create prompt
-                prompt = """
-                Task 1: Analyze this fashion image and return a JSON object with:
-                {
-                    "gender": "male/female/unisex",
-                    "primary_color": "color",
-                    "garment_type": "type",
-                    "fit_style": "style",
-                    "has_graphics": true/false,
-                    "text_on_clothing": "text"
-                }
-                
-                Task 2: Remove the background and isolate the main clothing item on a pure white background. Preserve all details.
-                """
-                
-                # Construct request object for JSONL
+
+                # The Gemini Batch API identifies requests by "key"
                 request = {
-                    "custom_id": f"req_{i}_{img_path.stem}",
+                    "key": custom_id,
                     "request": {
                         "contents": [
                             {
                                 "role": "user",
                                 "parts": [
-                                    {"text": prompt},
+                                    {"text": PROMPT},
                                     {"file_data": {"file_uri": file_obj.uri, "mime_type": file_obj.mime_type}}
                                 ]
                             }
                         ],
                         "generationConfig": {
                             "responseModalities": ["TEXT", "IMAGE"],
-                            "temperature": 0.4
+                            "temperature": TEMPERATURE
                         }
                     }
                 }
-                
                 f.write(json.dumps(request) + '\n')
-                
+                requests[custom_id] = {
+                    "source": str(img_path),
+                    "sha256": open_image(img_path).sha256,
+                    "index": i,
+                }
+
+        self.state.update({"requests": requests, "errors": errors, "saved": {}})
+        self.save_state()
+        print(f"  {len(requests)} request(s) written, {len(errors)} upload failure(s)")
         return output_path
 
     def submit_batch_job(self, jsonl_path: Path):
         """Submit the batch job"""
-        print("\nSubmitting batch job...")
-        
-        # Upload JSONL file with explicit MIME type
-        batch_input_file = self.client.files.upload(file=str(jsonl_path), mime_type='application/json')
-        print(f"  Uploaded batch input file: {batch_input_file.name}")
-        
-        # Create Batch Job
         try:
-            job = self.client.batches.create(
-                model=self.model,
-                src=batch_input_file.name,
-                config={'display_name': 'outfit_extraction_batch'}
-            )
-            print(f"✓ Job created: {job.name}")
-            return job.name
+            job_name = batch_jobs.submit_jsonl(self.client, self.model, jsonl_path, 'outfit_extraction_batch')
         except Exception as e:
             print(f"✗ Failed to create batch job: {e}")
             raise
+        self.state.update({"job_name": job_name, "submitted": datetime.now().isoformat()})
+        self.save_state()
+        return job_name
+
+    # -----------------------------------------------------------------------
+    # Job monitoring and results
+    # -----------------------------------------------------------------------
 
     def wait_for_job(self, job_name: str):
-        """Wait for job completion"""
-        print("\nWaiting for job completion...")
-        
-        while True:
-            job = self.client.batches.get(name=job_name)
-            state = job.state
-            
-            print(f"  Status: {state}")
-            
-            if state == "JOB_STATE_SUCCEEDED":
-                return job
-            elif str(state) in ["JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "FAILED", "CANCELLED"]:
-                print(f"✗ Job failed: {job.error}")
-                return None
-                
-            time.sleep(30)
+        """Wait for job completion; returns the finished job or None on failure"""
+        job = batch_jobs.wait_for_job(self.client, job_name)
+        if job is None:
+            self.state["job_state"] = "failed"
+            self.save_state()
+        return job
+
+    def download_results(self, job, results_path: Path) -> Path:
+        """Download the job's JSONL results file (once)"""
+        if results_path.exists() and self.state.get("results_file") == job.dest.file_name:
+            return results_path
+        batch_jobs.download_results(self.client, job, results_path)
+        self.state["results_file"] = job.dest.file_name
+        self.save_state()
+        return results_path
+
+    def save_result(self, custom_id: str, response: types.GenerateContentResponse):
+        """Decode one response into extracted-outfits/; raises ValueError if unusable"""
+        meta = self.state["requests"].get(custom_id)
+        if meta is None:
+            raise ValueError("unknown custom_id")
+        if not response.candidates or not response.candidates[0].content:
+            reason = response.prompt_feedback.block_reason if response.prompt_feedback else "no candidates"
+            raise ValueError(f"empty response ({reason})")
+
+        text = ""
+        image_bytes = None
+        for part in response.candidates[0].content.parts or []:
+            if part.text:
+                text += part.text
+            elif part.inline_data and part.inline_data.data and image_bytes is None:
+                image_bytes = part.inline_data.data
+        if image_bytes is None:
+            raise ValueError("no image in response")
+
+        analysis = parse_analysis_text(text)
+        key = self.artifact_store.key(meta["sha256"], {"batch": analysis}, PROMPT, self.model, TEMPERATURE)
+        self.artifact_store.put(key, image_bytes, model=self.model, meta={"source": Path(meta["source"]).name})
+        out_path = OUTPUT_FOLDER / build_filename(analysis, meta["index"])
+        self.artifact_store.materialize(key, out_path)
+        return out_path
+
+    def process_results(self, results_path: Path):
+        """Save every successful response; record errors per custom_id"""
+        saved = self.state.setdefault("saved", {})
+        errors = self.state.setdefault("errors", {})
+        for custom_id, response, error in batch_jobs.iter_results(results_path):
+            if custom_id in saved:
+                continue
+            if error:
+                errors[custom_id] = error
+                continue
+            try:
+                out_path = self.save_result(custom_id, response)
+                saved[custom_id] = out_path.name
+                errors.pop(custom_id, None)
+                print(f"  ✓ {custom_id} → {out_path.name}")
+            except Exception as e:
+                errors[custom_id] = str(e)
+        self.state["completed"] = datetime.now().isoformat()
+        self.save_state()
+
+        print(f"\nSaved: {len(saved)}  Errors: {len(errors)}")
+        for custom_id, message in sorted(errors.items()):
+            source = self.state["requests"].get(custom_id, {}).get("source", custom_id)
+            print(f"  ✗ {Path(source).name}: {message}")
+
+    def run(self, images: List[Path], jsonl_path: Path, results_path: Path):
+        """Submit (or resume) the job and save its results"""
+        self.load_state()
+        if self.state.get("completed"):
+            print(f"Previous job {self.state.get('job_name')} already processed - use --new to start another.")
+            return
+        job_name = self.state.get("job_name")
+        if job_name:
+            print(f"Resuming job: {job_name}")
+        else:
+            self.create_batch_requests(images, jsonl_path)
+            if not self.state["requests"]:
+                print("No requests to submit.")
+                return
+            job_name = self.submit_batch_job(jsonl_path)
+
+        job = self.wait_for_job(job_name)
+        if job is None:
+            return
+        self.process_results(self.download_results(job, results_path))
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract outfits with the Gemini Batch API")
+    parser.add_argument("--input", type=Path, default=Path(__file__).parent.resolve(), help="Folder of raw images")
+    parser.add_argument("--new", action="store_true", help="Discard saved job state and submit a new job")
+    args = parser.parse_args()
+
     print("NANO BANANA BATCH EXTRACTOR (SDK)")
-    
-    extractor = NanaBananaBatchExtractor()
-    
-    input_dir = Path(__file__).parent.resolve()
+
+    input_dir = args.input.resolve()
     print(f"Input directory: {input_dir}")
-    
+    state_path = input_dir / STATE_FILE
+    if args.new and state_path.exists():
+        state_path.unlink()
+
+    extractor = NanaBananaBatchExtractor(state_path=state_path)
+
     # Get images
     extensions = {'.jpg', '.jpeg', '.png'}
-    images = [f for f in input_dir.iterdir() if f.suffix.lower() in extensions]
+    images = sorted(f for f in input_dir.iterdir() if f.suffix.lower() in extensions)
     print(f"Found {len(images)} images.")
-    
-    if not images:
+
+    if not images and not state_path.exists():
         print("No images found.")
         return
 
-    # Create batch file
     jsonl_path = (input_dir / "batch_requests.jsonl").resolve()
+    results_path = (input_dir / "batch_results.jsonl").resolve()
     print(f"JSONL path: {jsonl_path}")
-    
-    jsonl_path_str = extractor.create_batch_requests(images, jsonl_path)
-    print(f"Created JSONL at: {jsonl_path_str}")
-    
-    # Submit job
+
     try:
-        job_name = extractor.submit_batch_job(jsonl_path)
-        
-        if job_name:
-            extractor.wait_for_job(job_name)
+        extractor.run(images, jsonl_path, results_path)
     except Exception as e:
         print(f"\nFATAL ERROR: {e}")
+    print(f"\n{extractor.registry.stats()}")
+    print("Extracted outfits are in:", OUTPUT_FOLDER)
 
 if __name__ == "__main__":
     main()
@@ -7,19 +7,16 @@ Features:
 - Gender, colors, garment type, fit style, graphics, text, fashion style detection.
 - AI background removal to produce clean white‑background product images.
 - Smart descriptive filenames.
-- Automatic rate‑limit handling (2 s delay, exponential back‑off).
+- Quota‑aware rate limiting shared with the other scripts (see rate_limit.py).
 
 Prerequisites:
-- Set the Google API key in the environment variable ``GOOGLE_API_KEY``.
-- Install the Gemini SDK: ``pip install google-generativeai``.
+- Set ``GOOGLE_API_KEY`` in ``.env.local`` or the environment (see config.py).
+- Install the Gemini SDK: ``pip install google-genai``.
 
 Usage:
     python extract_with_nano_banana.py
 """
 
-import os
-import time
-import base64
 import json
 import pathlib
 from typing import List, Dict
@@ -31,29 +28,30 @@ from typing import List, Dict
 INPUT_FOLDER = pathlib.Path(
     r"D:\Avadhut\ZCode\Digial Marketing\Zecode-Website\website-raw-images"
 )
-# Output folder – extracted outfit images
-OUTPUT_FOLDER = pathlib.Path(__file__).parent / "extracted-outfits"
+# Output folder – extracted outfit images (shared with extract_outfits_batch.py)
+from outfit_naming import OUTPUT_FOLDER, build_filename
 OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
 
 # Gemini models
 ANALYSIS_MODEL = "gemini-3-pro-image-preview"
 GENERATION_MODEL = "gemini-3-pro-image-preview"  # same model used for generation
 
-# Load API key from environment (Google recommends GOOGLE_API_KEY)
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    raise EnvironmentError(
-        "Google API key not found. Set the GOOGLE_API_KEY environment variable."
-    )
-
 # ---------------------------------------------------------------------------
-# Initialise Gemini client
+# Initialise Gemini client (shared pool, key loaded from .env.local / env)
 # ---------------------------------------------------------------------------
-from google import genai
 from google.genai import types
-
-genai.configure(api_key=API_KEY)
-client = genai.Client()
+from gemini_client import get_pool
+from file_registry import get_file_registry
+from image_source import open_image
+from analysis_cache import get_analysis_cache, OfflineCacheMiss
+from artifact_store import get_artifact_store
+from job_ledger import get_job_ledger, source_fingerprint
+
+pool = get_pool()
+analysis_cache = get_analysis_cache()
+artifact_store = get_artifact_store()
+file_registry = get_file_registry()
+ledger = get_job_ledger()
 
 # ---------------------------------------------------------------------------
 # Helper utilities
@@ -63,43 +61,6 @@ def list_image_files(folder: pathlib.Path) -> List[pathlib.Path]:
     exts = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
     return [p for p in folder.iterdir() if p.is_file() and p.suffix.lower() in exts]
 
-def read_image_base64(path: pathlib.Path) -> str:
-    """Read *path* and return a base64‑encoded string."""
-    return base64.b64encode(path.read_bytes()).decode("utf-8")
-
-def mime_type_from_path(path: pathlib.Path) -> str:
-    mapping = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".webp": "image/webp",
-        ".gif": "image/gif",
-        ".bmp": "image/bmp",
-    }
-    return mapping.get(path.suffix.lower(), "image/jpeg")
-
-def safe_api_call(fn, *args, **kwargs):
-    """Wrap a Gemini API call with simple rate‑limit handling.
-    Retries up to 5 times with exponential back‑off.
-    """
-    max_attempts = 5
-    delay = 2  # start with 2 s
-    for attempt in range(1, max_attempts + 1):
-        try:
-            return fn(*args, **kwargs)
-        except Exception as e:
-            # Detect quota‑exhausted errors via string matching (simplified)
-            msg = str(e)
-            if "RESOURCE_EXHAUSTED" in msg or "quota" in msg.lower():
-                wait = delay * (2 ** (attempt - 1))
-                print(f"[Rate limit] Attempt {attempt}/{max_attempts}: waiting {wait}s…")
-                time.sleep(wait)
-                continue
-            # Other errors – raise after a short pause
-            print(f"[Error] {msg} (attempt {attempt}/{max_attempts})")
-            time.sleep(3)
-    raise RuntimeError("Maximum retry attempts exceeded for Gemini API call")
-
 # ---------------------------------------------------------------------------
 # Core processing functions
 # ---------------------------------------------------------------------------
@@ -110,8 +71,7 @@ def analyze_outfit(image_path: pathlib.Path) -> Dict:
         gender, primary_color, secondary_colors, garment_type,
         fit_style, graphics (list), text_on_clothing, fashion_style.
     """
-    image_b64 = read_image_base64(image_path)
-    mime = mime_type_from_path(image_path)
+    source = open_image(image_path)
     prompt = (
         "Analyze this fashion photograph and return a JSON object with the following fields:\n"
         "- gender (male/female/unknown)\n"
@@ -124,35 +84,45 @@ def analyze_outfit(image_path: pathlib.Path) -> Dict:
         "- fashion_style (streetwear, casual, formal, athleisure, etc.)\n"
         "Return ONLY a JSON object, no extra text."
     )
-    response = safe_api_call(
-        client.models.generate_content,
-        model=ANALYSIS_MODEL,
-        contents=[
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_bytes(data=base64.b64decode(image_b64), mime_type=mime),
-                    types.Part.from_text(text=prompt),
-                ],
-            )
-        ],
-        config=types.GenerateContentConfig(temperature=0.1, response_mime_type="application/json"),
-    )
-    # Gemini returns a TextPart with JSON text
+    config = types.GenerateContentConfig(temperature=0.1, response_mime_type="application/json")
+
+    def run_analysis():
+        response = file_registry.call(source, lambda image_part: pool.generate_content(
+            # Quota errors and transient failures are paced and retried by the pool
+            model=ANALYSIS_MODEL,
+            contents=[
+                types.Content(
+                    role="user",
+                    parts=[
+                        image_part,
+                        types.Part.from_text(text=prompt),
+                    ],
+                )
+            ],
+            config=config,
+        ))
+        # Gemini returns a TextPart with JSON text
+        try:
+            json_text = response.text.strip()
+            return json.loads(json_text)
+        except Exception as e:
+            print(f"[Parse error] Could not parse analysis JSON: {e}")
+            return {}
+
+    # Unchanged images are served from the on-disk cache (parse failures are not cached)
+    key = analysis_cache.key(source.sha256, ANALYSIS_MODEL, prompt, config)
     try:
-        json_text = response.text.strip()
-        return json.loads(json_text)
-    except Exception as e:
-        print(f"[Parse error] Could not parse analysis JSON: {e}")
+        return analysis_cache.get_or_compute(key, run_analysis, meta={"source": image_path.name})
+    except OfflineCacheMiss:
+        print("  [Offline] No cached analysis for this image.")
         return {}
 
 
-def generate_clean_outfit(image_path: pathlib.Path, analysis: Dict) -> bytes:
+def generate_clean_outfit(image_path: pathlib.Path, analysis: Dict) -> str:
     """Ask Gemini to produce a clean product‑style image with white background.
-    Returns raw PNG bytes.
+    Returns the artifact‑store key of the generated PNG.
     """
-    image_b64 = read_image_base64(image_path)
-    mime = mime_type_from_path(image_path)
+    source = open_image(image_path)
     # Build a concise description for the generation prompt
     desc_parts = []
     gender = analysis.get("gender", "model")
@@ -171,46 +141,38 @@ def generate_clean_outfit(image_path: pathlib.Path, analysis: Dict) -> bytes:
         "The model should be removed; only the clothing remains on a pure white background.\n"
         "Preserve all graphics, prints, colors, and text exactly as in the source image."
     )
-    response = safe_api_call(
-        client.models.generate_content,
-        model=GENERATION_MODEL,
-        contents=[
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_bytes(data=base64.b64decode(image_b64), mime_type=mime),
-                    types.Part.from_text(text=prompt),
-                ],
-            )
-        ],
-        config=types.GenerateContentConfig(
-            response_modalities=["IMAGE", "TEXT"], temperature=0.2
-        ),
-    )
-    # Extract the generated image bytes
-    for candidate in response.candidates:
-        for part in candidate.content.parts:
-            if hasattr(part, "inline_data") and part.inline_data:
-                return part.inline_data.data
-    raise RuntimeError("No image generated by Gemini for " + str(image_path))
+    temperature = 0.2
+
+    def generate() -> bytes:
+        response = file_registry.call(source, lambda image_part: pool.generate_content(
+            model=GENERATION_MODEL,
+            contents=[
+                types.Content(
+                    role="user",
+                    parts=[
+                        image_part,
+                        types.Part.from_text(text=prompt),
+                    ],
+                )
+            ],
+            config=types.GenerateContentConfig(
+                response_modalities=["IMAGE", "TEXT"], temperature=temperature
+            ),
+        ))
+        # Extract the generated image bytes
+        for candidate in response.candidates:
+            for part in candidate.content.parts:
+                if hasattr(part, "inline_data") and part.inline_data:
+                    return part.inline_data.data
+        return None
+
+    # Reuse a previously generated image for the same source/analysis/prompt
+    key = artifact_store.key(source.sha256, analysis, prompt, GENERATION_MODEL, temperature)
+    if not artifact_store.get_or_generate(key, generate, model=GENERATION_MODEL, meta={"source": image_path.name}):
+        raise RuntimeError("No image generated by Gemini for " + str(image_path))
+    return key
 
 
-def build_filename(analysis: Dict, idx: int) -> str:
-    """Construct a descriptive filename based on *analysis*.
-    Pattern: {gender}_{primarycolor}_{graphic?}_{fit}_{garment}_{textsample}.png
-    """
-    gender = analysis.get("gender", "unknown")
-    color = analysis.get("primary_color", "color").replace(" ", "_")
-    garment = analysis.get("garment_type", "garment").replace(" ", "_")
-    fit = analysis.get("fit_style", "regular").replace(" ", "_")
-    graphics = analysis.get("graphics", [])
-    graphic_part = graphics[0].replace(" ", "_") if graphics else "plain"
-    text = analysis.get("text_on_clothing", "")
-    text_part = text.replace(" ", "_") if text else "no-text"
-    filename = f"{gender}_{color}_{graphic_part}_{fit}_{garment}_{text_part}_{idx}.png"
-    # Sanitize
-    return "".join(c for c in filename if c.isalnum() or c in "_-.")
-
 # ---------------------------------------------------------------------------
 # Main driver
 # ---------------------------------------------------------------------------
@@ -222,23 +184,31 @@ def main():
         return
     print(f"[Info] Found {len(images)} image(s) to process.")
     for i, img_path in enumerate(images, start=1):
+        # Finished images are skipped, failed ones retried (see job_ledger.py)
+        fingerprint = source_fingerprint(img_path)
+        if not ledger.should_run("outfits.extract", img_path.name, fingerprint=fingerprint):
+            print(f"\n[{i}/{len(images)}] Skipping {img_path.name} (done or given up)")
+            continue
         print(f"\n[{i}/{len(images)}] Processing {img_path.name}")
+        ledger.start("outfits.extract", img_path.name, fingerprint=fingerprint)
         analysis = analyze_outfit(img_path)
         if not analysis:
             print("  [Warning] Skipping due to analysis failure.")
+            ledger.failed("outfits.extract", img_path.name, error="analysis failed")
             continue
         try:
-            cleaned_bytes = generate_clean_outfit(img_path, analysis)
+            artifact_key = generate_clean_outfit(img_path, analysis)
         except Exception as e:
             print(f"  [Error] Generation failed: {e}")
+            ledger.failed("outfits.extract", img_path.name, error=e)
             continue
         out_name = build_filename(analysis, i)
         out_path = OUTPUT_FOLDER / out_name
-        out_path.write_bytes(cleaned_bytes)
+        artifact_store.materialize(artifact_key, out_path)
+        ledger.done("outfits.extract", img_path.name, output_path=out_path)
         print(f"  ✅ Saved: {out_path.name}")
-        # Respect rate limits – small pause between images
-        time.sleep(2)
-    print("\nAll done. Extracted outfits are in:", OUTPUT_FOLDER)
+    print(f"\n[Info] {analysis_cache.stats()}; {artifact_store.stats()}; {file_registry.stats()}")
+    print("All done. Extracted outfits are in:", OUTPUT_FOLDER)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+"""
+Gemini File API upload registry.
+
+Each distinct image (by content hash) is uploaded once through
+client.files.upload; its URI, MIME type and expiry are recorded in a small
+SQLite registry under the scripts cache dir. Requests then reference the
+file_data URI instead of resending inline bytes, so one analysis plus N
+garment/pose generations - across scripts and reruns - share one upload.
+Uploaded files live for 48 hours; an entry close to expiry is uploaded again
+transparently.
+
+Images below INLINE_MAX_BYTES are still sent inline - a separate upload
+round trip costs more than a few KB in the request body.
+
+Usage:
+    from file_registry import get_file_registry
+
+    registry = get_file_registry()
+    part = registry.part(source)          # source is an ImageSource
+    uri = registry.upload(source).uri     # for Batch API JSONL requests
+
+    # Re-uploads once if the API has lost the file (403/404 on its URI)
+    response = registry.call(source, lambda part: pool.generate_content(...))
+"""
+
+import io
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from google.genai import errors, types
+
+from config import get_cache_dir
+from gemini_client import get_pool
+
+# Uploaded files are deleted by the API after 48 hours
+FILE_TTL = 48 * 3600
+# Re-upload when less than this is left (covers long fan-outs)
+EXPIRY_MARGIN = 2 * 3600
+# Images smaller than this are sent inline (override with GEMINI_INLINE_MAX_KB)
+INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_KB", "64")) * 1024
+# How long to wait for an upload to leave the PROCESSING state
+PROCESSING_TIMEOUT = 60
+# Status codes the API returns for a file_data URI it no longer serves
+MISSING_FILE_CODES = (403, 404)
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    account TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    name TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (account, sha256)
+);
+"""
+
+
+def is_missing_file_error(exc: Exception) -> bool:
+    """True if *exc* says a referenced File API file is gone or not ours."""
+    return isinstance(exc, errors.ClientError) and exc.code in MISSING_FILE_CODES
+
+
+@dataclass
+class UploadedFile:
+    name: str
+    uri: str
+    mime_type: str
+    expires: float
+
+    def part(self) -> types.Part:
+        return types.Part.from_uri(file_uri=self.uri, mime_type=self.mime_type)
+
+
+class FileRegistry:
+    """Content hash -> uploaded File API file, for one API key."""
+
+    def __init__(self, pool, path):
+        self.pool = pool
+        self.account = pool.key_id  # uploads are only visible to the key that made them
+        self._lock = threading.Lock()
+        self._uploading = {}
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self.uploaded = 0
+        self.reused = 0
+
+    def _lookup(self, sha256: str, min_ttl: float) -> Optional[UploadedFile]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT name, uri, mime_type, expires FROM files WHERE account = ? AND sha256 = ?",
+                (self.account, sha256),
+            ).fetchone()
+        if row and row[3] - time.time() > min_ttl:
+            return UploadedFile(*row)
+        return None
+
+    def _record(self, sha256: str, uploaded: UploadedFile):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (account, sha256, name, uri, mime_type, expires) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.account, sha256, uploaded.name, uploaded.uri, uploaded.mime_type, uploaded.expires),
+            )
+            self._db.commit()
+
+    def invalidate(self, sha256: str):
+        """Forget an upload (e.g. the API reported the file missing)."""
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE account = ? AND sha256 = ?", (self.account, sha256))
+            self._db.commit()
+
+    def _upload(self, source) -> UploadedFile:
+        config = types.UploadFileConfig(mime_type=source.mime_type, display_name=source.name[:100])
+        file = source.path if source.path is not None else io.BytesIO(source.data)
+        file_obj = self.pool.files.upload(file=file, config=config)
+
+        deadline = time.time() + PROCESSING_TIMEOUT
+        while file_obj.state == types.FileState.PROCESSING and time.time() < deadline:
+            time.sleep(1)
+            file_obj = self.pool.files.get(name=file_obj.name)
+        if file_obj.state == types.FileState.FAILED:
+            raise RuntimeError(f"upload of {source.name} failed: {file_obj.error}")
+
+        expires = file_obj.expiration_time.timestamp() if file_obj.expiration_time else time.time() + FILE_TTL
+        return UploadedFile(file_obj.name, file_obj.uri, file_obj.mime_type or source.mime_type, expires)
+
+    def upload(self, source, min_ttl: float = EXPIRY_MARGIN) -> UploadedFile:
+        """Return the upload for *source*, uploading it if needed.
+
+        *min_ttl* is how long the file must still live (raise it for batch
+        jobs, which may run for up to a day).
+        """
+        sha = source.sha256
+        uploaded = self._lookup(sha, min_ttl)
+        if uploaded:
+            with self._lock:
+                self.reused += 1
+            return uploaded
+
+        # One upload per hash even when several threads ask at once
+        with self._lock:
+            lock = self._uploading.setdefault(sha, threading.Lock())
+        with lock:
+            uploaded = self._lookup(sha, min_ttl)
+            if uploaded is None:
+                uploaded = self._upload(source)
+                self._record(sha, uploaded)
+                with self._lock:
+                    self.uploaded += 1
+            else:
+                with self._lock:
+                    self.reused += 1
+        with self._lock:
+            self._uploading.pop(sha, None)
+        return uploaded
+
+    def part(self, source) -> types.Part:
+        """Part referencing *source*: a file_data URI, or inline bytes for small images."""
+        if source.size < INLINE_MAX_BYTES:
+            return source.part()
+        try:
+            return self.upload(source).part()
+        except Exception as e:
+            print(f"   ⚠️ Upload failed for {source.name}, sending inline: {e}")
+            return source.part()
+
+    def call_many(self, sources: List, fn: Callable[[List[types.Part]], T]) -> T:
+        """fn(parts) with the parts of *sources*, retried once with fresh uploads.
+
+        Files can disappear before their recorded expiry (deleted, or the
+        key lost access); a 403/404 on a call that referenced uploaded files
+        invalidates those entries and re-runs *fn* with new uploads.
+        """
+        parts = [self.part(source) for source in sources]
+        try:
+            return fn(parts)
+        except Exception as e:
+            if not self._forget_missing(sources, parts, e):
+                raise
+        return fn([self.part(source) for source in sources])
+
+    def call(self, source, fn: Callable[[types.Part], T]) -> T:
+        """fn(part) for one *source*; see call_many."""
+        return self.call_many([source], lambda parts: fn(parts[0]))
+
+    async def acall(self, source, fn: Callable[[types.Part], Awaitable[T]]) -> T:
+        """Async call(): await fn(part), uploading (blocking) off the event loop."""
+        part = await asyncio.to_thread(self.part, source)
+        try:
+            return await fn(part)
+        except Exception as e:
+            if not self._forget_missing([source], [part], e):
+                raise
+        return await fn(await asyncio.to_thread(self.part, source))
+
+    def _forget_missing(self, sources: List, parts: List[types.Part], exc: Exception) -> bool:
+        """Invalidate the uploads behind *parts* if *exc* is a missing-file error."""
+        uploaded = [source for source, part in zip(sources, parts) if part.file_data]
+        if not uploaded or not is_missing_file_error(exc):
+            return False
+        print(f"   ⚠️ File API lost {len(uploaded)} upload(s) ({exc.code}), uploading again")
+        for source in uploaded:
+            self.invalidate(source.sha256)
+        return True
+
+    def stats(self) -> str:
+        return f"file registry: {self.uploaded} uploaded, {self.reused} reused"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide registry
+# ---------------------------------------------------------------------------
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_file_registry(pool=None) -> FileRegistry:
+    """Return the FileRegistry for *pool* (default: the shared pool)."""
+    pool = pool or get_pool()
+    with _registries_lock:
+        registry = _registries.get(pool.key_id)
+        if registry is None:
+            registry = FileRegistry(pool, get_cache_dir() / "gemini-files.sqlite3")
+            _registries[pool.key_id] = registry
+        return registry
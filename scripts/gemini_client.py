@@ -0,0 +1,261 @@
+"""
+Shared Gemini client pool for ZECODE scripts.
+
+Every pipeline in scripts/ talks to Gemini through one process-wide client
+built on config.get_google_api_key(). The underlying HTTP connections are
+kept alive between requests, and each model gets its own cap on how many
+requests may be in flight at once, so callers can fan work out across
+threads (or an asyncio loop) without each script managing its own client.
+
+Every request also passes through the per-model quota limiter in
+rate_limit.py, which paces calls to the RPM/TPM/RPD quotas and retries
+429s (and transient 5xx errors) itself - callers should not sleep.
+
+Usage:
+    from gemini_client import get_pool
+
+    pool = get_pool()
+    response = pool.generate_content(model=..., contents=..., config=...)
+    results = pool.map(analyze, images)           # thread fan-out
+    response = await pool.agenerate_content(...)  # asyncio
+"""
+
+import os
+import time
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import httpx
+from google import genai
+from google.genai import types
+from config import get_google_api_key
+from rate_limit import get_limiter, classify_error, estimate_tokens
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+# Default cap on concurrent requests per model (override with GEMINI_MAX_IN_FLIGHT)
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "4"))
+
+# Per-model caps - image models have far lower quotas than the flash models
+MODEL_MAX_IN_FLIGHT = {
+    "gemini-2.5-flash": 8,
+    "gemini-1.5-flash": 8,
+    "gemini-3-pro-image-preview": 3,
+    "gemini-2.0-flash-exp-image-generation": 3,
+    "imagen-3.0-fast-generate-001": 2,
+}
+
+# Keep-alive connection pool shared by all requests
+MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "32"))
+KEEPALIVE_EXPIRY = 120  # seconds an idle connection stays open
+REQUEST_TIMEOUT_MS = 300_000  # image generation can take minutes
+
+# Retries for 429s (paced by the limiter) and transient 5xx/timeouts
+MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "6"))
+TRANSIENT_BACKOFF = 2.0  # seconds, doubled per attempt
+
+
+class GeminiPool:
+    """Thread-safe and asyncio-friendly wrapper around one genai.Client."""
+
+    def __init__(self, api_key: Optional[str] = None, max_in_flight: Optional[Dict[str, int]] = None):
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        api_key = api_key or get_google_api_key()
+        # Short fingerprint of the key (File API uploads are per key)
+        self.key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                timeout=REQUEST_TIMEOUT_MS,
+                client_args={"limits": limits},
+                async_client_args={"limits": limits},
+            ),
+        )
+        self._max_in_flight = dict(MODEL_MAX_IN_FLIGHT)
+        self._max_in_flight.update(max_in_flight or {})
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._async_semaphores = {}
+        self._executor = None
+
+    # -----------------------------------------------------------------------
+    # Concurrency limits
+    # -----------------------------------------------------------------------
+
+    def max_in_flight(self, model: str) -> int:
+        """Return the in-flight cap for *model*."""
+        return self._max_in_flight.get(model, DEFAULT_MAX_IN_FLIGHT)
+
+    def set_max_in_flight(self, model: str, limit: int):
+        """Change the in-flight cap for *model* (only affects new semaphores)."""
+        with self._lock:
+            self._max_in_flight[model] = max(1, int(limit))
+            self._semaphores.pop(model, None)
+            for key in [k for k in self._async_semaphores if k[1] == model]:
+                del self._async_semaphores[key]
+
+    def _semaphore(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(model)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.max_in_flight(model))
+                self._semaphores[model] = sem
+            return sem
+
+    def _async_semaphore(self, model: str) -> asyncio.Semaphore:
+        # asyncio semaphores are bound to the loop they are used on
+        key = (id(asyncio.get_running_loop()), model)
+        with self._lock:
+            sem = self._async_semaphores.get(key)
+            if sem is None:
+                sem = asyncio.Semaphore(self.max_in_flight(model))
+                self._async_semaphores[key] = sem
+            return sem
+
+    # -----------------------------------------------------------------------
+    # Requests
+    # -----------------------------------------------------------------------
+
+    def _retry_delay(self, model: str, exc: Exception, attempt: int) -> Optional[float]:
+        """Return how long to wait before retrying *exc*, or None to give up."""
+        rate_limited, transient, retry_after = classify_error(exc)
+        if attempt >= MAX_ATTEMPTS or not (rate_limited or transient):
+            return None
+        if rate_limited:
+            pause = get_limiter(model).on_rate_limited(retry_after)
+            print(f"    [{model}] rate limited, slowing down (retry in {pause:.0f}s)")
+            # The limiter pauses every caller; acquire() does the waiting
+            return 0.0
+        return TRANSIENT_BACKOFF * 2 ** (attempt - 1)
+
+    @staticmethod
+    def _usage_tokens(response) -> Optional[int]:
+        usage = getattr(response, "usage_metadata", None)
+        return getattr(usage, "total_token_count", None) if usage else None
+
+    def _call(self, model: str, est_tokens: int, fn: Callable):
+        limiter = get_limiter(model)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            limiter.acquire(est_tokens)
+            try:
+                with self._semaphore(model):
+                    response = fn()
+            except Exception as e:
+                delay = self._retry_delay(model, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            limiter.on_success(est_tokens, self._usage_tokens(response))
+            return response
+
+    def generate_content(self, model: str, contents, config=None):
+        """Blocking generate_content, rate limited and capped at max_in_flight(model)."""
+        image_output = bool(config and "IMAGE" in (getattr(config, "response_modalities", None) or []))
+        return self._call(
+            model, estimate_tokens(contents, image_output),
+            lambda: self.client.models.generate_content(model=model, contents=contents, config=config),
+        )
+
+    def generate_images(self, model: str, prompt: str, config=None):
+        """Blocking Imagen generate_images, limited like generate_content."""
+        return self._call(
+            model, estimate_tokens(prompt, image_output=True),
+            lambda: self.client.models.generate_images(model=model, prompt=prompt, config=config),
+        )
+
+    async def agenerate_content(self, model: str, contents, config=None):
+        """Async generate_content on the shared keep-alive async client."""
+        limiter = get_limiter(model)
+        image_output = bool(config and "IMAGE" in (getattr(config, "response_modalities", None) or []))
+        est_tokens = estimate_tokens(contents, image_output)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            while True:
+                wait = limiter.reserve(est_tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(min(wait, 5.0))
+            try:
+                async with self._async_semaphore(model):
+                    response = await self.client.aio.models.generate_content(
+                        model=model, contents=contents, config=config
+                    )
+            except Exception as e:
+                delay = self._retry_delay(model, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            limiter.on_success(est_tokens, self._usage_tokens(response))
+            return response
+
+    def map(self, fn: Callable, items: Iterable, max_workers: Optional[int] = None) -> List:
+        """Run *fn* over *items* on worker threads and return results in order.
+
+        The per-model semaphores still apply, so max_workers only bounds how
+        many items are being prepared/processed at once.
+        """
+        items = list(items)
+        if not items:
+            return []
+        if max_workers:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(fn, items))
+        return list(self.executor.map(fn, items))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Shared worker threads for fan-out (sized to the connection pool)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="gemini")
+            return self._executor
+
+    @property
+    def files(self):
+        return self.client.files
+
+    @property
+    def batches(self):
+        return self.client.batches
+
+    def close(self):
+        """Shut down worker threads and close the HTTP connections."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        close = getattr(self.client, "close", None)
+        if close:
+            close()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide pool
+# ---------------------------------------------------------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> GeminiPool:
+    """Return the shared GeminiPool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = GeminiPool()
+        return _pool
+
+
+def get_client() -> genai.Client:
+    """Return the shared genai.Client (for files, batches, model listing)."""
+    return get_pool().client
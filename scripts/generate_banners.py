@@ -5,22 +5,19 @@ Creates group photo compositions with the 'nana banana pro' style.
 """
 
 import os
-import time
 import ssl
 import certifi
 from pathlib import Path
-from config import get_google_api_key
 
 # Workaround for SSL certificate issues
 os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 
-# Initialize Gemini Client
-from google import genai
+# Shared Gemini client pool
 from google.genai import types
+from gemini_client import get_pool
 
-API_KEY = get_google_api_key()
-client = genai.Client(api_key=API_KEY)
+pool = get_pool()
 MODEL_NAME = "imagen-3.0-fast-generate-001"  # Imagen 3 Fast for image generation
 
 # Configuration
@@ -95,7 +92,7 @@ def generate_image(task):
 
     try:
         print("  > Sending request to Imagen 3...")
-        response = client.models.generate_images(
+        response = pool.generate_images(
             model=MODEL_NAME,
             prompt=task["prompt"],
             config=types.GenerateImagesConfig(
@@ -122,10 +119,8 @@ def generate_image(task):
             return False
 
     except Exception as e:
+        # Rate limits are retried by the pool before we get here
         print(f"  ❌ API Error: {e}")
-        if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-            print("    Rate limit hit. Waiting 30 seconds...")
-            time.sleep(30)
         return False
 
 def main():
@@ -135,11 +130,8 @@ def main():
     print("=" * 70)
     print(f"Target Directory: {PUBLIC_DIR}")
     
-    success_count = 0
-    for task in IMAGE_TASKS:
-        if generate_image(task):
-            success_count += 1
-        time.sleep(5)  # Pause between requests
+    # Tasks are independent - the pool caps how many run at once
+    success_count = sum(1 for ok in pool.map(generate_image, IMAGE_TASKS) if ok)
 
     print("\n" + "=" * 70)
     print(f"Workflow Complete. Generated {success_count}/{len(IMAGE_TASKS)} images.")
@@ -5,20 +5,18 @@ Target: Group of 4-5 college students in a university setting.
 """
 
 import os
-import time
 import ssl
 import certifi
 from pathlib import Path
-from google import genai
 from google.genai import types
-from config import get_google_api_key
+from gemini_client import get_pool
+from image_source import open_image
 
 # Workaround for SSL certificate issues
 os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 
-API_KEY = get_google_api_key()
-client = genai.Client(api_key=API_KEY)
+pool = get_pool()
 MODEL_NAME = "gemini-3-pro-image-preview"
 
 PROJECT_ROOT = Path(__file__).parents[1]
@@ -92,12 +90,6 @@ TASKS = [
     }
 ]
 
-def get_mime_type(path):
-    suffix = path.suffix.lower()
-    if suffix == '.png': return 'image/png'
-    if suffix in ['.jpg', '.jpeg']: return 'image/jpeg'
-    return 'image/jpeg'
-
 def generate_image(task):
     target_rel = task["target"]
     target_path = PUBLIC_DIR / target_rel
@@ -109,16 +101,14 @@ def generate_image(task):
         src_path = PUBLIC_DIR / src_rel
         if src_path.exists():
             print(f"  + Ref: {src_rel}")
-            parts.append(types.Part.from_bytes(
-                data=src_path.read_bytes(),
-                mime_type=get_mime_type(src_path)
-            ))
+            # Shared sources: tasks reusing a reference image read it once
+            parts.append(open_image(src_path).part())
     
     parts.append(types.Part.from_text(text=task["prompt"]))
 
     try:
         print(f"  > Sending to {MODEL_NAME}...")
-        response = client.models.generate_content(
+        response = pool.generate_content(
             model=MODEL_NAME,
             contents=[types.Content(role="user", parts=parts)],
             config=types.GenerateContentConfig(
@@ -144,9 +134,8 @@ def generate_image(task):
 
 def main():
     print("Starting Generation with Gemini 3 Pro Image Preview (College Theme)...")
-    for task in TASKS:
-        generate_image(task)
-        time.sleep(5)
+    # Tasks are independent - the pool caps how many run at once
+    pool.map(generate_image, TASKS)
 
 if __name__ == "__main__":
     main()
@@ -6,22 +6,19 @@ Generate TRUE group photos by:
 """
 
 import os
-import time
 import ssl
 import certifi
 import random
 from pathlib import Path
-from PIL import Image
-from google import genai
+from compositing import Sources, open_scaled, solid, paste, to_image
 from google.genai import types
-from config import get_google_api_key
+from gemini_client import get_pool
 
 # Workaround for SSL certificate issues
 os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 
-API_KEY = get_google_api_key()
-client = genai.Client(api_key=API_KEY)
+pool = get_pool()
 MODEL_NAME = "gemini-3-pro-image-preview"
 
 PROJECT_ROOT = Path(__file__).parents[1]
@@ -72,53 +69,54 @@ TASKS = [
     }
 ]
 
+def group_fit_size(size, img_width, target_height):
+    """Fit to the banner height; scale by width instead if that's too wide."""
+    width, height = size
+    ratio = target_height / height
+    new_w, new_h = int(width * ratio), target_height
+    if new_w > img_width + 100:  # Allow some overlap
+        ratio = img_width / width
+        new_w, new_h = img_width, int(height * ratio)
+    return new_w, new_h
+
+def render_collage(sources, target_width=1920, target_height=1080):
+    """Side-by-side collage of the sources on white (see compositing.py)."""
+    canvas = solid(target_width, target_height, (255, 255, 255))
+    
+    # Calculate width per image
+    img_width = target_width // len(sources)
+    
+    for i in range(len(sources)):
+        resized = sources.resized(i, group_fit_size(sources.size(i), img_width, target_height))
+        
+        # Center vertically
+        y_offset = (target_height - resized.height) // 2
+        x_offset = i * img_width + (img_width - resized.width) // 2
+        paste(canvas, resized, x_offset, y_offset)
+    
+    return to_image(canvas)
+
 def create_collage(image_paths, output_path):
     """Creates a simple side-by-side collage of the images."""
+    # Target size for banner (16:9); JPEG sources decode at roughly slot size
+    slot = (1920 // max(len(image_paths), 1), 1080)
     images = []
     for p in image_paths:
         path = PUBLIC_DIR / p
         if path.exists():
             try:
-                img = Image.open(path).convert("RGBA")
-                images.append(img)
+                images.append(open_scaled(path, slot))
             except Exception as e:
                 print(f"Warning: Could not open {p}: {e}")
     
     if not images:
         return None
 
-    # Target size for banner (16:9)
-    target_width = 1920
-    target_height = 1080
-    
-    collage = Image.new('RGB', (target_width, target_height), (255, 255, 255))
-    
-    # Calculate width per image
-    img_width = target_width // len(images)
-    
-    for i, img in enumerate(images):
-        # Resize preserving aspect ratio to fit height
-        ratio = target_height / img.height
-        new_w = int(img.width * ratio)
-        new_h = target_height
-        
-        # If too wide, scale by width
-        if new_w > img_width + 100: # Allow some overlap
-             ratio = img_width / img.width
-             new_w = img_width
-             new_h = int(img.height * ratio)
-
-        resized = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        
-        # Center vertically
-        y_offset = (target_height - new_h) // 2
-        x_offset = i * img_width + (img_width - new_w) // 2
-        
-        # Paste with mask for transparency
-        collage.paste(resized, (x_offset, y_offset), resized if resized.mode == 'RGBA' else None)
+    collage = render_collage(Sources(images))
 
     # Save temporary collage
     temp_path = output_path.parent / f"temp_collage_{output_path.stem}.png"
+    temp_path.parent.mkdir(parents=True, exist_ok=True)
     collage.save(temp_path)
     return temp_path
 
@@ -145,7 +143,7 @@ def generate_group_photo(task):
             types.Part.from_text(text=task["prompt"])
         ]
 
-        response = client.models.generate_content(
+        response = pool.generate_content(
             model=MODEL_NAME,
             contents=[types.Content(role="user", parts=parts)],
             config=types.GenerateContentConfig(
@@ -183,9 +181,8 @@ def main():
         print("Installing Pillow...")
         os.system("pip install Pillow")
 
-    for task in TASKS:
-        generate_group_photo(task)
-        time.sleep(5)
+    # Tasks are independent - the pool caps how many run at once
+    pool.map(generate_group_photo, TASKS)
 
 if __name__ == "__main__":
     main()
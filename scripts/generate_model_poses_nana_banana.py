@@ -6,16 +6,26 @@ This script:
 1. Fetches products without model images from Directus
 2. Downloads product images from Cloudinary
 3. Generates 3 model poses per product using Gemini
-4. Uploads generated images to Cloudinary
-5. Updates Directus with new model image paths
+4. Uploads generated images to Cloudinary (see cloudinary_upload.py)
+5. Updates Directus with new model image paths (batched, see directus_writeback.py)
+
+Steps 2-4 run as an asyncio pipeline: the next products' images download
+while earlier ones generate, a product's three poses generate concurrently,
+and finished poses are handed to the upload stage while generation goes on.
+Bounded queues between the stages keep at most NANA_PRODUCTS_IN_FLIGHT
+products waiting per stage.
+
+Usage:
+    python generate_model_poses_nana_banana.py                   # generate, upload, write back
+    python generate_model_poses_nana_banana.py --write-back-only # only sync finished poses to Directus
+    python generate_model_poses_nana_banana.py --dry-run         # show the Directus changes, write nothing
 """
 
 import os
 import sys
-import time
-import json
+import asyncio
+import argparse
 import base64
-import requests
 import pathlib
 from typing import Dict, List, Optional
 from datetime import datetime
@@ -37,11 +47,6 @@ CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME") or os.getenv("NEXT_PU
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
-# Directus config
-DIRECTUS_URL = os.getenv("DIRECTUS_URL") or os.getenv("NEXT_PUBLIC_DIRECTUS_URL") or "https://zecode-directus.onrender.com"
-DIRECTUS_EMAIL = os.getenv("DIRECTUS_ADMIN_EMAIL")
-DIRECTUS_PASSWORD = os.getenv("DIRECTUS_ADMIN_PASSWORD")
-
 # Validate required environment variables
 required_vars = ["GOOGLE_API_KEY", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET", "DIRECTUS_ADMIN_EMAIL", "DIRECTUS_ADMIN_PASSWORD"]
 missing_vars = [v for v in required_vars if not os.getenv(v)]
@@ -64,6 +69,11 @@ ANALYSIS_MODEL = "gemini-2.5-flash"
 OUTPUT_FOLDER = pathlib.Path(__file__).parent / "generated-model-poses"
 OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
 
+# Pipeline concurrency (image model requests are also capped by the shared pool)
+PRODUCTS_IN_FLIGHT = int(os.getenv("NANA_PRODUCTS_IN_FLIGHT", "4"))
+DOWNLOAD_WORKERS = int(os.getenv("NANA_DOWNLOAD_WORKERS", "4"))
+UPLOAD_WORKERS = int(os.getenv("NANA_UPLOAD_WORKERS", "2"))
+
 # Pose variations
 POSE_VARIATIONS = [
     {
@@ -91,45 +101,33 @@ import os
 os.environ['SSL_CERT_FILE'] = ''
 os.environ['SSL_CERT_DIR'] = ''
 
-from google import genai
 from google.genai import types
-
-client = genai.Client(api_key=GOOGLE_API_KEY)
-
-# ---------------------------------------------------------------------------
-# Directus Authentication
-# ---------------------------------------------------------------------------
-
-def get_directus_token() -> str:
-    """Get fresh Directus access token."""
-    response = requests.post(
-        f"{DIRECTUS_URL}/auth/login",
-        json={"email": DIRECTUS_EMAIL, "password": DIRECTUS_PASSWORD},
-        verify=False
-    )
-    response.raise_for_status()
-    return response.json()["data"]["access_token"]
+from gemini_client import get_pool
+from file_registry import get_file_registry
+from image_source import ImageSource
+from artifact_store import get_artifact_store
+from job_ledger import get_job_ledger
+from directus_client import get_directus_client
+from directus_writeback import write_back
+from cloudinary_upload import get_cloudinary_uploader
+
+pool = get_pool()
+artifact_store = get_artifact_store()
+file_registry = get_file_registry()
+ledger = get_job_ledger()
+directus = get_directus_client()
+uploader = get_cloudinary_uploader()
 
 # ---------------------------------------------------------------------------
 # Fetch Products
 # ---------------------------------------------------------------------------
 
+PRODUCT_FIELDS = ["id", "name", "slug", "image", "image_url", "gender_category", "subcategory", "model_image_1"]
+
 def fetch_products_without_models() -> List[Dict]:
-    """Fetch all products that don't have model images."""
-    response = requests.get(
-        f"{DIRECTUS_URL}/items/products",
-        params={
-            "limit": 500,
-            "fields": "id,name,slug,image,image_url,gender_category,subcategory,model_image_1"
-        },
-        verify=False
-    )
-    response.raise_for_status()
-    all_products = response.json()["data"]
-    
-    # Filter products without model images
-    products_without_models = [p for p in all_products if not p.get("model_image_1")]
-    return products_without_models
+    """Fetch all products that don't have model images (filtered by Directus)."""
+    no_model_image = {"_or": [{"model_image_1": {"_null": True}}, {"model_image_1": {"_empty": True}}]}
+    return list(directus.iter_items("products", filter=no_model_image, fields=PRODUCT_FIELDS))
 
 # ---------------------------------------------------------------------------
 # Image Helpers
@@ -158,10 +156,18 @@ def download_image(url: str) -> bytes:
         return response.read()
 
 def upload_to_cloudinary(image_bytes: bytes, public_id: str) -> str:
-    """Skip Cloudinary upload - will be done separately via Node.js."""
-    # Return the expected path format
+    """Upload a generated pose (skipped if Cloudinary already has this content); returns its Directus path."""
+    uploader.upload(image_bytes, cloudinary_public_id(public_id))
+    return model_image_path(public_id)
+
+def model_image_path(public_id: str) -> str:
+    """Directus image path of an uploaded pose."""
     return f"/products/model-poses-generated/{public_id}.png"
 
+def cloudinary_public_id(public_id: str) -> str:
+    """Cloudinary public_id of a pose (get_cloudinary_url resolves its Directus path to it)."""
+    return f"zecode/products/model-poses-generated/{public_id}"
+
 # ---------------------------------------------------------------------------
 # Gemini Analysis & Generation
 # ---------------------------------------------------------------------------
@@ -225,8 +231,9 @@ def analyze_product_image(image_bytes: bytes, product_name: str, gender_category
         "details": ""
     }
 
-def generate_model_pose(image_bytes: bytes, analysis: Dict, pose: Dict, product_name: str) -> Optional[bytes]:
-    """Generate a model wearing the outfit in a specific pose."""
+async def generate_model_pose(image: ImageSource, analysis: Dict, pose: Dict, product_name: str) -> Optional[str]:
+    """Generate a model wearing the outfit in a specific pose.
+    Returns the artifact-store key of the generated image, or None."""
     
     gender = analysis.get("gender", "female")
     garment = analysis.get("garment_type", "clothing")
@@ -261,49 +268,54 @@ REQUIREMENTS:
 
 Generate a professional product photo suitable for a fashion e-commerce website."""
 
-    max_attempts = 3
-    for attempt in range(max_attempts):
+    temperature = 0.4
+    
+    async def generate() -> Optional[bytes]:
+        max_attempts = 3
+        # Rate limits and transient errors are retried inside the pool; only a
+        # reply without an image is asked again here
         try:
-            response = client.models.generate_content(
-                model=IMAGE_GEN_MODEL,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part.from_bytes(data=image_bytes, mime_type="image/png"),
-                            types.Part.from_text(text=prompt)
-                        ]
+            for attempt in range(max_attempts):
+                # Inline for small images; a File API upload (blocking) otherwise,
+                # uploaded again if the API has lost it
+                response = await file_registry.acall(image, lambda image_part: pool.agenerate_content(
+                    model=IMAGE_GEN_MODEL,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                image_part,
+                                types.Part.from_text(text=prompt)
+                            ]
+                        )
+                    ],
+                    config=types.GenerateContentConfig(
+                        response_modalities=["IMAGE", "TEXT"],
+                        temperature=temperature
                     )
-                ],
-                config=types.GenerateContentConfig(
-                    response_modalities=["IMAGE", "TEXT"],
-                    temperature=0.4
-                )
-            )
-            
-            # Extract generated image
-            if response.candidates:
-                for part in response.candidates[0].content.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        return part.inline_data.data
-            
-            print(f"      Attempt {attempt+1}: No image in response, retrying...")
-            time.sleep(3)
-            
+                ))
+                
+                # Extract generated image
+                if response.candidates:
+                    for part in response.candidates[0].content.parts:
+                        if hasattr(part, 'inline_data') and part.inline_data:
+                            return part.inline_data.data
+                
+                print(f"      Attempt {attempt+1}: No image in response, retrying...")
+                
         except Exception as e:
+            # No local retry: the pool already retried it, or the daily quota is spent
             error_str = str(e)
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                wait_time = 30 * (attempt + 1)
-                print(f"      Rate limited. Waiting {wait_time}s...")
-                time.sleep(wait_time)
-            elif "SAFETY" in error_str.upper() or "BLOCKED" in error_str.upper():
+            if "SAFETY" in error_str.upper() or "BLOCKED" in error_str.upper():
                 print(f"      Content blocked, skipping this pose")
                 return None
-            else:
-                print(f"      Error: {error_str[:100]}")
-                time.sleep(5)
-    
-    return None
+            print(f"      Error: {error_str[:100]}")
+
+        return None
+
+    # Reuse a previously generated pose for the same product image/prompt
+    key = artifact_store.key(image.sha256, {"analysis": analysis, "pose": pose}, prompt, IMAGE_GEN_MODEL, temperature)
+    return await artifact_store.aget_or_generate(key, generate, model=IMAGE_GEN_MODEL, meta={"product": product_name})
 
 # ---------------------------------------------------------------------------
 # Main Processing
@@ -315,21 +327,175 @@ def create_safe_filename(product_name: str, pose_name: str) -> str:
     safe_name = safe_name.replace(' ', '_')[:50]
     return f"{safe_name}_{pose_name}"
 
-def process_products():
-    """Main function to process all products without model images."""
+async def download_stage(products: List[Dict], out_queue: asyncio.Queue, stats: Dict):
+    """Download product images ahead of generation; skips finished products."""
+    pending = iter(enumerate(products, 1))
+    
+    async def worker():
+        for idx, product in pending:
+            product_name = product["name"]
+            image_path = product.get("image") or product.get("image_url")
+            source = str(product["id"])
+            
+            if image_path and ledger.is_done("nana.product", source, fingerprint=image_path):
+                # Poses exist locally; Directus just hasn't been updated yet
+                stats["skipped"] += 1
+                continue
+            if not image_path:
+                print(f"[{idx}/{len(products)}] {product_name}: ⚠ No image path, skipping")
+                stats["failed"].append((product_name, "No image"))
+                continue
+            
+            cloudinary_url = get_cloudinary_url(image_path)
+            try:
+                image_bytes = await asyncio.to_thread(download_image, cloudinary_url)
+                # One shared buffer/Part for all poses; MIME type sniffed from the bytes
+                image = ImageSource.from_bytes(image_bytes, name=image_path)
+            except Exception as e:
+                print(f"[{idx}/{len(products)}] {product_name}: ✗ Download failed: {e}")
+                stats["failed"].append((product_name, "Download failed"))
+                continue
+            print(f"[{idx}/{len(products)}] {product_name}: ✓ Downloaded ({len(image_bytes)} bytes)")
+            
+            analysis = analyze_product_image(image_bytes, product_name, product.get("gender_category"))
+            # Blocks while PRODUCTS_IN_FLIGHT products are already waiting (back-pressure)
+            await out_queue.put((product, image_path, image, analysis))
+    
+    await asyncio.gather(*(worker() for _ in range(DOWNLOAD_WORKERS)))
+
+async def generate_pose(product: Dict, image_path: str, image: ImageSource, analysis: Dict, pose: Dict):
+    """Generate and save one pose; returns (local path, artifact key), True if already done, or None."""
+    product_name = product["name"]
+    source = str(product["id"])
+    if ledger.is_done("nana.pose", source, pose['name'], image_path):
+        return True
+    if not ledger.should_run("nana.pose", source, pose['name'], image_path):
+        print(f"  {product_name} / {pose['name']}: giving up after repeated failures")
+        return None
+    
+    ledger.start("nana.pose", source, pose['name'], image_path)
+    try:
+        artifact_key = await generate_model_pose(image, analysis, pose, product_name)
+        if not artifact_key:
+            print(f"  {product_name} / {pose['name']}: ✗ Generation failed")
+            ledger.failed("nana.pose", source, pose['name'], error="no image generated")
+            return None
+        
+        # Save locally (a view over the artifact store)
+        filename = create_safe_filename(product_name, pose['name'])
+        local_path = OUTPUT_FOLDER / f"{filename}.png"
+        await asyncio.to_thread(artifact_store.materialize, artifact_key, local_path)
+        ledger.done("nana.pose", source, pose['name'], local_path)
+    except Exception as e:
+        # A bad pose fails its own ledger unit; the generate worker keeps going
+        print(f"  {product_name} / {pose['name']}: ✗ {str(e)[:100]}")
+        ledger.failed("nana.pose", source, pose['name'], error=e)
+        return None
+    print(f"  {product_name} / {pose['name']}: ✓ Saved locally: {filename}.png")
+    return local_path, artifact_key
+
+async def generate_stage(in_queue: asyncio.Queue, out_queue: asyncio.Queue, stats: Dict):
+    """Generate the three poses of each product concurrently."""
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            return
+        product, image_path, image, analysis = item
+        source = str(product["id"])
+        
+        # Generate poses (the product image URL is the source fingerprint)
+        ledger.start("nana.product", source, fingerprint=image_path)
+        results = await asyncio.gather(*(
+            generate_pose(product, image_path, image, analysis, pose) for pose in POSE_VARIATIONS
+        ), return_exceptions=True)
+        for pose, result in zip(POSE_VARIATIONS, results):
+            if isinstance(result, Exception):
+                print(f"  {product['name']} / {pose['name']}: ✗ {str(result)[:100]}")
+        results = [None if isinstance(r, Exception) else r for r in results]
+        
+        if all(results):
+            ledger.done("nana.product", source)
+        else:
+            ledger.failed("nana.product", source, error="some poses failed")
+        
+        generated = [r for r in results if isinstance(r, tuple)]
+        if not generated and not all(results):
+            stats["failed"].append((product["name"], "No poses generated"))
+        for local_path, artifact_key in generated:
+            await out_queue.put((product, local_path, artifact_key))
+
+async def upload_stage(in_queue: asyncio.Queue, stats: Dict):
+    """Upload finished poses while generation continues."""
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            return
+        product, local_path, artifact_key = item
+        try:
+            # SQLite + disk read - kept off the event loop like the upload itself
+            generated_bytes = await asyncio.to_thread(artifact_store.get, artifact_key)
+            # Uploaded as soon as it's generated; Directus is updated in batches at the end
+            await asyncio.to_thread(upload_to_cloudinary, generated_bytes, local_path.stem)
+            stats["generated"] += 1
+        except Exception as e:
+            print(f"  {product['name']}: ✗ Upload error: {e}")
+
+async def run_pipeline(products: List[Dict], stats: Dict):
+    """Download -> generate -> upload, connected by bounded queues."""
+    downloaded = asyncio.Queue(maxsize=PRODUCTS_IN_FLIGHT)
+    generated = asyncio.Queue(maxsize=PRODUCTS_IN_FLIGHT * len(POSE_VARIATIONS))
+    
+    generators = [asyncio.create_task(generate_stage(downloaded, generated, stats)) for _ in range(PRODUCTS_IN_FLIGHT)]
+    uploaders = [asyncio.create_task(upload_stage(generated, stats)) for _ in range(UPLOAD_WORKERS)]
+    
+    await download_stage(products, downloaded, stats)
+    for _ in generators:
+        await downloaded.put(None)
+    await asyncio.gather(*generators)
+    for _ in uploaders:
+        await generated.put(None)
+    await asyncio.gather(*uploaders)
+
+def model_image_updates(products: List[Dict], upload: bool = True) -> Dict[int, Dict]:
+    """{product id: {model_image_N: path}} for every generated pose that is on Cloudinary.
+    
+    Poses the ledger records as generated but that aren't uploaded yet (e.g.
+    from earlier runs) are uploaded first; unchanged ones are skipped by the
+    uploader's manifest. With upload=False every generated pose is listed.
+    """
+    poses = {}
+    for product in products:
+        image_path = product.get("image") or product.get("image_url")
+        for n, pose in enumerate(POSE_VARIATIONS, 1):
+            if ledger.is_done("nana.pose", str(product["id"]), pose["name"], image_path):
+                local_path = pathlib.Path(ledger.get("nana.pose", str(product["id"]), pose["name"])["output_path"])
+                poses[(product["id"], f"model_image_{n}")] = local_path
+    
+    uploaded = {}
+    if upload:
+        uploaded = uploader.upload_many({cloudinary_public_id(path.stem): path for path in poses.values()})
+    updates = {}
+    for (product_id, field), local_path in poses.items():
+        if not upload or uploaded.get(cloudinary_public_id(local_path.stem)):
+            updates.setdefault(product_id, {})[field] = model_image_path(local_path.stem)
+    return updates
+
+def process_products(dry_run: bool = False, write_back_only: bool = False):
+    """Main function to process all products without model images.
+    
+    With write_back_only, poses generated by earlier runs are written to
+    Directus without generating anything; dry_run also skips the writes and
+    prints the changes instead.
+    """
     print("=" * 70)
     print("MODEL POSE GENERATION - Nana Banana Pro")
     print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 70)
     
-    # Disable SSL warnings
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    # Get Directus token
+    # Log in (or reuse the cached Directus session)
     print("\nAuthenticating with Directus...")
     try:
-        token = get_directus_token()
+        directus.token()
         print("✓ Authenticated")
     except Exception as e:
         print(f"✗ Authentication failed: {e}")
@@ -344,81 +510,27 @@ def process_products():
         print("No products need processing!")
         return
     
-    # Process each product
-    total_generated = 0
-    failed_products = []
+    if dry_run or write_back_only:
+        print("\nWriting back poses from earlier runs" + (" (dry run)" if dry_run else ""))
+        write_back("products", model_image_updates(products, upload=not dry_run), dry_run=dry_run)
+        return
     
-    for idx, product in enumerate(products, 1):
-        product_id = product["id"]
-        product_name = product["name"]
-        image_path = product.get("image") or product.get("image_url")
-        
-        print(f"\n[{idx}/{len(products)}] {product_name}")
-        
-        if not image_path:
-            print("  ⚠ No image path, skipping")
-            failed_products.append((product_name, "No image"))
-            continue
-        
-        # Download product image
-        cloudinary_url = get_cloudinary_url(image_path)
-        print(f"  Downloading from: {cloudinary_url[:60]}...")
-        
-        try:
-            image_bytes = download_image(cloudinary_url)
-            print(f"  ✓ Downloaded ({len(image_bytes)} bytes)")
-        except Exception as e:
-            print(f"  ✗ Download failed: {e}")
-            failed_products.append((product_name, "Download failed"))
-            continue
-        
-        # Analyze the product
-        print("  Analyzing outfit...")
-        gender_category = product.get("gender_category")
-        analysis = analyze_product_image(image_bytes, product_name, gender_category)
-        print(f"  ✓ {analysis.get('gender', '?')} {analysis.get('garment_type', '?')} - {analysis.get('style', '?')}")
-        
-        # Generate poses
-        model_images = []
-        
-        for pose_idx, pose in enumerate(POSE_VARIATIONS, 1):
-            print(f"  [{pose_idx}/3] Generating {pose['name']}...")
-            
-            generated_bytes = generate_model_pose(image_bytes, analysis, pose, product_name)
-            
-            if generated_bytes:
-                # Save locally
-                filename = create_safe_filename(product_name, pose['name'])
-                local_path = OUTPUT_FOLDER / f"{filename}.png"
-                local_path.write_bytes(generated_bytes)
-                print(f"      ✓ Saved locally: {filename}.png")
-                
-                # Upload to Cloudinary
-                try:
-                    cloudinary_path = upload_to_cloudinary(generated_bytes, filename)
-                    model_images.append(cloudinary_path)
-                    print(f"      ✓ Ready for upload")
-                    total_generated += 1
-                except Exception as e:
-                    print(f"      ✗ Error: {e}")
-            else:
-                print(f"      ✗ Generation failed")
-            
-            # Delay between poses
-            time.sleep(3)
-        
-        # Skip Directus update - will be done after Cloudinary upload
-        if not model_images:
-            failed_products.append((product_name, "No poses generated"))
-        
-        # Delay between products
-        time.sleep(5)
+    print(f"Pipeline: {DOWNLOAD_WORKERS} download(s), {PRODUCTS_IN_FLIGHT} product(s) generating, "
+          f"{UPLOAD_WORKERS} upload(s)\n")
+    stats = {"generated": 0, "skipped": 0, "failed": []}
+    asyncio.run(run_pipeline(products, stats))
+    uploader.save_manifest()
+    failed_products = stats["failed"]
     
     # Summary
     print("\n" + "=" * 70)
     print("GENERATION COMPLETE")
     print("=" * 70)
-    print(f"Total poses generated: {total_generated}")
+    print(f"Skipped (poses already generated): {stats['skipped']}")
+    print(f"Total poses generated: {stats['generated']}")
+    print(artifact_store.stats())
+    print(file_registry.stats())
+    print(uploader.stats())
     print(f"Failed products: {len(failed_products)}")
     
     if failed_products:
@@ -427,6 +539,15 @@ def process_products():
             print(f"  - {name}: {reason}")
     
     print(f"\nLocal backups saved to: {OUTPUT_FOLDER}")
+    
+    print("\nUpdating Directus...")
+    write_back("products", model_image_updates(products))
 
 if __name__ == "__main__":
-    process_products()
+    parser = argparse.ArgumentParser(description="Generate model poses for products without model images")
+    parser.add_argument("--write-back-only", action="store_true",
+                        help="Only write poses generated earlier to Directus")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show the Directus changes without generating or writing anything")
+    args = parser.parse_args()
+    process_products(dry_run=args.dry_run, write_back_only=args.write_back_only)
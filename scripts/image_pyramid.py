@@ -0,0 +1,153 @@
+"""
+Pre-upload resolution pyramid for raw shoot images.
+
+Gemini downsamples every input anyway, so sending a 9600x6376 original costs
+upload time, latency and tokens for nothing. This builds, once per source
+image, a small pyramid of JPEG derivatives cached under the scripts cache
+dir (keyed by the source's content hash, so every script reuses it):
+
+    thumbnail   ~512 px long edge   - cheap classification
+    analysis    ~1536 px long edge  - garment / model analysis prompts
+    generation  ~3072 px long edge  - reference image for image generation
+
+Sources already smaller than a level are used as-is.
+
+Usage:
+    from image_pyramid import pyramid_source
+
+    source = pyramid_source(image_path, "analysis")   # an ImageSource
+
+    python image_pyramid.py <folder>   # prebuild the pyramid for a shoot
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+
+from PIL import Image, ImageOps
+
+from config import get_cache_dir
+from image_source import ImageSource, open_image
+
+# Long-edge size and JPEG quality per level (largest first)
+PYRAMID_LEVELS = {
+    "generation": {"size": 3072, "quality": 92},
+    "analysis": {"size": 1536, "quality": 90},
+    "thumbnail": {"size": 512, "quality": 85},
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def _pyramid_dir() -> Path:
+    return get_cache_dir() / "pyramid"
+
+
+def _level_path(sha256: str, level: str) -> Path:
+    return _pyramid_dir() / sha256[:2] / f"{sha256}_{level}.jpg"
+
+
+def _original_marker(sha256: str, level: str) -> Path:
+    # Records that the source is already small enough for this level
+    return _pyramid_dir() / sha256[:2] / f"{sha256}_{level}.original"
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """RGB image suitable for JPEG (alpha composited onto white)."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[3])
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def build_pyramid(source: ImageSource) -> Dict[str, Path]:
+    """Build every missing level for *source* from a single decode.
+
+    Returns {level: path}; a level whose path is the source itself means the
+    original was already small enough.
+    """
+    sha = source.sha256
+    with _build_locks_lock:
+        lock = _build_locks.setdefault(sha, threading.Lock())
+
+    with lock:
+        result = {}
+        missing = []
+        for level in PYRAMID_LEVELS:
+            if _level_path(sha, level).exists():
+                result[level] = _level_path(sha, level)
+            elif _original_marker(sha, level).exists():
+                result[level] = source.path
+            else:
+                missing.append(level)
+        if not missing:
+            return result
+
+        with Image.open(source.path) as img:
+            source_long_edge = max(img.size)
+            largest = max(PYRAMID_LEVELS[level]["size"] for level in missing)
+            # JPEG: let the decoder do a cheap DCT-domain downscale first
+            img.draft("RGB", (largest, largest))
+            img = ImageOps.exif_transpose(img)
+            img = _flatten(img)
+
+            for level in PYRAMID_LEVELS:  # largest first, each from the previous
+                if level not in missing:
+                    continue
+                spec = PYRAMID_LEVELS[level]
+                target = _level_path(sha, level)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if source_long_edge <= spec["size"]:
+                    _original_marker(sha, level).touch()
+                    result[level] = source.path
+                    continue
+                if max(img.size) > spec["size"]:
+                    img = img.copy()
+                    img.thumbnail((spec["size"], spec["size"]), Image.Resampling.LANCZOS)
+                tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+                img.save(tmp, "JPEG", quality=spec["quality"], optimize=True, progressive=True)
+                os.replace(tmp, target)
+                result[level] = target
+        return result
+
+
+def pyramid_source(image_path, level: str) -> ImageSource:
+    """ImageSource for *image_path* at pyramid *level* (built on first use)."""
+    if level not in PYRAMID_LEVELS:
+        raise ValueError(f"unknown pyramid level: {level}")
+    source = open_image(image_path)
+    path = build_pyramid(source)[level]
+    return source if path == source.path else open_image(path)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python image_pyramid.py <image-folder>")
+        sys.exit(1)
+    folder = Path(sys.argv[1])
+    images = sorted(f for f in folder.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS)
+    print(f"Building pyramid for {len(images)} images...")
+
+    def build(path):
+        try:
+            build_pyramid(open_image(path))
+            return True
+        except Exception as e:
+            print(f"  ✗ {path.name}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+        built = sum(executor.map(build, images))
+    print(f"✓ {built}/{len(images)} images ready in {_pyramid_dir()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Single-read image sources for Gemini requests.
+
+An ImageSource wraps one image file (or downloaded bytes) and hands the same
+buffer to every request made on it: the file is read once, its MIME type is
+sniffed from the magic bytes rather than the suffix, and the Gemini Part is
+built once and reused. Large originals (the 9600x6376 SONY/DSC files) are
+memory-mapped, so computing the content hash for a cache lookup never copies
+the file onto the heap - the bytes are only materialised if a request
+actually has to be sent.
+
+Usage:
+    from image_source import open_image
+
+    source = open_image(path)        # same object for repeated opens
+    source.sha256                    # content hash for cache keys
+    source.part()                    # types.Part shared by all requests
+"""
+
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from google.genai import types
+
+# Files larger than this are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
+# Recently opened sources kept alive so one image's analysis and its
+# per-garment/per-pose requests share a single buffer
+MAX_OPEN_SOURCES = 8
+
+SUFFIX_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.heic': 'image/heic',
+}
+
+
+def sniff_mime_type(header: bytes, fallback_name: str = "") -> str:
+    """Detect an image MIME type from its first bytes."""
+    if header[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:2] == b"BM":
+        return "image/bmp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1"):
+        return "image/heic"
+    return SUFFIX_MIME_TYPES.get(Path(fallback_name).suffix.lower(), "image/jpeg")
+
+
+class ImageSource:
+    """One image, read at most once, shared by every request on it."""
+
+    def __init__(self, path: Optional[Path] = None, data: Optional[bytes] = None, name: str = ""):
+        self.path = Path(path) if path is not None else None
+        self.name = name or (self.path.name if self.path else "image")
+        self._data = data
+        self._map = None
+        self._sha256 = None
+        self._mime_type = None
+        self._part = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, name: str = "") -> "ImageSource":
+        """Wrap bytes already in memory (e.g. a downloaded image)."""
+        return cls(data=data, name=name)
+
+    # -----------------------------------------------------------------------
+    # Buffer access
+    # -----------------------------------------------------------------------
+
+    def _buffer(self):
+        """bytes or mmap over the whole image, opened on first use."""
+        if self._data is not None:
+            return self._data
+        if self._map is None:
+            size = self.path.stat().st_size
+            with open(self.path, "rb") as f:
+                if size >= MMAP_THRESHOLD:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self._data = f.read()
+                    return self._data
+        return self._map
+
+    @property
+    def data(self) -> bytes:
+        """Image bytes (materialised once, only when a request needs them)."""
+        with self._lock:
+            if self._data is None:
+                buffer = self._buffer()
+                if self._data is None:
+                    self._data = bytes(buffer)
+                    self._close_map()
+            return self._data
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return len(self._buffer())
+
+    @property
+    def sha256(self) -> str:
+        """Hex sha256 of the image content (no heap copy for mmapped files)."""
+        with self._lock:
+            if self._sha256 is None:
+                self._sha256 = hashlib.sha256(self._buffer()).hexdigest()
+            return self._sha256
+
+    @property
+    def mime_type(self) -> str:
+        """MIME type sniffed from the magic bytes."""
+        with self._lock:
+            if self._mime_type is None:
+                self._mime_type = sniff_mime_type(bytes(self._buffer()[:16]), self.name)
+            return self._mime_type
+
+    def part(self) -> types.Part:
+        """The Gemini Part for this image, built once and shared."""
+        if self._part is None:
+            part = types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+            with self._lock:
+                if self._part is None:
+                    self._part = part
+        return self._part
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def release(self):
+        """Drop the buffer and Part (the hash and MIME type are kept)."""
+        with self._lock:
+            self._close_map()
+            if self.path is not None:
+                self._data = None
+            self._part = None
+
+
+# ---------------------------------------------------------------------------
+# Shared open-source cache
+# ---------------------------------------------------------------------------
+
+_sources = OrderedDict()
+_sources_lock = threading.Lock()
+
+
+def open_image(path) -> ImageSource:
+    """Return the ImageSource for *path*, reusing it while the file is unchanged."""
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _sources_lock:
+        source = _sources.get(key)
+        if source is not None:
+            _sources.move_to_end(key)
+            return source
+        source = ImageSource(path)
+        _sources[key] = source
+        while len(_sources) > MAX_OPEN_SOURCES:
+            _, old = _sources.popitem(last=False)
+            old.release()
+        return source
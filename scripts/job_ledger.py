@@ -0,0 +1,247 @@
+"""
+Persistent job ledger for the image pipelines.
+
+Every unit of work - (stage, source, unit), e.g. ("garments.extract",
+"DSC01234.jpg", "2:jacket") - is recorded in a SQLite table with its status,
+attempt count, output path, timings and error class. Pipelines consult the
+ledger before doing anything, so a restarted run skips everything already
+done (without an API call or a cache lookup) and only retries failed units.
+
+A unit counts as done only while its source is unchanged (size + mtime
+fingerprint) and its output file still exists. Units that failed
+LEDGER_MAX_ATTEMPTS times are left alone until reset.
+
+Usage:
+    from job_ledger import get_job_ledger, source_fingerprint
+
+    ledger = get_job_ledger()
+    if not ledger.should_run(stage, source, unit, fingerprint):
+        continue
+    ledger.start(stage, source, unit, fingerprint)
+    ...
+    ledger.done(stage, source, unit, output_path)   # or ledger.failed(..., error)
+
+    python job_ledger.py status [stage-prefix]
+    python job_ledger.py failures [stage-prefix]
+    python job_ledger.py reset <stage-prefix> [--failed-only]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from config import get_cache_dir
+from rate_limit import classify_error
+
+MAX_ATTEMPTS = int(os.getenv("LEDGER_MAX_ATTEMPTS", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    stage TEXT NOT NULL,
+    source TEXT NOT NULL,
+    unit TEXT NOT NULL DEFAULT '',
+    fingerprint TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output_path TEXT,
+    started REAL,
+    finished REAL,
+    duration REAL,
+    error_class TEXT,
+    error TEXT,
+    PRIMARY KEY (stage, source, unit)
+);
+CREATE INDEX IF NOT EXISTS units_status ON units(stage, status);
+"""
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def source_fingerprint(path) -> str:
+    """Cheap change detector for a source file (size + mtime, no hashing)."""
+    stat = Path(path).stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def error_class(error: Union[BaseException, str]) -> str:
+    """Short class name for an error: rate_limited, transient or the exception type."""
+    if isinstance(error, BaseException):
+        rate_limited, transient, _ = classify_error(error)
+        if rate_limited:
+            return "rate_limited"
+        if transient:
+            return "transient"
+        return type(error).__name__
+    return "no_output"
+
+
+class JobLedger:
+    """SQLite-backed record of pipeline units."""
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor
+
+    def get(self, stage: str, source: str, unit: str = "") -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM units WHERE stage = ? AND source = ? AND unit = ?", (stage, source, unit)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def is_done(self, stage: str, source: str, unit: str = "", fingerprint: Optional[str] = None) -> bool:
+        """True if the unit finished for this version of the source and its output still exists."""
+        row = self.get(stage, source, unit)
+        if not row or row["status"] != DONE:
+            return False
+        if fingerprint is not None and row["fingerprint"] != fingerprint:
+            return False
+        return not row["output_path"] or Path(row["output_path"]).exists()
+
+    def should_run(self, stage: str, source: str, unit: str = "", fingerprint: Optional[str] = None) -> bool:
+        """True unless the unit is done or has used up its attempts."""
+        row = self.get(stage, source, unit)
+        if row is None:
+            return True
+        if fingerprint is not None and row["fingerprint"] != fingerprint:
+            return True  # source changed - start over
+        if row["status"] == FAILED:
+            return row["attempts"] < MAX_ATTEMPTS
+        return not self.is_done(stage, source, unit, fingerprint)
+
+    def start(self, stage: str, source: str, unit: str = "", fingerprint: Optional[str] = None):
+        row = self.get(stage, source, unit)
+        attempts = 1
+        if row is not None and (fingerprint is None or row["fingerprint"] == fingerprint):
+            attempts = row["attempts"] + 1
+        self._execute(
+            "INSERT OR REPLACE INTO units (stage, source, unit, fingerprint, status, attempts, started) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stage, source, unit, fingerprint, RUNNING, attempts, time.time()),
+        )
+
+    def _finish(self, stage, source, unit, status, output_path=None, error=None):
+        now = time.time()
+        row = self.get(stage, source, unit)
+        if row is None:
+            self.start(stage, source, unit)
+            row = self.get(stage, source, unit)
+        started = row["started"] or now
+        self._execute(
+            "UPDATE units SET status = ?, output_path = ?, finished = ?, duration = ?, error_class = ?, error = ? "
+            "WHERE stage = ? AND source = ? AND unit = ?",
+            (
+                status,
+                str(output_path) if output_path else None,
+                now,
+                now - started,
+                error_class(error) if error is not None else None,
+                str(error)[:500] if error is not None else None,
+                stage, source, unit,
+            ),
+        )
+
+    def done(self, stage: str, source: str, unit: str = "", output_path=None):
+        self._finish(stage, source, unit, DONE, output_path=output_path)
+
+    def failed(self, stage: str, source: str, unit: str = "", error: Union[BaseException, str] = "failed"):
+        self._finish(stage, source, unit, FAILED, error=error)
+
+    def summary(self, stage_prefix: str = "") -> Dict[str, Dict[str, int]]:
+        """{stage: {status: count}} for stages starting with *stage_prefix*."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stage, status, COUNT(*) FROM units WHERE stage LIKE ? GROUP BY stage, status",
+                (stage_prefix + "%",),
+            ).fetchall()
+        result = {}
+        for stage, status, count in rows:
+            result.setdefault(stage, {})[status] = count
+        return result
+
+    def failures(self, stage_prefix: str = "") -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM units WHERE stage LIKE ? AND status = ? ORDER BY stage, source, unit",
+                (stage_prefix + "%", FAILED),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def reset(self, stage_prefix: str, failed_only: bool = False) -> int:
+        sql = "DELETE FROM units WHERE stage LIKE ?"
+        params = [stage_prefix + "%"]
+        if failed_only:
+            sql += " AND status = ?"
+            params.append(FAILED)
+        return self._execute(sql, params).rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide ledger
+# ---------------------------------------------------------------------------
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_job_ledger() -> JobLedger:
+    """Return the shared JobLedger under the scripts cache dir."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = JobLedger(get_cache_dir() / "ledger.sqlite3")
+        return _ledger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline job ledger")
+    sub = parser.add_subparsers(dest="command", required=True)
+    status_parser = sub.add_parser("status", help="Unit counts per stage")
+    status_parser.add_argument("stage", nargs="?", default="")
+    failures_parser = sub.add_parser("failures", help="List failed units")
+    failures_parser.add_argument("stage", nargs="?", default="")
+    reset_parser = sub.add_parser("reset", help="Forget units so they run again")
+    reset_parser.add_argument("stage")
+    reset_parser.add_argument("--failed-only", action="store_true")
+    args = parser.parse_args()
+
+    ledger = get_job_ledger()
+    if args.command == "status":
+        summary = ledger.summary(args.stage)
+        if not summary:
+            print("No units recorded.")
+        for stage, counts in sorted(summary.items()):
+            print(f"{stage:24} " + "  ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+    elif args.command == "failures":
+        for row in ledger.failures(args.stage):
+            unit = f" [{row['unit']}]" if row["unit"] else ""
+            print(f"{row['stage']}: {row['source']}{unit} - {row['error_class']} "
+                  f"(attempts: {row['attempts']}): {row['error']}")
+    else:
+        if not args.stage:
+            print("❌ Give a stage prefix to reset")
+            sys.exit(1)
+        print(f"Reset {ledger.reset(args.stage, args.failed_only)} unit(s)")
+
+
+if __name__ == "__main__":
+    main()
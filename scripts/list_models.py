@@ -2,15 +2,13 @@
 import os
 import ssl
 import certifi
-from google import genai
-from config import get_google_api_key
+from gemini_client import get_client
 
 # Workaround for SSL certificate issues
 os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
 
-API_KEY = get_google_api_key()
-client = genai.Client(api_key=API_KEY)
+client = get_client()
 
 print("Listing available models...")
 try:
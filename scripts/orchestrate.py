@@ -0,0 +1,368 @@
+"""
+Run the product-media pipeline as a DAG of stages.
+
+    raw shoot ──► garments (extract_all_garments.py) ──┐
+              └─► poses    (extract_model_poses.py)  ──┼─► derivatives (derivatives.py) ──┐
+                                                       └──────────────────────────────────┴─► catalogue (build_catalogue.py)
+                                                                                                └─► publish ─► sync (update-products-from-csv.js)
+
+Each stage declares typed inputs and outputs (an image folder or a single
+file). A stage's fingerprint is the hash of its script plus the
+fingerprints of its inputs. It runs only when that changed since its last
+successful run, or when its outputs went missing or were changed by
+something else. Dependencies come from matching one stage's outputs to
+another's inputs, so garments and poses (which only share the raw images)
+run in parallel, and a batch of new photos flows through every stage
+in one command.
+
+The scripts keep their own per-file bookkeeping (job ledger, caches), so a
+stage that does run only redoes the new work inside it.
+
+Stages that call Gemini share one API key. Each is started with
+GEMINI_QUOTA_SHARE = 1 / (1 + the Gemini stages that may run alongside it),
+so parallel stages together stay within the RPM/TPM quotas; daily request
+counts are merged in the shared usage file (see rate_limit.py).
+
+State is kept per workspace in <cache>/orchestrator-<hash>.json.
+
+Usage:
+    python orchestrate.py                   # run whatever is out of date
+    python orchestrate.py --dry-run         # show what would run and why
+    python orchestrate.py --force catalogue # rerun a stage (and everything downstream)
+    python orchestrate.py --only garments poses
+    python orchestrate.py --workspace "D:/shoots/2024-06"
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Union
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config import get_cache_dir
+
+SCRIPTS_DIR = Path(__file__).parent.resolve()
+REPO_ROOT = SCRIPTS_DIR.parent
+
+# Raw shoot folder the extraction scripts read (same default as the scripts)
+WORKSPACE = Path(os.getenv(
+    "ZECODE_WORKSPACE", r"D:\Avadhut\ZCode\Digial Marketing\Zecode-Website\website-raw-images"
+))
+
+RAW_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+
+
+# ---------------------------------------------------------------------------
+# Artifacts
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class ImageDir:
+    """The image files (by extension, non-recursive) directly in a folder."""
+    path: Path
+    extensions: Sequence[str] = RAW_EXTENSIONS
+    exclude_prefix: str = ""
+
+    def fingerprint(self) -> Optional[str]:
+        if not self.path.is_dir():
+            return None
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                name = entry.name
+                if (not entry.is_file() or not name.lower().endswith(tuple(self.extensions))
+                        or (self.exclude_prefix and name.startswith(self.exclude_prefix))):
+                    continue
+                stat = entry.stat()
+                entries.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+        digest = hashlib.sha256("\n".join(sorted(entries)).encode("utf-8")).hexdigest()
+        return f"{len(entries)}:{digest[:16]}"
+
+    def __str__(self):
+        return f"{self.path}/*"
+
+
+@dataclass(frozen=True)
+class DataFile:
+    """A single file, fingerprinted by content."""
+    path: Path
+
+    def fingerprint(self) -> Optional[str]:
+        if not self.path.is_file():
+            return None
+        h = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()[:16]
+
+    def __str__(self):
+        return str(self.path)
+
+
+Artifact = Union[ImageDir, DataFile]
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Stage:
+    name: str
+    inputs: List[Artifact]
+    outputs: List[Artifact]
+    command: Optional[List[str]] = None        # subprocess, or...
+    action: Optional[Callable[[], None]] = None  # ...an in-process step
+    cwd: Path = SCRIPTS_DIR
+    code: List[Path] = field(default_factory=list)  # files whose edits invalidate the stage
+    env: Dict[str, str] = field(default_factory=dict)
+    gemini: bool = False                        # calls Gemini (shares the API quota)
+
+    def fingerprint(self) -> Optional[str]:
+        """Hash of the stage's code and input fingerprints (None if an input is missing)."""
+        parts = [self.name]
+        for path in self.code:
+            parts.append(DataFile(path).fingerprint() or "")
+        for artifact in self.inputs:
+            fp = artifact.fingerprint()
+            if fp is None:
+                return None
+            parts.append(f"{artifact}={fp}")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    def output_fingerprints(self) -> Dict[str, Optional[str]]:
+        return {str(a): a.fingerprint() for a in self.outputs}
+
+
+def python_stage(name: str, script: str, inputs, outputs, workspace: Path, cwd: Path = SCRIPTS_DIR,
+                 gemini: bool = False) -> Stage:
+    path = SCRIPTS_DIR / script
+    return Stage(name, inputs, outputs, command=[sys.executable, "-u", str(path)], cwd=cwd, code=[path],
+                 env={"ZECODE_WORKSPACE": str(workspace)}, gemini=gemini)
+
+
+def build_stages(workspace: Path) -> List[Stage]:
+    """The pipeline from raw shoot to Directus."""
+    raw = ImageDir(workspace)
+    garments = ImageDir(workspace / "extracted-products", ('.png',), exclude_prefix="ORIGINAL")
+    poses = ImageDir(workspace / "model-poses", ('.png',))
+    manifest = DataFile(workspace / "derivatives" / "manifest.json")
+    catalogue_csv = DataFile(workspace / "product_catalogue.csv")
+    published_csv = DataFile(REPO_ROOT / "product_catalogue.csv")
+    sync_script = SCRIPTS_DIR / "update-products-from-csv.js"
+
+    def publish():
+        # update-products-from-csv.js reads the catalogue from the repo root
+        shutil.copy2(catalogue_csv.path, published_csv.path)
+
+    return [
+        python_stage("garments", "extract_all_garments.py", [raw], [garments], workspace, gemini=True),
+        python_stage("poses", "extract_model_poses.py", [raw], [poses], workspace, gemini=True),
+        python_stage("derivatives", "derivatives.py", [garments, poses], [manifest], workspace, cwd=workspace),
+        python_stage("catalogue", "build_catalogue.py", [garments, poses, manifest],
+                     [catalogue_csv, DataFile(workspace / "product_catalogue.json")], workspace, cwd=workspace,
+                     gemini=True),
+        Stage("publish", [catalogue_csv], [published_csv], action=publish),
+        Stage("sync", [published_csv], [], command=["node", str(sync_script)], cwd=REPO_ROOT, code=[sync_script]),
+    ]
+
+
+def dependencies(stages: List[Stage]) -> Dict[str, List[str]]:
+    """{stage: [stages producing one of its inputs]}."""
+    producers = {str(a): s.name for s in stages for a in s.outputs}
+    return {
+        s.name: sorted({producers[str(a)] for a in s.inputs if str(a) in producers and producers[str(a)] != s.name})
+        for s in stages
+    }
+
+
+def ancestors(deps: Dict[str, List[str]], name: str) -> set:
+    """Every stage *name* depends on, directly or not."""
+    found, todo = set(), list(deps[name])
+    while todo:
+        dep = todo.pop()
+        if dep not in found:
+            found.add(dep)
+            todo.extend(deps[dep])
+    return found
+
+
+def quota_shares(stages: List[Stage], deps: Dict[str, List[str]], planned) -> Dict[str, float]:
+    """{Gemini stage: share of the per-minute quotas} for the *planned* stages.
+
+    Two stages can overlap unless one depends on the other; giving each
+    1 / (1 + stages it may overlap with) keeps any set of concurrently
+    running stages within the whole quota.
+    """
+    gemini = [s.name for s in stages if s.gemini and s.name in planned]
+    related = {name: ancestors(deps, name) for name in gemini}
+    shares = {}
+    for name in gemini:
+        overlapping = [other for other in gemini
+                       if other != name and other not in related[name] and name not in related[other]]
+        shares[name] = 1.0 / (1 + len(overlapping))
+    return shares
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class Orchestrator:
+    """Runs out-of-date stages in dependency order, independent ones in parallel."""
+
+    def __init__(self, stages: List[Stage], state_path: Path):
+        self.stages = {s.name: s for s in stages}
+        self.order = [s.name for s in stages]
+        self.deps = dependencies(stages)
+        self.state_path = state_path
+        self.state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+        self.quota_shares: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def save_state(self):
+        with self._lock:
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.state, indent=2), encoding="utf-8")
+            os.replace(tmp, self.state_path)
+
+    def reason_to_run(self, name: str, forced: set) -> Optional[str]:
+        """Why *name* has to run, or None if it's up to date."""
+        stage = self.stages[name]
+        if name in forced:
+            return "forced"
+        fingerprint = stage.fingerprint()
+        if fingerprint is None:
+            return "input missing"
+        previous = self.state.get(name)
+        if not previous:
+            return "never run"
+        if previous.get("fingerprint") != fingerprint:
+            return "inputs changed"
+        if previous.get("outputs") != stage.output_fingerprints():
+            return "outputs changed"
+        return None
+
+    def _execute(self, stage: Stage) -> bool:
+        print(f"▶ [{stage.name}] started")
+        if stage.action is not None:
+            try:
+                stage.action()
+            except Exception as e:
+                print(f"✗ [{stage.name}] {e}")
+                return False
+            return True
+        stage.cwd.mkdir(parents=True, exist_ok=True)
+        env = dict(os.environ, PYTHONIOENCODING="utf-8", **stage.env)
+        share = self.quota_shares.get(stage.name, 1.0)
+        if share < 1.0:
+            env["GEMINI_QUOTA_SHARE"] = f"{share:.4f}"
+            print(f"  [{stage.name}] Gemini quota share: {share:.0%}")
+        process = subprocess.Popen(
+            stage.command, cwd=str(stage.cwd), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace",
+        )
+        # Prefix output so parallel stages stay readable
+        for line in process.stdout:
+            print(f"  [{stage.name}] {line.rstrip()}")
+        return process.wait() == 0
+
+    def run(self, only: Optional[List[str]] = None, forced: Sequence[str] = (), dry_run: bool = False) -> bool:
+        selected = set(only or self.order)
+        forced = set(forced)
+        # Forcing a stage reruns everything downstream of it too
+        for name in self.order:
+            if any(dep in forced for dep in self.deps[name]):
+                forced.add(name)
+
+        plan = {}
+        for name in self.order:
+            if name in selected:
+                plan[name] = self.reason_to_run(name, forced)
+        print("Pipeline plan:")
+        for name, reason in plan.items():
+            deps = f" (after {', '.join(self.deps[name])})" if self.deps[name] else ""
+            print(f"  {name:12} {'run: ' + reason if reason else 'up to date'}{deps}")
+        if dry_run:
+            return True
+
+        pending = set(plan)
+        # Up-to-date stages may still run after an upstream change, so all planned ones count
+        self.quota_shares = quota_shares(list(self.stages.values()), self.deps, pending)
+        done, failed = set(), set()
+        running = {}
+        started = datetime.now()
+        with ThreadPoolExecutor(max_workers=len(self.order)) as executor:
+            while pending or running:
+                for name in [n for n in self.order if n in pending]:
+                    deps = [d for d in self.deps[name] if d in plan]
+                    if any(d in failed for d in deps):
+                        print(f"⏭ [{name}] skipped - upstream stage failed")
+                        pending.discard(name)
+                        failed.add(name)
+                    elif all(d in done for d in deps):
+                        pending.discard(name)
+                        # Recheck now that upstream stages may have changed the inputs
+                        if name not in forced and self.reason_to_run(name, forced) is None:
+                            print(f"✓ [{name}] up to date")
+                            done.add(name)
+                            continue
+                        running[executor.submit(self._execute, self.stages[name])] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    if future.result():
+                        with self._lock:
+                            self.state[name] = {
+                                "fingerprint": stage.fingerprint(),
+                                "outputs": stage.output_fingerprints(),
+                                "finished": datetime.now().isoformat(),
+                            }
+                        self.save_state()
+                        print(f"✓ [{name}] done")
+                        done.add(name)
+                    else:
+                        print(f"✗ [{name}] failed")
+                        failed.add(name)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"\nFinished in {elapsed:.0f}s - {len(done)} ok, {len(failed)} failed")
+        return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the product-media pipeline, rerunning only what changed")
+    parser.add_argument("--workspace", type=Path, default=WORKSPACE, help="Raw shoot folder")
+    parser.add_argument("--only", nargs="+", metavar="STAGE", help="Limit the run to these stages")
+    parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="Rerun these stages and their dependents")
+    parser.add_argument("--dry-run", action="store_true", help="Show the plan without running anything")
+    args = parser.parse_args()
+
+    stages = build_stages(args.workspace)
+    names = {s.name for s in stages}
+    unknown = [n for n in (args.only or []) + args.force if n not in names]
+    if unknown:
+        print(f"❌ Unknown stage(s): {', '.join(unknown)} (stages: {', '.join(s.name for s in stages)})")
+        sys.exit(1)
+
+    digest = hashlib.sha256(str(args.workspace.resolve()).encode("utf-8")).hexdigest()[:12]
+    orchestrator = Orchestrator(stages, get_cache_dir() / f"orchestrator-{digest}.json")
+    ok = orchestrator.run(only=args.only, forced=args.force, dry_run=args.dry_run)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Output naming shared by the outfit extraction scripts.
+
+extract_with_nano_banana.py (one request per image) and
+extract_outfits_batch.py (Batch API) write to the same folder with the same
+names. This module only holds that naming - importing it creates no Gemini
+client, cache or ledger, so scripts can import it before their own setup.
+
+Usage:
+    from outfit_naming import OUTPUT_FOLDER, build_filename
+
+    path = OUTPUT_FOLDER / build_filename(analysis, idx)
+"""
+
+import pathlib
+from typing import Dict
+
+# Output folder – extracted outfit images
+OUTPUT_FOLDER = pathlib.Path(__file__).parent / "extracted-outfits"
+
+
+def build_filename(analysis: Dict, idx: int) -> str:
+    """Construct a descriptive filename based on *analysis*.
+    Pattern: {gender}_{primarycolor}_{graphic?}_{fit}_{garment}_{textsample}.png
+    """
+    gender = analysis.get("gender", "unknown")
+    color = analysis.get("primary_color", "color").replace(" ", "_")
+    garment = analysis.get("garment_type", "garment").replace(" ", "_")
+    fit = analysis.get("fit_style", "regular").replace(" ", "_")
+    graphics = analysis.get("graphics", [])
+    graphic_part = graphics[0].replace(" ", "_") if graphics else "plain"
+    text = analysis.get("text_on_clothing", "")
+    text_part = text.replace(" ", "_") if text else "no-text"
+    filename = f"{gender}_{color}_{graphic_part}_{fit}_{garment}_{text_part}_{idx}.png"
+    # Sanitize
+    return "".join(c for c in filename if c.isalnum() or c in "_-.")
@@ -0,0 +1,372 @@
+"""
+Perceptual hashes and near-duplicate clusters for the generated images.
+
+The same shoot exported twice (_DSC3800.jpg and _DSC3800_Large.jpg) or
+re-extracted on a rerun gives garment and pose PNGs that differ in bytes
+but not to the eye. Content hashes can't see that; perceptual hashes can:
+
+    dhash  - 8x8 sign of horizontal gradients of a 9x8 thumbnail
+    phash  - 8x8 low-frequency DCT coefficients of a 32x32 thumbnail,
+             thresholded at their median
+
+Both are 64-bit and compared by Hamming distance. Thumbnails are decoded on
+a thread pool and every hash is computed in one NumPy pass over the stacked
+thumbnails. Images count as duplicates when both distances are within the
+radius; candidates come from a BK-tree on the pHash, so clustering is a
+handful of tree queries per image instead of comparing every pair.
+
+Hashes are persisted per folder in <cache>/phash-<hash>.json and only
+recomputed for files whose size or mtime changed.
+
+The same works on the raw shoot: canonical_images() keeps the largest copy
+of every frame (full size vs _Large vs re-exported file_1616x1080_*) so
+the extraction scripts only send that one to Gemini, and records the rest
+in <cache>/raw-duplicates-<hash>.json as {duplicate: canonical} - the
+shoot folder itself is never written to.
+
+Usage:
+    python perceptual_hash.py [FOLDER ...] [--radius 6] [--raw]
+
+    from perceptual_hash import HashIndex, find_duplicates
+
+    index = HashIndex.load(GARMENTS_FOLDER)
+    clusters = find_duplicates(index.entries(names), radius=6)   # [[canonical, dup, ...], ...]
+
+    images, duplicates = canonical_images(get_image_files())
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import get_cache_dir
+
+# Maximum Hamming distance (of 64 bits) for two images to count as the same
+DUPLICATE_RADIUS = int(os.getenv("DUPLICATE_RADIUS", "6"))
+
+# Tighter for raw photos, where burst frames differ only slightly (-1 disables)
+RAW_DUPLICATE_RADIUS = int(os.getenv("RAW_DUPLICATE_RADIUS", "4"))
+RAW_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+RAW_DUPLICATES_FILE = "raw-duplicates-{digest}.json"  # under the cache dir, per folder
+
+HASH_SIZE = 8
+PHASH_SIZE = 32
+
+# Bump when hashing changes so persisted hashes are recomputed
+INDEX_VERSION = 1
+
+
+# ---------------------------------------------------------------------------
+# Hashing
+# ---------------------------------------------------------------------------
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix: coefficients = M @ x."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def thumbnails(path) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """(9x8 and 32x32 grayscale thumbnails as float32, original (width, height))."""
+    with Image.open(path) as img:
+        size = img.size
+        img.draft("L", (PHASH_SIZE * 4, PHASH_SIZE * 4))  # JPEG: decode at reduced scale
+        if img.mode in ("RGBA", "LA", "P"):
+            # Garments sit on transparency - hash them on white like they're shown
+            img = img.convert("RGBA")
+            background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        gray = img.convert("L")
+        dsmall = gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+        psmall = gray.resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.BOX)
+    return np.asarray(dsmall, dtype=np.float32), np.asarray(psmall, dtype=np.float32), size
+
+
+def _pack(bits: np.ndarray) -> List[str]:
+    """(N, 64) booleans -> N hex strings."""
+    return [row.tobytes().hex() for row in np.packbits(bits, axis=1)]
+
+
+def compute_hashes(dthumbs: np.ndarray, pthumbs: np.ndarray) -> Tuple[List[str], List[str]]:
+    """dHash and pHash hex strings for stacks of (N, 8, 9) and (N, 32, 32) thumbnails."""
+    n = len(dthumbs)
+    if not n:
+        return [], []
+    dhash = dthumbs[:, :, 1:] > dthumbs[:, :, :-1]
+    # pHash: top-left 8x8 DCT coefficients against their median (DC excluded)
+    coeffs = (_DCT @ pthumbs @ _DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(n, -1)
+    median = np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    phash = coeffs > median
+    return _pack(dhash.reshape(n, -1)), _pack(phash)
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+# ---------------------------------------------------------------------------
+# BK-tree
+# ---------------------------------------------------------------------------
+
+class BKTree:
+    """Metric tree over hex hashes for Hamming-radius queries."""
+
+    def __init__(self):
+        self.root = None   # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, value: str, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value: str, radius: int) -> List[Tuple[int, object]]:
+        """[(distance, item)] for every item within *radius* of *value*."""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                results.extend((d, item) for item in node[1])
+            # Triangle inequality: only children at distance d +/- radius can match
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        return results
+
+    def __len__(self):
+        return self.size
+
+
+# ---------------------------------------------------------------------------
+# Persisted per-folder index
+# ---------------------------------------------------------------------------
+
+class HashIndex:
+    """Perceptual hashes of the images (PNGs by default) in one folder."""
+
+    def __init__(self, folder: Path, path: Path, extensions=('.png',), exclude_prefix: str = "ORIGINAL"):
+        self.folder = Path(folder)
+        self.path = path
+        self.extensions = tuple(extensions)
+        self.exclude_prefix = exclude_prefix
+        self._files: Dict[str, Dict] = {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, folder, extensions=('.png',), exclude_prefix: str = "ORIGINAL", workers: int = 8) -> "HashIndex":
+        """Load the persisted hashes for *folder* and hash new or changed files."""
+        folder = Path(folder)
+        key = f"{folder.resolve()}|{','.join(extensions)}|{exclude_prefix}"
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+        index = cls(folder, get_cache_dir() / f"phash-{digest}.json", extensions, exclude_prefix)
+        try:
+            data = json.loads(index.path.read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                index._files = data.get("files", {})
+        except (OSError, ValueError):
+            pass
+        index.refresh(workers)
+        index.save()
+        return index
+
+    def refresh(self, workers: int = 8):
+        if not self.folder.exists():
+            return
+        stats = {}
+        with os.scandir(self.folder) as entries:
+            for e in entries:
+                if (e.is_file() and e.name.lower().endswith(self.extensions)
+                        and not (self.exclude_prefix and e.name.startswith(self.exclude_prefix))):
+                    st = e.stat()
+                    stats[e.name] = (st.st_size, st.st_mtime_ns)
+        for name in set(self._files) - set(stats):
+            del self._files[name]
+            self._dirty = True
+        todo = [
+            name for name, (size, mtime) in stats.items()
+            if (self._files.get(name, {}).get("size"), self._files.get(name, {}).get("mtime_ns")) != (size, mtime)
+        ]
+        if not todo:
+            return
+        print(f"Hashing {len(todo)} image(s) in {self.folder}...")
+
+        def load(name):
+            try:
+                return name, thumbnails(self.folder / name)
+            except Exception as e:
+                print(f"  ✗ {name}: {e}")
+                return name, None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = [(name, result) for name, result in executor.map(load, sorted(todo)) if result]
+        if not loaded:
+            return
+        dhashes, phashes = compute_hashes(np.stack([r[0] for _, r in loaded]), np.stack([r[1] for _, r in loaded]))
+        for (name, (_, _, (width, height))), dhash, phash in zip(loaded, dhashes, phashes):
+            size, mtime = stats[name]
+            self._files[name] = {
+                "size": size, "mtime_ns": mtime, "width": width, "height": height,
+                "dhash": dhash, "phash": phash,
+            }
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        # Per-process temp name: the garment and pose scripts may save the same index at once
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"version": INDEX_VERSION, "files": self._files}), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def get(self, name: str) -> Optional[Dict]:
+        return self._files.get(name)
+
+    def entries(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """{name: hash entry} for *names* (default: every hashed file)."""
+        if names is None:
+            return dict(self._files)
+        return {name: self._files[name] for name in names if name in self._files}
+
+    def __len__(self):
+        return len(self._files)
+
+
+# ---------------------------------------------------------------------------
+# Clustering
+# ---------------------------------------------------------------------------
+
+def canonical_order(name: str, entry: Dict):
+    """Sort key: largest image first, then the shortest (least suffixed) name."""
+    return (-entry["width"] * entry["height"], len(name), name)
+
+
+def find_duplicates(entries: Dict[str, Dict], radius: int = DUPLICATE_RADIUS,
+                    group: Optional[Callable[[str], object]] = None) -> List[List[str]]:
+    """Clusters of near-identical images, canonical image first.
+
+    Two images are linked when both their pHash and dHash distances are
+    within *radius*; clusters are the connected groups. With *group*, only
+    names with the same group(name) are compared (e.g. same garment type).
+    Images without duplicates are left out.
+    """
+    buckets: Dict[object, List[str]] = {}
+    for name in entries:
+        buckets.setdefault(group(name) if group else None, []).append(name)
+
+    clusters = []
+    for names in buckets.values():
+        if len(names) < 2:
+            continue
+        parent = {name: name for name in names}
+
+        def root(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        tree = BKTree()
+        for name in names:
+            entry = entries[name]
+            for _, other in tree.query(entry["phash"], radius):
+                if hamming(entry["dhash"], entries[other]["dhash"]) <= radius:
+                    parent[root(name)] = root(other)
+            tree.add(entry["phash"], name)
+
+        members: Dict[str, List[str]] = {}
+        for name in names:
+            members.setdefault(root(name), []).append(name)
+        for cluster in members.values():
+            if len(cluster) > 1:
+                clusters.append(sorted(cluster, key=lambda n: canonical_order(n, entries[n])))
+    clusters.sort(key=lambda c: c[0])
+    return clusters
+
+
+def canonical_map(clusters: List[List[str]]) -> Dict[str, str]:
+    """{duplicate name: canonical name} for every non-canonical member."""
+    return {name: cluster[0] for cluster in clusters for name in cluster[1:]}
+
+
+def raw_duplicates_path(folder: Path) -> Path:
+    """Where canonical_images records the duplicates found in *folder*."""
+    digest = hashlib.sha256(str(Path(folder).resolve()).encode("utf-8")).hexdigest()[:12]
+    return get_cache_dir() / RAW_DUPLICATES_FILE.format(digest=digest)
+
+
+def canonical_images(paths: List[Path], radius: int = RAW_DUPLICATE_RADIUS) -> Tuple[List[Path], Dict[str, str]]:
+    """Raw images with near-duplicates removed, and {duplicate name: canonical name}.
+
+    *paths* are files in one folder (the workspace). The largest member of
+    each cluster is kept; the mapping is also written to raw_duplicates_path(folder).
+    """
+    paths = list(paths)
+    if not paths or radius < 0:
+        return paths, {}
+    folder = paths[0].parent
+    index = HashIndex.load(folder, extensions=RAW_EXTENSIONS, exclude_prefix="")
+    duplicates = canonical_map(find_duplicates(index.entries(p.name for p in paths), radius))
+
+    mapping_path = raw_duplicates_path(folder)
+    tmp = mapping_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(duplicates, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, mapping_path)
+    if duplicates:
+        print(f"Skipping {len(duplicates)} duplicate raw image(s) (see {mapping_path})")
+    return [p for p in paths if p.name not in duplicates], duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate images by perceptual hash")
+    parser.add_argument("folders", nargs="*", type=Path,
+                        default=[Path("extracted-products"), Path("model-poses")])
+    parser.add_argument("--radius", type=int, default=DUPLICATE_RADIUS,
+                        help="Max Hamming distance of 64 bits (default: %(default)s)")
+    parser.add_argument("--raw", action="store_true", help="Folders hold raw photos (any image type)")
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        if args.raw:
+            index = HashIndex.load(folder, extensions=RAW_EXTENSIONS, exclude_prefix="")
+        else:
+            index = HashIndex.load(folder)
+        clusters = find_duplicates(index.entries(), radius=args.radius)
+        redundant = sum(len(c) - 1 for c in clusters)
+        print(f"\n{folder}: {len(index)} images, {len(clusters)} duplicate clusters, {redundant} redundant")
+        for cluster in clusters:
+            print(f"  ✓ {cluster[0]}")
+            for name in cluster[1:]:
+                entry = index.get(name)
+                print(f"      = {name} ({entry['width']}x{entry['height']})")
+
+
+if __name__ == "__main__":
+    main()
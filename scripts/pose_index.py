@@ -0,0 +1,214 @@
+"""
+Persisted index of generated model-pose images.
+
+Pose files are named
+    [modelN_]<gender>_<style>_<pose>_<original image stem>.png
+e.g. model2_female_casual_front_standing__DSC3713_Large.png. This index
+parses each name once, maps the original stem to a canonical source key
+and keeps the result on disk, so "is this raw image done, and which poses
+exist" is a dict lookup instead of a glob plus substring scan.
+
+Canonical source keys compare exactly (DSC380 never matches DSC3800):
+    _DSC3713 (Large).jpg               -> DSC3713
+    SONY ILCE-7RM5 6304x4180 000006    -> SONY_ilce-7rm5_6304x4180_6
+    ShootB SONY ILCE-7RM5 6304x4180 6  -> shootb_SONY_ilce-7rm5_6304x4180_6
+    file_1616x1080_00132               -> file_1616x1080_132
+    anything else                      -> stem:<cleaned lowercase stem>
+
+Sony names carry no shoot id, so the key keeps the camera body and any
+text before "SONY"; callers that see two raw images with the same key
+should not trust the index for them (see extract_model_poses.py).
+
+The index is rebuilt incrementally: when the folder changes only new names
+are parsed and deleted ones dropped, and the pipelines add poses as they
+write them.
+
+Usage:
+    from pose_index import PoseIndex, source_key
+
+    index = PoseIndex.load(POSES_FOLDER)
+    index.has_source(source_key(image_path.stem))
+    index.find(source_key(ref), "female", model_num=2)   # {pose: filename}
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import get_cache_dir
+
+POSE_NAMES = ("front_standing", "three_quarter", "casual_lifestyle")
+
+# Bump when parsing changes so persisted indexes are rebuilt
+INDEX_VERSION = 2
+
+DSC_RE = re.compile(r'DSC[_ -]?0*(\d+)', re.IGNORECASE)
+SONY_RE = re.compile(r'^(.*?)SONY[_ -]*([^.]*?)[_ -]*(\d+x\d+)[_ -]0*(\d+)', re.IGNORECASE)
+FILE_RE = re.compile(r'(?:^|[_ -])file[_ -](\d+x\d+)[_ -]0*(\d+)', re.IGNORECASE)
+POSE_RE = re.compile(r'_(' + '|'.join(POSE_NAMES) + r')_')
+MODEL_RE = re.compile(r'^model(\d+)_')
+
+
+def clean_stem(stem: str) -> str:
+    """Stem as the generators embed it in output names."""
+    stem = stem.replace(' ', '_')
+    return "".join(c for c in stem if c.isalnum() or c in '_-')
+
+
+def source_key(name: str) -> str:
+    """Canonical key for a raw image stem (or the source part of an output name)."""
+    dsc = DSC_RE.search(name)
+    if dsc:
+        return f"DSC{int(dsc.group(1))}"
+    sony = SONY_RE.search(name)
+    if sony:
+        # Camera body and any leading shoot prefix keep different shoots apart
+        prefix = re.sub(r'[^a-z0-9]', '', sony.group(1).lower())
+        body = re.sub(r'[^a-z0-9-]', '', sony.group(2).lower())
+        key = "_".join(part for part in ("SONY", body, sony.group(3).lower(), str(int(sony.group(4)))) if part)
+        return f"{prefix}_{key}" if prefix else key
+    file_match = FILE_RE.search(name)
+    if file_match:
+        return f"file_{file_match.group(1).lower()}_{int(file_match.group(2))}"
+    return "stem:" + clean_stem(name).strip('_').lower()
+
+
+def parse_pose_filename(filename: str) -> Optional[Dict]:
+    """Split a pose filename into model number, gender, style, pose and source key."""
+    stem = Path(filename).stem
+    if stem.startswith('ORIGINAL'):
+        return None
+    pose_match = POSE_RE.search(stem)
+    if not pose_match:
+        return None
+    model_match = MODEL_RE.match(stem)
+    model_num = int(model_match.group(1)) if model_match else 1
+    head = stem[model_match.end() if model_match else 0:pose_match.start()]
+    gender, _, style = head.partition('_')
+    return {
+        "model_number": model_num,
+        "gender": gender.lower(),
+        "style": style,
+        "pose": pose_match.group(1),
+        "source": source_key(stem[pose_match.end():]),
+    }
+
+
+class PoseIndex:
+    """Pose files in one folder, grouped by canonical source key."""
+
+    def __init__(self, folder: Path, path: Path):
+        self.folder = Path(folder)
+        self.path = path
+        self._lock = threading.Lock()
+        self._files: Dict[str, Optional[Dict]] = {}
+        self._by_source: Dict[str, Dict[tuple, str]] = {}
+        self._dir_mtime = None
+        self._dirty = False
+
+    @classmethod
+    def load(cls, folder) -> "PoseIndex":
+        """Load the persisted index for *folder* and bring it up to date."""
+        folder = Path(folder)
+        digest = hashlib.sha256(str(folder.resolve()).encode("utf-8")).hexdigest()[:12]
+        index = cls(folder, get_cache_dir() / f"pose-index-{digest}.json")
+        try:
+            data = json.loads(index.path.read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                index._dir_mtime = data.get("dir_mtime")
+                for name, entry in data.get("files", {}).items():
+                    index._add(name, entry)
+        except (OSError, ValueError):
+            pass
+        index.refresh()
+        index.save()
+        return index
+
+    def _add(self, name: str, entry: Optional[Dict]):
+        self._files[name] = entry
+        if entry:
+            key = (entry["gender"], entry["model_number"], entry["pose"])
+            self._by_source.setdefault(entry["source"], {})[key] = name
+
+    def _remove(self, name: str):
+        entry = self._files.pop(name, None)
+        if entry:
+            poses = self._by_source.get(entry["source"], {})
+            key = (entry["gender"], entry["model_number"], entry["pose"])
+            if poses.get(key) == name:
+                del poses[key]
+            if not poses:
+                self._by_source.pop(entry["source"], None)
+
+    def refresh(self):
+        """Re-scan the folder if it changed since the index was saved."""
+        if not self.folder.exists():
+            return
+        dir_mtime = self.folder.stat().st_mtime_ns
+        if dir_mtime == self._dir_mtime:
+            return
+        with os.scandir(self.folder) as entries:
+            names = {e.name for e in entries if e.name.lower().endswith('.png')}
+        with self._lock:
+            for name in set(self._files) - names:
+                self._remove(name)
+            for name in names - set(self._files):
+                self._add(name, parse_pose_filename(name))
+            self._dir_mtime = dir_mtime
+            self._dirty = True
+
+    def add(self, filename: str):
+        """Record a pose file the caller just wrote."""
+        with self._lock:
+            self._remove(filename)
+            self._add(filename, parse_pose_filename(filename))
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": INDEX_VERSION, "dir_mtime": self._dir_mtime, "files": self._files}
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    # -----------------------------------------------------------------------
+    # Lookups
+    # -----------------------------------------------------------------------
+
+    def has_source(self, key: str) -> bool:
+        """True if any pose was generated from source *key*."""
+        return bool(self._by_source.get(key))
+
+    def poses_for(self, key: str) -> Dict[tuple, str]:
+        """{(gender, model_number, pose): filename} for source *key*."""
+        return dict(self._by_source.get(key, {}))
+
+    def lookup(self, key: str, gender: str, pose: str, model_num: int = 1) -> Optional[str]:
+        return self._by_source.get(key, {}).get((gender.lower(), model_num, pose))
+
+    def find(self, key: str, gender: str, model_num: Optional[int] = None) -> Dict[str, str]:
+        """{pose: filename} for one model of source *key*.
+
+        With *model_num*, that model's poses are used; if it has none, the
+        lowest-numbered model of the same gender is used instead.
+        """
+        gender = gender.lower()
+        by_model: Dict[int, Dict[str, str]] = {}
+        for (g, num, pose), name in self._by_source.get(key, {}).items():
+            if g == gender:
+                by_model.setdefault(num, {})[pose] = name
+        if not by_model:
+            return {}
+        if model_num in by_model:
+            return by_model[model_num]
+        return by_model[min(by_model)]
+
+    def __len__(self):
+        return sum(len(poses) for poses in self._by_source.values())
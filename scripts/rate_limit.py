@@ -0,0 +1,342 @@
+"""
+Quota-aware rate limiting for Gemini calls.
+
+Each model gets a limiter that tracks the three quotas Google enforces:
+requests per minute (RPM), tokens per minute (TPM) and requests per day
+(RPD). RPM/TPM are token buckets; RPD is a daily counter persisted under
+the scripts cache dir so separate runs on the same day share it.
+
+The effective rate adapts AIMD-style: every 429 halves it (and honours any
+Retry-After / RetryInfo delay for all callers), every success creeps it
+back up towards the configured ceiling. gemini_client.GeminiPool calls
+this for every request, so scripts no longer sleep between calls.
+
+Several processes can share one API key. Each process flushes only its own
+new requests into the usage file (under a lock file), so daily counts add
+up instead of the last writer winning. Processes running side by side
+(orchestrate.py's parallel stages) each get GEMINI_QUOTA_SHARE (0-1) of
+the RPM/TPM quotas.
+"""
+
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from config import get_cache_dir
+
+# ---------------------------------------------------------------------------
+# Quotas (paid tier 1 defaults - override with GEMINI_QUOTAS='{"model": {"rpm": ..}}')
+# ---------------------------------------------------------------------------
+
+DEFAULT_QUOTA = {"rpm": 60, "tpm": 1_000_000, "rpd": 1_000}
+
+MODEL_QUOTAS = {
+    "gemini-2.5-flash": {"rpm": 1_000, "tpm": 1_000_000, "rpd": 10_000},
+    "gemini-1.5-flash": {"rpm": 1_000, "tpm": 1_000_000, "rpd": 10_000},
+    "gemini-3-pro-image-preview": {"rpm": 20, "tpm": 100_000, "rpd": 250},
+    "gemini-2.0-flash-exp-image-generation": {"rpm": 10, "tpm": 200_000, "rpd": 1_000},
+    "imagen-3.0-fast-generate-001": {"rpm": 10, "tpm": 1_000_000, "rpd": 1_000},
+}
+
+# AIMD tuning
+MIN_RATE_FACTOR = 0.05        # never drop below 5% of the configured quota
+DECREASE_FACTOR = 0.5         # multiplicative decrease on 429
+INCREASE_STEP = 0.02          # additive increase per successful request
+DEFAULT_RETRY_AFTER = 10.0    # seconds to pause on a 429 with no hint
+
+# Rough token accounting used before the response tells us the real usage
+CHARS_PER_TOKEN = 4
+IMAGE_PART_TOKENS = 1_290     # a large image is tiled; ~5 tiles x 258
+IMAGE_OUTPUT_TOKENS = 1_290   # one generated image
+
+USAGE_FILE = "quota-usage.json"
+# A usage lock older than this was left by a crashed process
+STALE_LOCK_SECONDS = 30
+
+# Fraction of the per-minute quotas this process may use
+QUOTA_SHARE = min(1.0, max(0.01, float(os.getenv("GEMINI_QUOTA_SHARE", "1"))))
+
+
+class QuotaExhausted(RuntimeError):
+    """Raised when a model's requests-per-day quota is used up."""
+
+
+def _load_overrides() -> Dict:
+    raw = os.getenv("GEMINI_QUOTAS")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        print("⚠ Ignoring GEMINI_QUOTAS: not valid JSON")
+        return {}
+
+
+class TokenBucket:
+    """Classic token bucket; capacity refills linearly over one minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float, scale: float):
+        rate = self.capacity * scale / 60.0
+        self.tokens = min(self.capacity * scale, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, scale: float) -> float:
+        """Seconds until *amount* is available (0 if it is available now)."""
+        self._refill(now, scale)
+        # Requests larger than the bucket would never fit - let them drain it
+        amount = min(amount, self.capacity * scale)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.capacity * scale / 60.0)
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+
+class ModelLimiter:
+    """RPM/TPM/RPD limiter with AIMD rate adaptation for one model."""
+
+    def __init__(self, model: str, rpm: int, tpm: int, rpd: int, usage: "DailyUsage"):
+        self.model = model
+        self.rpd = rpd
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.usage = usage
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self, est_tokens: int) -> float:
+        """Try to reserve one request; return 0 on success or seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.usage.count(self.model) >= self.rpd:
+                raise QuotaExhausted(f"{self.model}: daily quota of {self.rpd} requests used up")
+            wait = max(
+                self.requests.wait_time(1, now, self.rate_factor),
+                self.tokens.wait_time(est_tokens, now, self.rate_factor),
+            )
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(est_tokens)
+            self.usage.add(self.model)
+            return 0.0
+
+    def acquire(self, est_tokens: int):
+        """Block until a request slot is available."""
+        while True:
+            wait = self.reserve(est_tokens)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 5.0))
+
+    def on_success(self, est_tokens: int, actual_tokens: Optional[int] = None):
+        """Reconcile token usage and additively raise the rate."""
+        with self.lock:
+            if actual_tokens:
+                self.tokens.take(actual_tokens - est_tokens)
+            self.rate_factor = min(1.0, self.rate_factor + INCREASE_STEP)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """Halve the rate and pause every caller; return the pause in seconds."""
+        with self.lock:
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * DECREASE_FACTOR)
+            pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER / self.rate_factor ** 0.5
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            # Whatever was in the buckets clearly isn't really available
+            self.requests.tokens = 0
+            return pause
+
+
+@contextmanager
+def _file_lock(path):
+    """Cross-process lock: exclusive creation of *path*."""
+    deadline = time.monotonic() + STALE_LOCK_SECONDS
+    while True:
+        try:
+            fd = os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                stale = time.time() - path.stat().st_mtime > STALE_LOCK_SECONDS
+            except OSError:
+                stale = False
+            if stale or time.monotonic() > deadline:
+                path.unlink(missing_ok=True)
+            else:
+                time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        path.unlink(missing_ok=True)
+
+
+class DailyUsage:
+    """Per-model request counts for the current UTC day, persisted to disk.
+
+    counts includes other processes' requests as of the last flush; pending
+    holds this process's requests not yet added to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.day = self._today()
+        self.counts = self._read().get(self.day, {})
+        self.pending = {}
+        self.dirty = 0
+
+    def _read(self) -> Dict[str, Dict[str, int]]:
+        """{day: counts} from the usage file."""
+        try:
+            data = json.loads(self.path.read_text())
+            return {data["day"]: data.get("counts", {})}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _roll(self):
+        today = self._today()
+        if today != self.day:
+            self.day, self.counts, self.pending = today, {}, {}
+
+    def count(self, model: str) -> int:
+        with self.lock:
+            self._roll()
+            return self.counts.get(model, 0)
+
+    def add(self, model: str):
+        with self.lock:
+            self._roll()
+            self.counts[model] = self.counts.get(model, 0) + 1
+            self.pending[model] = self.pending.get(model, 0) + 1
+            self.dirty += 1
+            if self.dirty >= 20:
+                self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        """Add this process's pending requests to the file's counts."""
+        self.dirty = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with _file_lock(self.path.with_suffix(".lock")):
+            counts = self._read().get(self.day, {})
+            for model, n in self.pending.items():
+                counts[model] = counts.get(model, 0) + n
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"day": self.day, "counts": counts}, indent=2))
+            os.replace(tmp, self.path)
+        self.counts, self.pending = counts, {}
+
+
+# ---------------------------------------------------------------------------
+# Error classification
+# ---------------------------------------------------------------------------
+
+def _parse_delay(value) -> Optional[float]:
+    """Parse '32s', '1.5s' or '30' into seconds."""
+    if value is None:
+        return None
+    match = re.match(r"^\s*([\d.]+)\s*s?\s*$", str(value))
+    return float(match.group(1)) if match else None
+
+
+def classify_error(exc: Exception) -> Tuple[bool, bool, Optional[float]]:
+    """Classify a Gemini SDK exception.
+
+    Returns (rate_limited, transient, retry_after_seconds). Rate limits are
+    HTTP 429 / RESOURCE_EXHAUSTED; transient errors are 5xx and timeouts.
+    """
+    code = getattr(exc, "code", None)
+    status = getattr(exc, "status", None) or ""
+    rate_limited = code == 429 or status == "RESOURCE_EXHAUSTED"
+    transient = (isinstance(code, int) and code >= 500) or "Timeout" in type(exc).__name__
+
+    retry_after = None
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        retry_after = _parse_delay(headers.get("retry-after"))
+    details = getattr(exc, "details", None)
+    if retry_after is None and isinstance(details, dict):
+        for item in details.get("error", {}).get("details", []) or []:
+            if isinstance(item, dict) and item.get("@type", "").endswith("RetryInfo"):
+                retry_after = _parse_delay(item.get("retryDelay"))
+    return rate_limited, transient, retry_after
+
+
+def estimate_tokens(contents, image_output: bool = False) -> int:
+    """Cheap upper-ish estimate of a request's token cost."""
+    total = 0
+
+    def visit(item):
+        nonlocal total
+        if isinstance(item, str):
+            total += len(item) // CHARS_PER_TOKEN + 1
+        elif isinstance(item, (list, tuple)):
+            for sub in item:
+                visit(sub)
+        elif getattr(item, "parts", None) is not None:
+            visit(item.parts)
+        elif getattr(item, "text", None):
+            total += len(item.text) // CHARS_PER_TOKEN + 1
+        elif getattr(item, "inline_data", None) is not None or getattr(item, "file_data", None) is not None:
+            total += IMAGE_PART_TOKENS
+
+    visit(contents)
+    if image_output:
+        total += IMAGE_OUTPUT_TOKENS
+    return max(total, 1)
+
+
+# ---------------------------------------------------------------------------
+# Shared limiters
+# ---------------------------------------------------------------------------
+
+_limiters = {}
+_lock = threading.Lock()
+_usage = None
+
+
+def _get_usage() -> DailyUsage:
+    global _usage
+    if _usage is None:
+        _usage = DailyUsage(get_cache_dir() / USAGE_FILE)
+        atexit.register(_usage.save)
+    return _usage
+
+
+def get_limiter(model: str) -> ModelLimiter:
+    """Return the process-wide limiter for *model*."""
+    with _lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            quota = dict(DEFAULT_QUOTA)
+            quota.update(MODEL_QUOTAS.get(model, {}))
+            quota.update(_load_overrides().get(model, {}))
+            # RPD is shared through the usage file; RPM/TPM are split between parallel processes
+            limiter = ModelLimiter(model, quota["rpm"] * QUOTA_SHARE, quota["tpm"] * QUOTA_SHARE,
+                                   quota["rpd"], _get_usage())
+            _limiters[model] = limiter
+        return limiter
@@ -0,0 +1,101 @@
+"""
+Bounded-queue, thread-per-worker pipeline for the image scripts.
+
+A pipeline is a list of stages. Each stage has a function, a number of
+worker threads and an input queue of limited size; items flow from stage to
+stage as soon as they are ready, so reading the next image, analyzing
+another and extracting garments of a third all overlap. When a stage falls
+behind, its full queue blocks the stage before it (back-pressure), so at
+most a few images are held in memory at once.
+
+A stage function returns:
+    None          - the item is dropped (skipped or failed)
+    a list        - each element goes to the next stage (fan-out)
+    anything else - passed on as a single item
+
+Exceptions in a stage function are printed and drop the item; the rest of
+the pipeline keeps running. Rate limits are not handled here - the shared
+GeminiPool bounds concurrent requests per model.
+
+Usage:
+    from staged_pipeline import Stage, run_pipeline
+
+    run_pipeline(images, [
+        Stage("read", read_image, workers=2),
+        Stage("analyze", analyze_image, workers=4),
+        Stage("extract", extract_garment, workers=8),   # may return a list
+        Stage("write", write_result, workers=1),
+    ])
+"""
+
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+    queue_size: int = 0   # 0 = twice the worker count
+
+    @classmethod
+    def from_env(cls, name: str, fn: Callable, env_var: str, default: int) -> "Stage":
+        """Stage whose worker count can be overridden by *env_var*."""
+        return cls(name, fn, workers=max(1, int(os.getenv(env_var, str(default)))))
+
+
+def run_pipeline(items: Iterable, stages: List[Stage]) -> int:
+    """Push *items* through *stages*; returns how many left the last stage."""
+    queues = [queue.Queue(maxsize=s.queue_size or 2 * s.workers) for s in stages]
+    finished = [0]
+    finished_lock = threading.Lock()
+
+    def worker(index: int):
+        stage = stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                print(f"  ✗ [{stage.name}] {e}")
+                continue
+            if result is None:
+                continue
+            outputs = result if isinstance(result, list) else [result]
+            if outbox is None:
+                with finished_lock:
+                    finished[0] += len(outputs)
+                continue
+            for output in outputs:
+                outbox.put(output)
+
+    threads = []
+    for index, stage in enumerate(stages):
+        threads.append([
+            threading.Thread(target=worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+            for n in range(stage.workers)
+        ])
+        for thread in threads[-1]:
+            thread.start()
+
+    for item in items:
+        queues[0].put(item)
+
+    # Shut stages down in order: once every worker of a stage has exited,
+    # nothing more can reach the next one
+    for index, stage in enumerate(stages):
+        for _ in range(stage.workers):
+            queues[index].put(_DONE)
+        for thread in threads[index]:
+            thread.join()
+    return finished[0]